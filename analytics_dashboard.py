@@ -1,33 +1,75 @@
-import pandas as pd
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from flask import Flask, request, redirect, url_for
-from collections import Counter
-from db_utils import AccessLogDB
-from geo_utils import GeoIPLookup
-from visualization import to_plotly_figure
-from filters import filter_content_paths, filter_referrers, apply_date_filter
+from db_utils import AccessLogStats, timestamp_bounds
+from resident_frame import RESIDENT_DAYS, ResidentFrame
+from result_cache import ResultCache
+from visualization import plotly_bundle, to_plotly_figure
 from utils import get_date_params, render_dashboard
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
-geoip = GeoIPLookup("./geo/GeoLite2-City.mmdb")
+# Berechnete Widgets je Tab und Datumsbereich (siehe ``cached_view``)
+RESULT_CACHE = ResultCache()
+# Optional: die letzten ``RESIDENT_DAYS`` Tage als DataFrame im Speicher
+RESIDENT = ResidentFrame(RESIDENT_DAYS) if RESIDENT_DAYS > 0 else None
+# Threads für die Widgets eines Tabs; jeder Thread liest über seine eigene
+# Verbindung aus ``READ_CONNECTIONS``
+WIDGET_POOL = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("DASHBOARD_WORKERS", 4)),
+    thread_name_prefix="widget",
+)
 
 
 # --- Hilfsfunktion (zentral, überall identisch) ---
-def get_df_filtered():
+def get_stats():
     from_date, to_date = get_date_params()
-    df_all = AccessLogDB.load_access_logs()
-    df_all = apply_date_filter(df_all, from_date, to_date)
-    # Flags sauber casten
-    if "is_bot" in df_all:
-        df_all["is_bot"] = df_all["is_bot"].astype(int)
-    if "is_content" in df_all:
-        df_all["is_content"] = df_all["is_content"].astype(int)
-    if "is_admin_tech" in df_all:
-        df_all["is_admin_tech"] = df_all["is_admin_tech"].fillna(0)
-        df_all["is_admin_tech"] = df_all["is_admin_tech"].astype(int)
+    stats = RESIDENT.stats(from_date, to_date) if RESIDENT else None
+    if stats is None:
+        stats = AccessLogStats(from_date, to_date)
     params = dict(request.args)
     filter_from = from_date
     filter_to = to_date
-    return df_all, params, filter_from, filter_to
+    return stats, params, filter_from, filter_to
+
+
+def cached_view(route, stats, compute, generation=None):
+    """Ergebnis von ``compute(stats)`` aus dem Cache bzw. neu berechnet.
+
+    Schlüssel sind Route, Datenbank und die normalisierten Datumsgrenzen;
+    ein Import erhöht die Daten-Generation und verwirft alle Einträge.
+    """
+    bounds = timestamp_bounds(stats.from_date, stats.to_date)
+    key = (route, str(stats.db_file), *bounds)
+    if generation is None:
+        generation = stats.data_generation()
+    return RESULT_CACHE.get_or_compute(key, generation, lambda: compute(stats))
+
+
+def peak(rows, value="hits"):
+    """Zeile mit dem höchsten Wert (bei Gleichstand die erste)."""
+    return max(rows, key=lambda r: r[value]) if rows else None
+
+
+def chart_widget(rows, key, xlabel, ylabel, title, kind="bar", empty="Keine Daten."):
+    """Widget mit den Zeilen und dem fertigen Chart-Snippet."""
+    if not rows:
+        return {"rows": rows, "chart": f"<i>{empty}</i>"}
+    chart = to_plotly_figure(
+        [r[key] for r in rows], [r["hits"] for r in rows], xlabel, ylabel, title, kind
+    )
+    return {"rows": rows, "chart": chart}
+
+
+def render_tab(template, tab):
+    """Seite eines Tabs ohne Daten; die Widgets lädt der Browser parallel nach."""
+    from_date, to_date = get_date_params()
+    return render_dashboard(template, tab, dict(request.args), from_date, to_date)
 
 
 # --- Default-Route: Redirect auf /overview ---
@@ -39,234 +81,117 @@ def root():
 # --- Übersicht ---
 @app.route("/overview")
 def overview():
-    df_all, params, filter_from, filter_to = get_df_filtered()
-    real_users = df_all[
-        (df_all["is_bot"] == 0) & (df_all["is_admin_tech"] == 0)
-    ]
-    content = real_users[
-        (real_users["method"] == "GET") & (real_users["is_content"] == 1)
-    ].copy()
-    content = filter_content_paths(content)
-    unique_users = content["ip"].nunique() if not content.empty else 0
-
-    overview = {
-        "total": len(df_all),
-        "real_users": len(content),
-        "unique_users": unique_users,
-        "bots": len(df_all[(df_all["is_bot"] == 1)]),
-        "errors": int(
-            df_all["status"].astype(str).str.startswith(("4", "5")).sum()
-        ),
+    return render_tab("overview.html", "overview")
+
+
+def overview_kpis(stats):
+    values = stats.kpis()
+    values["unique_users"] = stats.distinct("ip", "content")
+    return {"values": values}
+
+
+def overview_hourly(stats):
+    htable = stats.counts(["hour"], "content", order="key")
+    widget = chart_widget(htable, "hour", "Stunde", "Zugriffe", "Traffic pro Stunde")
+    top = peak(htable)
+    widget["values"] = {
+        "peak_hour": int(top["hour"]) if top else "-",
+        "peak_count": int(top["hits"]) if top else 0,
     }
+    return widget
 
-    geo_counts = Counter()
-    for ip in content["ip"]:
-        country, city = geoip.country_city(ip)
-        geo_counts[(country, city)] += 1
-
-    top_content_geo = [
-        {"country": k[0], "city": k[1], "hits": v}
-        for k, v in geo_counts.most_common(10)
-    ]
-
-    if not content.empty:
-        content["hour"] = pd.to_datetime(content["timestamp"]).dt.hour
-        htable = content.groupby("hour").size().reset_index(name="count")
-        peak_idx = htable["count"].idxmax()
-        overview["peak_hour"] = int(htable.iloc[peak_idx]["hour"])
-        overview["peak_count"] = int(htable.iloc[peak_idx]["count"])
-        hourly_chart = to_plotly_figure(
-            htable["hour"],
-            htable["count"],
-            "Stunde",
-            "Zugriffe",
-            "Traffic pro Stunde",
-        )
-    else:
-        overview["peak_hour"] = "-"
-        overview["peak_count"] = 0
-        hourly_chart = "<i>Keine Daten.</i>"
-
-    top_pages = (
-        content.groupby("path")
-        .size()
-        .reset_index(name="hits")
-        .sort_values("hits", ascending=False)
-        .head(10)
-        .to_dict("records")
-    )
-    ref = content[content["referrer"] != "-"]
-    ref = filter_referrers(ref)
-    top_referrers = (
-        ref.groupby("referrer")
-        .size()
-        .reset_index(name="hits")
-        .sort_values("hits", ascending=False)
-        .head(10)
-        .to_dict("records")
-    )
-    bots = df_all[(df_all["is_bot"] == 1)]
-    top_bots = (
-        bots.groupby("user_agent")
-        .size()
-        .reset_index(name="hits")
-        .sort_values("hits", ascending=False)
-        .head(10)
-        .to_dict("records")
-    )
 
-    return render_dashboard(
-        "overview.html",
-        "overview",
-        params,
-        filter_from,
-        filter_to,
-        overview=overview,
-        hourly_chart=hourly_chart,
-        top_pages=top_pages,
-        top_referrers=top_referrers,
-        top_bots=top_bots,
-        top_content_geo=top_content_geo,
-    )
+def overview_geo(stats):
+    # Land und Stadt stehen seit dem Import in ``dim_ip`` (``update_ip_geo``)
+    return {"rows": stats.counts(["country", "city"], "content", limit=10)}
+
+
+def overview_top_pages(stats):
+    return {"rows": stats.counts(["path"], "content", limit=10)}
+
+
+def overview_top_referrers(stats):
+    return {"rows": stats.counts(["referrer_host"], "referrers", limit=10)}
+
+
+def overview_top_bots(stats):
+    return {"rows": stats.counts(["user_agent"], "bots", limit=10)}
 
 
 # --- Errors ---
 @app.route("/errors")
 def errors():
-    df_all, params, filter_from, filter_to = get_df_filtered()
-    errors = df_all[df_all["status"].astype(str).str.startswith(("4", "5"))]
-    err_detail = (
-        errors.groupby(["status", "path"])
-        .size()
-        .reset_index(name="hits")
-        .sort_values("hits", ascending=False)
-        .head(20)
-        .to_dict("records")
-    )
-    err_chart_df = errors.groupby("status").size().reset_index(name="count")
-    err_chart = to_plotly_figure(
-        err_chart_df["status"],
-        err_chart_df["count"],
-        "Fehlercode",
-        "Häufigkeit",
-        "Fehlercodes",
-        "pie",
-    )
-    top_error_ips_df = errors.groupby("ip").size().reset_index(name="hits")
-    top_error_ips_df = top_error_ips_df.sort_values(
-        "hits", ascending=False
-    ).head(10)
-    top_error_ips = [
-        {
-            "ip": row["ip"],
-            "country": geoip.country_city(row["ip"])[0],
-            "hits": row["hits"],
-        }
-        for _, row in top_error_ips_df.iterrows()
-    ]
-
-    return render_dashboard(
-        "errors.html",
-        "errors",
-        params,
-        filter_from,
-        filter_to,
-        err_detail=err_detail,
-        err_chart=err_chart,
-        top_error_ips=top_error_ips,
-    )
+    return render_tab("errors.html", "errors")
+
+
+def errors_chart(stats):
+    rows = stats.counts(["status"], "errors", order="key")
+    return chart_widget(rows, "status", "Fehlercode", "Häufigkeit", "Fehlercodes", "pie")
+
+
+def errors_detail(stats):
+    return {"rows": stats.counts(["status", "path"], "errors", limit=20)}
+
+
+def errors_ips(stats):
+    return {"rows": stats.counts(["ip", "country"], "errors", limit=10)}
 
 
 # --- Bots ---
 @app.route("/bots")
 def bots():
-    df_all, params, filter_from, filter_to = get_df_filtered()
-    bots = df_all[df_all["is_bot"] == 1].copy()
-    bot_counts = (
-        bots.groupby("user_agent")
-        .size()
-        .reset_index(name="hits")
-        .sort_values("hits", ascending=False)
-        .head(15)
-        .to_dict("records")
-    )
-    bot_pages = (
-        bots.groupby("path")
-        .size()
-        .reset_index(name="hits")
-        .sort_values("hits", ascending=False)
-        .head(15)
-        .to_dict("records")
-    )
-    if not bots.empty:
-        bots["date"] = pd.to_datetime(bots["timestamp"]).dt.date
-        date_counts = bots.groupby("date").size().reset_index(name="count")
-        bots_chart = to_plotly_figure(
-            date_counts["date"],
-            date_counts["count"],
-            "Datum",
-            "Bot-Zugriffe",
-            "Bot-Traffic im Verlauf",
-        )
-    else:
-        bots_chart = "<i>Keine Bot-Daten.</i>"
-    return render_dashboard(
-        "bots.html",
-        "bots",
-        params,
-        filter_from,
-        filter_to,
-        bots_chart=bots_chart,
-        bot_counts=bot_counts,
-        bot_pages=bot_pages,
+    return render_tab("bots.html", "bots")
+
+
+def bots_chart(stats):
+    rows = stats.counts(["date"], "bots", order="key")
+    return chart_widget(
+        rows, "date", "Datum", "Bot-Zugriffe", "Bot-Traffic im Verlauf",
+        empty="Keine Bot-Daten.",
     )
 
 
+def bots_agents(stats):
+    return {"rows": stats.counts(["user_agent"], "bots", limit=15)}
+
+
+def bots_pages(stats):
+    return {"rows": stats.counts(["path"], "bots", limit=15)}
+
+
 # --- Insights ---
+WEEKDAYS = ["Mo", "Di", "Mi", "Do", "Fr", "Sa", "So"]
+
+
 @app.route("/insights")
 def insights():
-    df_all, params, filter_from, filter_to = get_df_filtered()
-    real_users = df_all[(df_all["is_bot"] == 0)]
-    content = real_users[
-        (real_users["method"] == "GET") & (real_users["is_content"] == 1)
-    ].copy()
-    content = filter_content_paths(content)
-
-    top_articles = (
-        content.groupby("path")
-        .size()
-        .reset_index(name="hits")
-        .sort_values("hits", ascending=False)
-        .head(5)
-        .to_dict("records")
+    return render_tab("insights.html", "insights")
+
+
+def weekday_table(stats):
+    """Zugriffe je Wochentag (Mo bis So), leer ohne Daten."""
+    rows = stats.counts(["weekday"], "content", order="key")
+    if not rows:
+        return []
+    wtable = [0] * 7
+    for row in rows:
+        wtable[int(row["weekday"])] = row["hits"]
+    return [{"weekday": day, "hits": hits} for day, hits in zip(WEEKDAYS, wtable)]
+
+
+def insights_weekdays(stats):
+    return chart_widget(
+        weekday_table(stats), "weekday", "Wochentag", "Zugriffe",
+        "Traffic nach Wochentag",
     )
 
-    if not content.empty:
-        content["weekday"] = pd.to_datetime(content["timestamp"]).dt.dayofweek
-        weekday_map = ["Mo", "Di", "Mi", "Do", "Fr", "Sa", "So"]
-        wtable = (
-            content.groupby("weekday").size().reindex(range(7), fill_value=0)
-        )
-        best_weekday_idx = wtable.idxmax()
-        best_weekday = weekday_map[best_weekday_idx]
-        weekday_chart = to_plotly_figure(
-            [weekday_map[d] for d in range(7)],
-            wtable.values,
-            "Wochentag",
-            "Zugriffe",
-            "Traffic nach Wochentag",
-        )
-    else:
-        best_weekday = "-"
-        weekday_chart = "<i>Keine Daten.</i>"
-
-    if not content.empty:
-        content["hour"] = pd.to_datetime(content["timestamp"]).dt.hour
-        htable = content.groupby("hour").size().reset_index(name="count")
-        peak_hour_idx = htable["count"].idxmax()
-        best_hour = int(htable.iloc[peak_hour_idx]["hour"])
-    else:
-        best_hour = "-"
+
+def insights_recommendations(stats):
+    top_articles = stats.counts(["path"], "content", limit=5)
+    weekdays = weekday_table(stats)
+    best_weekday = peak(weekdays)["weekday"] if weekdays else "-"
+    htable = stats.counts(["hour"], "content", order="key")
+    best_hour = int(peak(htable)["hour"]) if htable else "-"
 
     recommendations = []
     if best_hour != "-":
@@ -283,102 +208,160 @@ def insights():
             art_html += f"<li>{row['path']} <span class='text-secondary'>({row['hits']} Aufrufe)</span></li>"
         art_html += "</ol>"
         recommendations.append(art_html)
-
-    return render_dashboard(
-        "insights.html",
-        "insights",
-        params,
-        filter_from,
-        filter_to,
-        recommendations=recommendations,
-        weekday_chart=weekday_chart,
-    )
+    return {"items": recommendations}
 
 
 # --- UTM ---
 @app.route("/utm")
 def utm():
-    df_all, params, filter_from, filter_to = get_df_filtered()
-    real_users = df_all[df_all["is_bot"] == 0]
-    content = real_users[
-        (real_users["method"] == "GET") & (real_users["is_content"] == 1)
-    ].copy()
-    content = filter_content_paths(content)
-    utm = content[
-        content["utm_source"].notnull()
-        | content["utm_medium"].notnull()
-        | content["utm_campaign"].notnull()
-    ].copy()
-    utm = utm[
-        ~(
-            (utm["utm_source"].isnull())
-            & (utm["utm_medium"].isnull())
-            & (utm["utm_campaign"].isnull())
-        )
-    ]
-    utm["combo"] = (
-        utm["utm_source"].fillna("–")
-        + " | "
-        + utm["utm_medium"].fillna("–")
-        + " | "
-        + utm["utm_campaign"].fillna("–")
-    )
-    top_combos = (
-        utm.groupby("combo")
-        .size()
-        .reset_index(name="hits")
-        .sort_values("hits", ascending=False)
-        .head(15)
-        .to_dict("records")
-    )
-    if not utm.empty:
-        utm["date"] = pd.to_datetime(utm["timestamp"]).dt.date
-        date_chart_df = utm.groupby(["date"]).size().reset_index(name="hits")
-        utm_chart = to_plotly_figure(
-            date_chart_df["date"],
-            date_chart_df["hits"],
-            "Tag",
-            "UTM-Zugriffe",
-            "UTM-Traffic im Zeitverlauf",
+    return render_tab("utm.html", "utm")
+
+
+def utm_chart(stats):
+    rows = stats.counts(["date"], "utm", order="key")
+    return chart_widget(rows, "date", "Tag", "UTM-Zugriffe", "UTM-Traffic im Zeitverlauf")
+
+
+def utm_combos(stats):
+    return {"rows": stats.counts(["combo"], "utm", limit=15)}
+
+
+def utm_sources(stats):
+    return {"rows": stats.counts(["utm_source"], "utm", limit=10, skip_null=True)}
+
+
+def utm_mediums(stats):
+    return {"rows": stats.counts(["utm_medium"], "utm", limit=10, skip_null=True)}
+
+
+def utm_campaigns(stats):
+    return {"rows": stats.counts(["utm_campaign"], "utm", limit=10, skip_null=True)}
+
+
+# Widgets je Tab; jedes liefert ein JSON-fähiges Dict mit ``values``
+# (Kennzahlen), ``rows`` (Tabelle), ``chart`` (Snippet) und/oder ``items``.
+WIDGETS = {
+    "overview": {
+        "kpis": overview_kpis,
+        "hourly": overview_hourly,
+        "geo": overview_geo,
+        "top_pages": overview_top_pages,
+        "top_referrers": overview_top_referrers,
+        "top_bots": overview_top_bots,
+    },
+    "errors": {
+        "chart": errors_chart,
+        "detail": errors_detail,
+        "ips": errors_ips,
+    },
+    "bots": {
+        "chart": bots_chart,
+        "agents": bots_agents,
+        "pages": bots_pages,
+    },
+    "insights": {
+        "weekdays": insights_weekdays,
+        "recommendations": insights_recommendations,
+    },
+    "utm": {
+        "chart": utm_chart,
+        "combos": utm_combos,
+        "sources": utm_sources,
+        "mediums": utm_mediums,
+        "campaigns": utm_campaigns,
+    },
+}
+
+
+def widget_etag(generation, stats):
+    """ETag aus Daten-Generation und aufgelöstem Zeitraum.
+
+    Der Zeitraum gehört dazu, weil Presets wie ``yesterday`` unter
+    derselben URL jeden Tag andere Daten meinen.
+    """
+    bounds = repr(timestamp_bounds(stats.from_date, stats.to_date))
+    digest = hashlib.sha1(bounds.encode("utf-8")).hexdigest()[:12]
+    return f'"{generation}-{digest}"'
+
+
+def etag_matches(etag, header):
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def compute_widget(tab, name, stats, generation):
+    """Ein Widget aus dem Cache bzw. neu berechnet, mit Zeitmessung im Log."""
+    started = time.perf_counter()
+    try:
+        return cached_view(f"{tab}/{name}", stats, WIDGETS[tab][name], generation)
+    finally:
+        logger.info(
+            f"Widget {tab}/{name}: {(time.perf_counter() - started) * 1000:.1f} ms"
         )
-    else:
-        utm_chart = "<i>Keine Daten.</i>"
-    top_sources = (
-        utm.groupby("utm_source")
-        .size()
-        .reset_index(name="hits")
-        .sort_values("hits", ascending=False)
-        .head(10)
-        .to_dict("records")
-    )
-    top_mediums = (
-        utm.groupby("utm_medium")
-        .size()
-        .reset_index(name="hits")
-        .sort_values("hits", ascending=False)
-        .head(10)
-        .to_dict("records")
-    )
-    top_campaigns = (
-        utm.groupby("utm_campaign")
-        .size()
-        .reset_index(name="hits")
-        .sort_values("hits", ascending=False)
-        .head(10)
-        .to_dict("records")
-    )
-    return render_dashboard(
-        "utm.html",
-        "utm",
-        params,
-        filter_from,
-        filter_to,
-        top_combos=top_combos,
-        utm_chart=utm_chart,
-        top_sources=top_sources,
-        top_mediums=top_mediums,
-        top_campaigns=top_campaigns,
-    )
+
+
+def compute_widgets(tab, stats, generation):
+    """Alle Widgets eines Tabs parallel auf ``WIDGET_POOL``.
+
+    Die Widgets sind voneinander unabhängig; der Tab ist damit etwa so
+    schnell wie sein langsamstes Widget.
+    """
+    started = time.perf_counter()
+    futures = {
+        name: WIDGET_POOL.submit(compute_widget, tab, name, stats, generation)
+        for name in WIDGETS[tab]
+    }
+    result = {name: future.result() for name, future in futures.items()}
+    logger.info(f"Tab {tab}: {(time.perf_counter() - started) * 1000:.1f} ms")
+    return result
+
+
+def api_response(compute):
+    """JSON-Antwort für den aktuellen Zeitraum mit ETag und 304-Behandlung."""
+    stats = get_stats()[0]
+    generation = stats.data_generation()
+    etag = widget_etag(generation, stats)
+    # Browser und Proxies dürfen speichern, fragen aber per ETag nach
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(etag, request.headers.get("If-None-Match")):
+        return "", 304, headers
+    return compute(stats, generation), 200, headers
+
+
+# --- JSON-API der Widgets ---
+@app.route("/api/<tab>/<widget>")
+def widget_api(tab, widget):
+    if widget not in WIDGETS.get(tab, {}):
+        return {"error": f"Unbekanntes Widget: {tab}/{widget}"}, 404
+    return api_response(lambda stats, gen: compute_widget(tab, widget, stats, gen))
+
+
+@app.route("/api/<tab>")
+def tab_api(tab):
+    if tab not in WIDGETS:
+        return {"error": f"Unbekannter Tab: {tab}"}, 404
+    return api_response(lambda stats, gen: compute_widgets(tab, stats, gen))
+
+
+# --- plotly.js (einmal pro Version, dauerhaft cachebar) ---
+@app.route("/assets/plotly-<version>.min.js")
+def plotly_js(version):
+    body, digest = plotly_bundle()
+    if version != digest:
+        return "Not Found", 404
+    return body, 200, {
+        "Content-Type": "application/javascript; charset=utf-8",
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{digest}"',
+    }
+
+
+# --- Cache-Statistik ---
+@app.route("/cache-stats")
+def cache_stats():
+    return RESULT_CACHE.stats()
 
 
 if __name__ == "__main__":
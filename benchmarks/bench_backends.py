@@ -0,0 +1,111 @@
+"""Benchmark: Dashboard-Abfragen über SQLite und DuckDB auf dem Parquet-Archiv.
+
+Erzeugt eine Datenbank mit Zeilen über zwölf Monate, exportiert sie als
+Parquet und führt die Aggregationen der Dashboard-Routen für den gesamten
+Zeitraum auf beiden Backends aus. Die Ergebnisse müssen identisch sein.
+Benötigt ``pyarrow`` und ``duckdb``.
+
+Aufruf: ``python benchmarks/bench_backends.py [anzahl_zeilen]``
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import parquet_store  # noqa: E402
+from db_utils import AccessLogDB, AccessLogStats  # noqa: E402
+
+# Aggregationen der Routen in ``analytics_dashboard.py``
+ROUTE_QUERIES = {
+    "kpis": lambda s: s.kpis(),
+    "unique_users": lambda s: s.distinct("ip", "content"),
+    "geo_ips": lambda s: s.counts(["ip"], "content"),
+    "hours": lambda s: s.counts(["hour"], "content", order="key"),
+    "top_pages": lambda s: s.counts(["path"], "content", limit=10),
+    "top_referrers": lambda s: s.counts(["referrer_host"], "referrers", limit=10),
+    "top_bots": lambda s: s.counts(["user_agent"], "bots", limit=15),
+    "bot_pages": lambda s: s.counts(["path"], "bots", limit=15),
+    "bot_dates": lambda s: s.counts(["date"], "bots", order="key"),
+    "errors": lambda s: s.counts(["status", "path"], "errors", limit=20),
+    "error_ips": lambda s: s.counts(["ip"], "errors", limit=10),
+    "weekdays": lambda s: s.counts(["weekday"], "content", order="key"),
+    "utm_combos": lambda s: s.counts(["combo"], "utm", limit=15),
+    "utm_sources": lambda s: s.counts(["utm_source"], "utm", limit=10, skip_null=True),
+}
+
+
+def sample_batch(start, size):
+    referrers = ["-", "https://www.google.com/", "https://news.example/?utm_source=nl"]
+    return [
+        (
+            f"2023-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:"
+            f"{(i * 7) % 60:02d}",
+            f"10.{i % 250}.{(i // 250) % 250}.{i % 13}",
+            "GET",
+            f"/blog/post-{i % 500}.html" if i % 17 else "/wp-login.php",
+            f"page={i}",
+            404 if i % 23 == 0 else 200,
+            str(1000 + i % 5000),
+            referrers[i % 3],
+            "Googlebot/2.1" if i % 5 == 0 else f"Mozilla/5.0 ({i % 40})",
+            i % 5 == 0,
+            i % 17 == 0,
+            i % 17 != 0,
+            "nl" if i % 3 == 2 else None,
+            None,
+            None,
+        )
+        for i in range(start, start + size)
+    ]
+
+
+def measure(stats, repeat=3):
+    timings, results = {}, {}
+    for name, run in ROUTE_QUERIES.items():
+        started = time.perf_counter()
+        for _ in range(repeat):
+            results[name] = run(stats)
+        timings[name] = (time.perf_counter() - started) / repeat
+    return timings, results
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "bench.db")
+        parquet_dir = os.path.join(tmp, "parquet")
+        with AccessLogDB(db_file) as db:
+            db.init_db(force_reload=True)
+            with db.bulk_load(staged=True):
+                for start in range(0, rows, 10000):
+                    db.insert_logs(sample_batch(start, min(10000, rows - start)))
+                db.merge_staging()
+        started = time.perf_counter()
+        days = parquet_store.changed_days(db_file, 0)
+        parquet_store.export_days(db_file, days, parquet_dir)
+        print(f"Export: {len(days)} Tage in {time.perf_counter() - started:.1f} s")
+
+        sqlite, expected = measure(
+            AccessLogStats(db_file=db_file, use_rollups=False, backend="sqlite")
+        )
+        duck, actual = measure(
+            AccessLogStats(db_file=db_file, backend="duckdb", parquet_dir=parquet_dir)
+        )
+    for name in ROUTE_QUERIES:
+        assert actual[name] == expected[name], name
+        print(
+            f"{name:<14} sqlite {sqlite[name] * 1000:>8.1f} ms, "
+            f"duckdb {duck[name] * 1000:>8.1f} ms "
+            f"({sqlite[name] / duck[name]:.1f}x)"
+        )
+    print(
+        f"gesamt         sqlite {sum(sqlite.values()) * 1000:>8.1f} ms, "
+        f"duckdb {sum(duck.values()) * 1000:>8.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Benchmark: Insert-Durchsatz je Block und Dateigröße bei wachsender Tabelle.
+
+Vergleicht den früheren Import (``COUNT`` vor und nach jedem Block), den
+direkten Import mit ``total_changes`` und den gestagten Massenimport.
+
+Aufruf: ``python benchmarks/bench_insert.py [anzahl_blöcke] [blockgröße]``
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from db_utils import AccessLogDB  # noqa: E402
+
+
+def sample_batch(start, size):
+    return [
+        (
+            f"2024-03-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:{(i * 7) % 60:02d}",
+            f"10.{i % 250}.{(i // 250) % 250}.{i % 13}",
+            "GET",
+            f"/blog/post-{i % 500}.html",
+            f"page={i}",
+            200,
+            str(1000 + i % 5000),
+            "-",
+            f"Mozilla/5.0 ({i % 40})",
+            False,
+            False,
+            True,
+            None,
+            None,
+            None,
+        )
+        for i in range(start, start + size)
+    ]
+
+
+def legacy_insert(db, records):
+    before = db._cur.execute("SELECT COUNT(id) FROM access_log").fetchone()[0]
+    db.insert_logs(records)
+    return db._cur.execute("SELECT COUNT(id) FROM access_log").fetchone()[0] - before
+
+
+def run(label, batches, size, insert, staged=None):
+    with tempfile.TemporaryDirectory() as tmp, AccessLogDB(
+        os.path.join(tmp, "bench.db")
+    ) as db:
+        db_file = db.db_file
+        db.init_db(force_reload=True)
+        rates = []
+        started = time.perf_counter()
+
+        def load():
+            for n in range(batches):
+                t = time.perf_counter()
+                insert(db, sample_batch(n * size, size))
+                rates.append(size / (time.perf_counter() - t))
+
+        if staged is None:
+            load()
+        else:
+            with db.bulk_load(staged=staged):
+                load()
+                if staged:
+                    db.merge_staging()
+        total = batches * size / (time.perf_counter() - started)
+        db._cur.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        megabytes = os.path.getsize(db_file) / 2**20
+    print(
+        f"{label:<12} erster Block {rates[0]:>9.0f}, letzter Block "
+        f"{rates[-1]:>9.0f}, gesamt {total:>9.0f} Zeilen/s, {megabytes:.1f} MB"
+    )
+
+
+def main():
+    batches = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    run("COUNT", batches, size, legacy_insert)
+    run("changes", batches, size, AccessLogDB.insert_logs, staged=False)
+    run("staged", batches, size, AccessLogDB.insert_logs, staged=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Micro-Benchmark: Zeilen pro Sekunde mit altem und neuem Feld-Dekoder.
+
+Aufruf: ``python benchmarks/bench_log_decoder.py [anzahl_zeilen]``
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import logfile_etl  # noqa: E402
+from log_decoder import extract_utm  # noqa: E402
+
+
+def legacy_extract_utm(referrer):
+    utm_source = utm_medium = utm_campaign = None
+    if referrer and referrer != "-":
+        params = parse_qs(urlparse(referrer).query)
+        utm_source = params.get("utm_source", [None])[0]
+        utm_medium = params.get("utm_medium", [None])[0]
+        utm_campaign = params.get("utm_campaign", [None])[0]
+    return utm_source, utm_medium, utm_campaign
+
+
+def legacy_parse_line(line):
+    """Bisheriger Parser mit ``strptime`` und doppeltem ``urlparse``."""
+    m = logfile_etl.LOG_PATTERN.match(line)
+    if not m:
+        return None
+    d = m.groupdict()
+    ts = datetime.strptime(d["time"].split()[0], "%d/%b/%Y:%H:%M:%S")
+    path = urlparse(d["url"]).path
+    query = urlparse(d["url"]).query
+    admin = logfile_etl.is_admin_tech(path)
+    return [
+        ts.isoformat(), d["ip"], d["method"], path, query, d["status"],
+        d["size"], d["referrer"], d["user_agent"],
+        logfile_etl.is_bot(d["user_agent"]), admin, not admin,
+        *legacy_extract_utm(d["referrer"]),
+    ]
+
+
+def sample_lines(count):
+    referrers = [
+        "-",
+        "https://www.google.com/",
+        "https://news.example/?utm_source=newsletter&utm_medium=mail&utm_campaign=july",
+    ]
+    agents = [
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+        "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    ]
+    return [
+        f'10.0.{i % 250}.{i % 13} - - [{1 + i % 28:02d}/Mar/2024:{i % 24:02d}:'
+        f'{i % 60:02d}:{(i * 7) % 60:02d} +0100] "GET /blog/post-{i % 500}.html'
+        f'?page={i % 3} HTTP/1.1" 200 {1000 + i} example.com "{referrers[i % 3]}"'
+        f' "{agents[i % 2]}" "-"'
+        for i in range(count)
+    ]
+
+
+def measure(parse, lines):
+    started = time.perf_counter()
+    for line in lines:
+        parse(line)
+    return len(lines) / (time.perf_counter() - started)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    lines = sample_lines(count)
+    assert all(
+        legacy_parse_line(line) == logfile_etl.parse_line(line)[:15]
+        for line in lines[:1000]
+    )
+    before = measure(legacy_parse_line, lines)
+    extract_utm.cache_clear()
+    after = measure(logfile_etl.parse_line, lines)
+    print(f"vorher:  {before:>10.0f} Zeilen/s")
+    print(f"nachher: {after:>10.0f} Zeilen/s ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
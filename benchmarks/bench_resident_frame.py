@@ -0,0 +1,97 @@
+"""Benchmark: Dashboard-Abfragen aus dem Resident-Frame gegen SQLite.
+
+Erzeugt Zeilen für die letzten Tage, lädt sie in einen ``ResidentFrame``
+und führt die Aggregationen der Dashboard-Routen für ein Fenster innerhalb
+des Frames auf beiden Wegen aus; die Ergebnisse müssen identisch sein.
+Danach wird ein weiterer Import simuliert und nur nachgeladen.
+
+Aufruf: ``python benchmarks/bench_resident_frame.py [anzahl_zeilen] [tage]``
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_backends import ROUTE_QUERIES, measure, sample_batch  # noqa: E402
+from db_utils import AccessLogDB, AccessLogStats  # noqa: E402
+from resident_frame import ResidentFrame  # noqa: E402
+
+
+def recent_batch(start, size, days):
+    """``sample_batch`` mit Zeitstempeln über die letzten ``days`` Tage."""
+    first = datetime.combine(date.today() - timedelta(days=days - 1), datetime.min.time())
+    span = days * 86400
+    return [
+        ((first + timedelta(seconds=(i * 7919) % span)).isoformat(),) + row[1:]
+        for i, row in zip(range(start, start + size), sample_batch(start, size))
+    ]
+
+
+def load(db_file, start, rows, days):
+    with AccessLogDB(db_file) as db:
+        with db.bulk_load(staged=True):
+            for offset in range(start, start + rows, 10000):
+                size = min(10000, start + rows - offset)
+                db.insert_logs(recent_batch(offset, size, days))
+            db.merge_staging()
+        db.bump_generation()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    from_date = (date.today() - timedelta(days=days - 1)).isoformat()
+    to_date = date.today().isoformat()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "bench.db")
+        with AccessLogDB(db_file) as db:
+            db.init_db(force_reload=True)
+        load(db_file, 0, rows, days)
+
+        frame = ResidentFrame(days, db_file=db_file)
+        started = time.perf_counter()
+        stats = frame.stats(from_date, to_date)
+        print(
+            f"Laden: {len(frame.df)} Zeilen in {time.perf_counter() - started:.2f} s,"
+            f" {frame.df.memory_usage(deep=True).sum() / 2**20:.1f} MB"
+        )
+
+        sqlite, expected = measure(
+            AccessLogStats(from_date, to_date, db_file=db_file, use_rollups=False)
+        )
+        resident, actual = measure(stats)
+        for name in ROUTE_QUERIES:
+            assert actual[name] == expected[name], name
+            print(
+                f"{name:<14} sqlite {sqlite[name] * 1000:>8.1f} ms, "
+                f"frame {resident[name] * 1000:>8.1f} ms "
+                f"({sqlite[name] / resident[name]:.1f}x)"
+            )
+        print(
+            f"gesamt         sqlite {sum(sqlite.values()) * 1000:>8.1f} ms, "
+            f"frame {sum(resident.values()) * 1000:>8.1f} ms"
+        )
+
+        # weiterer Import: nur die neuen Zeilen werden nachgeladen
+        extra = max(rows // 20, 1)
+        load(db_file, rows, extra, days)
+        started = time.perf_counter()
+        stats = frame.stats(from_date, to_date)
+        print(
+            f"Nachladen: {extra} Zeilen in {time.perf_counter() - started:.2f} s"
+        )
+        _, expected = measure(
+            AccessLogStats(from_date, to_date, db_file=db_file, use_rollups=False), 1
+        )
+        _, actual = measure(stats, 1)
+        assert actual == expected
+        assert len(frame.df) == rows + extra
+
+
+if __name__ == "__main__":
+    main()
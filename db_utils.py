@@ -1,61 +1,487 @@
 """Hilfsfunktionen und Klassen für Datenbankzugriffe."""
 
+import calendar
+import hashlib
 import os
 import sqlite3
-from typing import Iterable, Tuple
+import threading
+import weakref
+from contextlib import closing, contextmanager
+from dataclasses import astuple, dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 
 import pandas as pd
 
+import parquet_store
+from filters import (
+    audience_segment,
+    is_internal_referrer,
+    referrer_host,
+)
 from utils import load_env
 
 load_env()
 
 DB_FILE = os.environ.get("DB_FILE", "accesslog.db")
+DIM_CACHE_SIZE = int(os.environ.get("DIM_CACHE_SIZE", 200000))
+# Lesende Abfragen über SQLite ("sqlite") oder DuckDB auf dem Parquet-Archiv
+# unter ``PARQUET_DIR`` ("duckdb", siehe ``parquet_store``)
+DB_BACKEND = os.environ.get("DB_BACKEND", "sqlite")
+PARQUET_DIR = os.environ.get("PARQUET_DIR", "./parquet")
+# Memory-Map und Seiten-Cache (KiB) der lesenden Verbindungen
+READ_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+READ_CACHE_KIB = int(os.environ.get("SQLITE_CACHE_KIB", 64 * 1024))
+
+
+def timestamp_bounds(
+    from_date: Optional[str], to_date: Optional[str]
+) -> Tuple[Optional[str], Optional[str]]:
+    """Wandelt einen Datumsfilter in ISO-Grenzen ``[von, bis)`` für SQL um.
+
+    Das Enddatum ist inklusiv, daher wird als obere Grenze der Folgetag
+    verwendet.
+    """
+    lower = upper = None
+    if from_date:
+        lower = datetime.fromisoformat(str(from_date)).isoformat()
+    if to_date:
+        upper = (
+            datetime.fromisoformat(str(to_date)) + timedelta(days=1)
+        ).isoformat()
+    return lower, upper
+
+
+@lru_cache(maxsize=4096)
+def _minute_epoch(minute: str) -> int:
+    return calendar.timegm(datetime.fromisoformat(minute).timetuple())
+
+
+def epoch_seconds(value: Optional[str]) -> Optional[int]:
+    """Wandelt einen ISO-Zeitstempel ohne Zeitzone in Epoch-Sekunden um.
+
+    Der Wert wird wie bisher als zeitzonenlose Logzeit behandelt und daher
+    als UTC gerechnet, sodass die Umrechnung in beide Richtungen exakt ist.
+    """
+    if value is None:
+        return None
+    if len(value) == 19 and value[16] == ":":
+        return _minute_epoch(value[:16]) + int(value[17:19])
+    return calendar.timegm(datetime.fromisoformat(value).timetuple())
+
+
+def parse_size(value) -> Optional[int]:
+    """Bytezahl aus dem Log; ``-`` (keine Angabe) wird zu NULL."""
+    if isinstance(value, int) or value is None:
+        return value
+    return int(value) if value.isdigit() else None
+
+
+@lru_cache(maxsize=4096)
+def _day_month(day: int) -> str:
+    return (datetime(1970, 1, 1) + timedelta(days=day)).strftime("%Y-%m")
+
+
+def month_of(epoch: int) -> str:
+    """Monat ``YYYY-MM`` eines Epoch-Zeitstempels (Schlüssel der Partitionen)."""
+    return _day_month(epoch // 86400)
+
+
+def month_bounds(month: str) -> Tuple[str, str]:
+    """ISO-Grenzen ``[Monatsanfang, Folgemonat)`` eines Monats ``YYYY-MM``."""
+    year, mon = int(month[:4]), int(month[5:7])
+    upper = f"{year + mon // 12:04d}-{mon % 12 + 1:02d}-01T00:00:00"
+    return f"{month}-01T00:00:00", upper
+
+
+def months_in_range(
+    months: Iterable[str], lower: Optional[str], upper: Optional[str]
+) -> List[str]:
+    """Die Monate, die sich mit den ISO-Grenzen ``[lower, upper)`` überschneiden."""
+    selected = []
+    for month in months:
+        start, end = month_bounds(month)
+        if (lower is None or end > lower) and (upper is None or start < upper):
+            selected.append(month)
+    return selected
+
+
+def fingerprint(timestamp, ip, method, path, query, user_agent) -> int:
+    """64-Bit-Fingerabdruck des Duplikatschlüssels einer Logzeile.
+
+    Die Felder werden als Text mit Trennzeichen ``\\x1f`` verbunden (NULL
+    als leerer Text) und mit BLAKE2b auf 8 Bytes gehasht. Das Ergebnis ist
+    vorzeichenbehaftet, damit es in SQLites INTEGER passt.
+
+    Kollisionen: Zwei verschiedene Zeilen mit gleichem Fingerabdruck gelten
+    als Duplikat, die spätere wird wie jedes Duplikat übersprungen. Bei
+    50 Mio. Zeilen liegt die Wahrscheinlichkeit, dass das überhaupt einmal
+    passiert, bei etwa 7e-5; das nehmen wir für den kleineren Index in Kauf.
+    """
+    key = "\x1f".join(
+        "" if v is None else str(v)
+        for v in (timestamp, ip, method, path, query, user_agent)
+    )
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class _ThreadConnections:
+    """Verbindungen eines Threads (Pfad -> (Verbindung, Inode))."""
+
+    def __init__(self):
+        self.connections: Dict[str, Tuple[sqlite3.Connection, object]] = {}
+
+
+class ReadConnections:
+    """Lesende SQLite-Verbindungen, eine je Thread und Datenbankdatei.
+
+    Die Datei wird per URI mit ``mode=ro`` geöffnet und mit ``query_only``,
+    ``mmap_size`` und ``cache_size`` eingestellt; Seiten-Cache und
+    Memory-Map bleiben so über die Requests hinweg warm. Im WAL-Modus sieht
+    jede Abfrage den zuletzt bestätigten Stand eines laufenden Imports. Wird
+    die Datei ersetzt (andere Inode), öffnet ``get`` eine neue Verbindung.
+    Endet ein Thread (etwa der eines Requests), werden seine Verbindungen
+    geschlossen.
+    """
+
+    def __init__(
+        self, mmap_size: int = READ_MMAP_SIZE, cache_kib: int = READ_CACHE_KIB
+    ):
+        self.mmap_size = mmap_size
+        self.cache_kib = cache_kib
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def get(self, db_file) -> sqlite3.Connection:
+        """Verbindung des aktuellen Threads zu ``db_file``."""
+        db_file = os.fspath(db_file)
+        key = db_file if db_file == ":memory:" else os.path.abspath(db_file)
+        try:
+            stat = os.stat(key)
+            identity = (stat.st_dev, stat.st_ino)
+        except OSError:
+            identity = None
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            holder = self._local.holder = _ThreadConnections()
+            # der Thread-lokale Halter verschwindet mit dem Thread
+            weakref.finalize(holder, self._release, holder.connections)
+        cache = holder.connections
+        entry = cache.get(key)
+        if entry and entry[1] == identity:
+            return entry[0]
+        if entry:
+            self._discard(entry[0])
+        con = self._open(key)
+        cache[key] = (con, identity)
+        return con
+
+    def _open(self, db_file: str) -> sqlite3.Connection:
+        if db_file == ":memory:":
+            con = sqlite3.connect(db_file, check_same_thread=False)
+        else:
+            con = sqlite3.connect(
+                Path(db_file).as_uri() + "?mode=ro",
+                uri=True,
+                check_same_thread=False,
+            )
+        con.execute("PRAGMA query_only = ON")
+        con.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        con.execute(f"PRAGMA cache_size = -{int(self.cache_kib)}")
+        with self._lock:
+            self._connections.append(con)
+        return con
+
+    def _discard(self, con: sqlite3.Connection) -> None:
+        with self._lock:
+            if con in self._connections:
+                self._connections.remove(con)
+        con.close()
+
+    def _release(self, cache: Dict[str, Tuple[sqlite3.Connection, object]]) -> None:
+        for con, _ in cache.values():
+            self._discard(con)
+
+    def close(self) -> None:
+        """Schließt die Verbindungen aller Threads."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for con in connections:
+            con.close()
+        self._local = threading.local()
+
+
+READ_CONNECTIONS = ReadConnections()
+
+
+@dataclass
+class Checkpoint:
+    """Importstand einer entfernten Logdatei.
+
+    ``head_hash`` ist der SHA-1 der ersten ``head_size`` Bytes und erkennt
+    die Datei auch nach einer Umbenennung durch die Log-Rotation wieder.
+    """
+
+    name: str
+    size: int
+    mtime: int
+    head_hash: str
+    head_size: int
+    offset: int
 
 
 class AccessLogDB:
     """Kapselt alle Datenbankoperationen für die Access-Logs."""
 
+    # Schema-Version in ``PRAGMA user_version``; ältere Datenbanken werden in
+    # ``init_db`` migriert (0 = breite Tabelle ``access_log``, 1 = Dimensionen
+    # mit Text-Zeitstempel, 2 = Epoch-Sekunden, Bytes und Flag-Bits,
+    # 3 = Duplikaterkennung über ``fingerprint``, 4 = gespeichertes Segment,
+    # 5 = Host und Intern-Flag der Referrer, 6 = Monatspartitionen,
+    # 7 = Geodaten der IP-Dimension).
+    SCHEMA_VERSION = 7
+
+    # Häufig wiederkehrende Texte liegen einmalig in Dimensionstabellen
+    # ``dim_<name>``; die Faktentabelle verweist per Integer-ID darauf.
+    DIMENSIONS = ("ip", "path", "referrer", "user_agent")
+
+    DIMENSION_SQL = """
+    CREATE TABLE IF NOT EXISTS dim_{name} (
+        id INTEGER PRIMARY KEY,
+        value TEXT NOT NULL UNIQUE{extra}
+    )
+    """
+
+    # Zusätzliche, aus dem Wert abgeleitete Spalten einer Dimension. Beim
+    # Referrer sind das der normalisierte Host und das Intern-Flag
+    # (``filters.referrer_host`` bzw. ``filters.is_internal_referrer``), bei
+    # der IP Land, Stadt und ASN, die das ETL einmal je neuer IP nachträgt
+    # (``update_ip_geo``); ``country IS NULL`` heißt "noch nicht aufgelöst".
+    DIMENSION_EXTRAS = {
+        "referrer": ",\n        host TEXT,\n        is_internal INTEGER NOT NULL DEFAULT 0",
+        "ip": (
+            ",\n        country TEXT,\n        city TEXT,"
+            "\n        asn INTEGER,\n        asn_org TEXT"
+        ),
+    }
+    IP_GEO_COLUMNS = ("country", "city", "asn", "asn_org")
+
+    # Bits in ``access_log_fact.flags``; ``is_content`` ist stets das
+    # Gegenteil von ``is_admin_tech`` und wird nicht gespeichert.
+    FLAG_BOT = 1
+    FLAG_ADMIN_TECH = 2
+
+    # Codes der beim Import bestimmten Zielgruppe (``filters.audience_segment``)
+    SEGMENTS = {"other": 0, "content": 1, "bot": 2, "admin": 3}
+
+    # Die Fakten liegen in Monatstabellen ``access_log_fact_YYYY_MM``; ein
+    # alter Monat lässt sich per ``DROP TABLE`` entfernen bzw. archivieren
+    # (``drop_partition``, ``archive_partition``). ``timestamp`` enthält
+    # Epoch-Sekunden der (zeitzonenlosen) Logzeit, ``size`` die Bytezahl bzw.
+    # NULL für "-". Duplikate erkennt der eindeutige ``fingerprint`` (siehe
+    # ``fingerprint()``); da der Zeitstempel in ihn eingeht, landet ein
+    # Duplikat stets in derselben Partition. ``id`` wird beim Import
+    # partitionsübergreifend fortlaufend vergeben.
+    PARTITION_PREFIX = "access_log_fact_"
+
     TABLE_SQL = """
-    CREATE TABLE IF NOT EXISTS access_log (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT,
-        ip TEXT,
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY,
+        timestamp INTEGER NOT NULL,
+        ip_id INTEGER REFERENCES dim_ip (id),
         method TEXT,
-        path TEXT,
+        path_id INTEGER REFERENCES dim_path (id),
         query TEXT,
         status INTEGER,
-        size TEXT,
-        referrer TEXT,
-        user_agent TEXT,
-        is_bot BOOLEAN,
-        is_admin_tech BOOLEAN,
-        is_content BOOLEAN,
+        size INTEGER,
+        referrer_id INTEGER REFERENCES dim_referrer (id),
+        user_agent_id INTEGER REFERENCES dim_user_agent (id),
+        flags INTEGER NOT NULL DEFAULT 0,
+        segment INTEGER NOT NULL DEFAULT 0,
         utm_source TEXT,
         utm_medium TEXT,
         utm_campaign TEXT,
-        UNIQUE(timestamp, ip, method, path, query, user_agent)
+        fingerprint INTEGER NOT NULL UNIQUE
     )
     """
 
+    # Monat einer Zeile der Faktentabelle bzw. der Staging-Tabelle
+    MONTH_SQL = "strftime('%Y-%m', timestamp, 'unixepoch')"
+
+    # Bisherige breite Form für alle lesenden Zugriffe, je Partition; die
+    # View ``access_log`` verbindet alle Partitionen per ``UNION ALL``.
+    # ``timestamp`` ist dort der ISO-Text; Bereichsfilter laufen über ``ts``
+    # (Epoch-Sekunden), damit SQLite die Indizes der Partitionen nutzt.
+    VIEW_SELECT_SQL = """
+    SELECT
+        f.id, strftime('%Y-%m-%dT%H:%M:%S', f.timestamp, 'unixepoch') AS timestamp,
+        ip.value AS ip, f.method, path.value AS path, f.query, f.status,
+        f.size, referrer.value AS referrer, user_agent.value AS user_agent,
+        f.flags & 1 AS is_bot, (f.flags >> 1) & 1 AS is_admin_tech,
+        1 - ((f.flags >> 1) & 1) AS is_content,
+        f.utm_source, f.utm_medium, f.utm_campaign,
+        f.timestamp AS ts, f.flags, f.segment, f.fingerprint,
+        referrer.host AS referrer_host,
+        referrer.is_internal AS is_internal_referrer,
+        COALESCE(ip.country, '?') AS country, COALESCE(ip.city, '-') AS city,
+        ip.asn, ip.asn_org
+    FROM {source} AS f
+    LEFT JOIN dim_ip AS ip ON ip.id = f.ip_id
+    LEFT JOIN dim_path AS path ON path.id = f.path_id
+    LEFT JOIN dim_referrer AS referrer ON referrer.id = f.referrer_id
+    LEFT JOIN dim_user_agent AS user_agent ON user_agent.id = f.user_agent_id
+    """
+
+    # Indizes je Partition; ``{suffix}`` ist der Monat als ``YYYY_MM``
+    PARTITION_INDEX_SQLS = [
+        """CREATE INDEX IF NOT EXISTS access_log_timestamp_index_{suffix}
+        ON {table} (timestamp)""",
+        # Teilindizes: Abfragen eines Segments lesen nur dessen Zeilen
+        f"""CREATE INDEX IF NOT EXISTS access_log_content_index_{{suffix}}
+        ON {{table}} (timestamp, path_id)
+        WHERE segment = {SEGMENTS["content"]}""",
+        f"""CREATE INDEX IF NOT EXISTS access_log_bot_index_{{suffix}}
+        ON {{table}} (timestamp, user_agent_id)
+        WHERE segment = {SEGMENTS["bot"]}""",
+    ]
+
     INDEX_SQLS = [
-        """CREATE UNIQUE INDEX IF NOT EXISTS access_log_id_uindex
-        ON access_log (id)""",
-        """CREATE INDEX IF NOT EXISTS access_log_is_admin_tech_index
-        ON access_log (is_admin_tech)""",
-        """CREATE INDEX IF NOT EXISTS access_log_is_bot_index
-        ON access_log (is_bot)""",
-        """CREATE INDEX IF NOT EXISTS access_log_is_content_index
-        ON access_log (is_content)""",
-        """CREATE INDEX IF NOT EXISTS access_log_timestamp_index
-        ON access_log (timestamp)""",
+        """CREATE INDEX IF NOT EXISTS dim_referrer_host_index
+        ON dim_referrer (is_internal, host)""",
+        # noch nicht aufgelöste IPs für ``update_ip_geo``
+        """CREATE INDEX IF NOT EXISTS dim_ip_geo_pending_index
+        ON dim_ip (id) WHERE country IS NULL""",
     ]
 
-    INSERT_SQL = """
-    INSERT OR IGNORE INTO access_log (
-        timestamp, ip, method, path, query, status, size, referrer, user_agent,
-        is_bot, is_admin_tech, is_content, utm_source, utm_medium, utm_campaign
-    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    # Voraggregierte Tabellen, die beim Import fortgeschrieben werden. Die
+    # Spalte ``timestamp`` enthält den auf Stunde bzw. Tag gekürzten
+    # ISO-Zeitstempel, fehlende UTM-Werte werden als '' gespeichert.
+    ROLLUP_SQLS = {
+        "rollup_hour_path": """
+        CREATE TABLE IF NOT EXISTS rollup_hour_path (
+            timestamp TEXT, path TEXT, segment TEXT, hits INTEGER,
+            PRIMARY KEY (timestamp, path, segment)
+        )""",
+        "rollup_day_status_path": """
+        CREATE TABLE IF NOT EXISTS rollup_day_status_path (
+            timestamp TEXT, status INTEGER, path TEXT, hits INTEGER,
+            PRIMARY KEY (timestamp, status, path)
+        )""",
+        "rollup_day_bot": """
+        CREATE TABLE IF NOT EXISTS rollup_day_bot (
+            timestamp TEXT, user_agent TEXT, hits INTEGER,
+            PRIMARY KEY (timestamp, user_agent)
+        )""",
+        "rollup_day_utm": """
+        CREATE TABLE IF NOT EXISTS rollup_day_utm (
+            timestamp TEXT, utm_source TEXT, utm_medium TEXT,
+            utm_campaign TEXT, hits INTEGER,
+            PRIMARY KEY (timestamp, utm_source, utm_medium, utm_campaign)
+        )""",
+        "rollup_day_referrer_host": """
+        CREATE TABLE IF NOT EXISTS rollup_day_referrer_host (
+            timestamp TEXT, referrer_host TEXT, hits INTEGER,
+            PRIMARY KEY (timestamp, referrer_host)
+        )""",
+    }
+
+    # Tabellen früherer Versionen, die ``init_db`` entfernt
+    OBSOLETE_TABLES = ("rollup_day_referrer",)
+
+    CHECKPOINT_SQL = """
+    CREATE TABLE IF NOT EXISTS etl_checkpoint (
+        name TEXT PRIMARY KEY,
+        size INTEGER,
+        mtime INTEGER,
+        head_hash TEXT,
+        head_size INTEGER,
+        offset INTEGER
+    )
+    """
+
+    # Zähler des Imports, u. a. ``generation``: wird nach jedem erfolgreichen
+    # Lauf erhöht und macht zwischengespeicherte Dashboard-Ergebnisse
+    # ungültig. Bleibt bei ``--force-reload`` erhalten, damit er nur wächst.
+    STATE_SQL = """
+    CREATE TABLE IF NOT EXISTS etl_state (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    """
+
+    COLUMNS = (
+        "id",
+        "timestamp",
+        "ip",
+        "method",
+        "path",
+        "query",
+        "status",
+        "size",
+        "referrer",
+        "user_agent",
+        "is_bot",
+        "is_admin_tech",
+        "is_content",
+        "utm_source",
+        "utm_medium",
+        "utm_campaign",
+        "referrer_host",
+        "is_internal_referrer",
+        "country",
+        "city",
+        "asn",
+        "asn_org",
+    )
+
+    # Spalten der Faktentabelle (ohne ``id``) in der Reihenfolge der
+    # Parser-Datensätze
+    FACT_COLUMNS = (
+        "timestamp",
+        "ip_id",
+        "method",
+        "path_id",
+        "query",
+        "status",
+        "size",
+        "referrer_id",
+        "user_agent_id",
+        "flags",
+        "segment",
+        "utm_source",
+        "utm_medium",
+        "utm_campaign",
+        "fingerprint",
+    )
+
+    INSERT_SQL = f"""
+    INSERT OR IGNORE INTO {{table}} (id, {", ".join(FACT_COLUMNS)})
+    VALUES ({", ".join("?" * (len(FACT_COLUMNS) + 1))})
+    """
+
+    # Leere Faktentabelle für Views ohne Partitionen
+    EMPTY_FACT_SQL = "SELECT {} WHERE 0".format(
+        ", ".join(f"NULL AS {c}" for c in ("id",) + FACT_COLUMNS)
+    )
+
+    # Pragmas für Schreibsitzungen des ETL; WAL erlaubt dem Dashboard das
+    # Lesen während des Imports.
+    LOAD_PRAGMAS = (
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA temp_store = MEMORY",
+    )
+
+    # Staging-Tabelle für Massenimporte: ohne Constraints und Indizes, ``seq``
+    # hält die Einfügereihenfolge fest.
+    STAGING_SQL = f"""
+    CREATE TEMP TABLE IF NOT EXISTS access_log_staging (
+        seq INTEGER PRIMARY KEY, {", ".join(FACT_COLUMNS)}
+    )
     """
 
     # ---------------------------------------------------------
@@ -63,12 +489,24 @@ class AccessLogDB:
     # ---------------------------------------------------------
     @staticmethod
     def get_dataframe(
-        query: str, params=None, db_file: str = DB_FILE
+        query: str, params=None, db_file: str = DB_FILE, parse_dates=None
     ) -> pd.DataFrame:
-        """Lädt eine Abfrage als DataFrame aus der Datenbank."""
-        with sqlite3.connect(db_file) as con:
-            df = pd.read_sql_query(query, con, params=params)
-        return df
+        """Lädt eine Abfrage als DataFrame aus der Datenbank.
+
+        Gelesen wird über die Verbindung des Threads aus ``READ_CONNECTIONS``.
+        Mit ``DB_BACKEND=duckdb`` läuft die Abfrage stattdessen auf dem
+        Parquet-Archiv; ``parse_dates`` (Spalte -> Einheit) wird dann hier
+        angewendet.
+        """
+        if DB_BACKEND == "duckdb":
+            with closing(parquet_store.connect(PARQUET_DIR)) as con:
+                df = con.execute(query, params or []).df()
+            for column, unit in (parse_dates or {}).items():
+                df[column] = pd.to_datetime(df[column], unit=unit)
+            return df
+        kwargs = {"parse_dates": parse_dates} if parse_dates else {}
+        con = READ_CONNECTIONS.get(db_file)
+        return pd.read_sql_query(query, con, params=params, **kwargs)
 
     @staticmethod
     def load_access_logs(db_file: str = DB_FILE) -> pd.DataFrame:
@@ -81,6 +519,11 @@ class AccessLogDB:
         self.db_file = db_file
         self._con = None
         self._cur = None
+        self._staged: Optional[List[Tuple[object, int, int]]] = None
+        self._pending_checkpoints: List[Checkpoint] = []
+        self._dim_cache: Dict[str, Dict[str, int]] = {
+            name: {} for name in self.DIMENSIONS
+        }
 
     def __enter__(self) -> "AccessLogDB":
         self._con = sqlite3.connect(self.db_file)
@@ -94,26 +537,1026 @@ class AccessLogDB:
     # ---------------------------------------------------------
     # Initialisierung und Inserts
     # ---------------------------------------------------------
+    def _objects(self) -> Dict[str, str]:
+        """Name -> Typ aller Tabellen und Views der Datenbank."""
+        return dict(
+            self._cur.execute(
+                "SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view')"
+            ).fetchall()
+        )
+
+    def _create_schema(self) -> None:
+        for name in self.DIMENSIONS:
+            self._cur.execute(
+                self.DIMENSION_SQL.format(
+                    name=name, extra=self.DIMENSION_EXTRAS.get(name, "")
+                )
+            )
+        self._create_views()
+
+    # ---------------------------------------------------------
+    # Monatspartitionen
+    # ---------------------------------------------------------
+    @classmethod
+    def partition_table(cls, month: str) -> str:
+        """Tabellenname der Partition eines Monats ``YYYY-MM``."""
+        try:
+            valid = len(month) == 7 and bool(datetime.strptime(month, "%Y-%m"))
+        except ValueError:
+            valid = False
+        if not valid:
+            raise ValueError(f"Ungültiger Monat: {month!r}")
+        return cls.PARTITION_PREFIX + month.replace("-", "_")
+
+    @classmethod
+    def partition_months(cls, names: Iterable[str]) -> List[str]:
+        """Monate der Partitionstabellen unter ``names``, aufsteigend."""
+        prefix = cls.PARTITION_PREFIX
+        return sorted(
+            name[len(prefix):].replace("_", "-")
+            for name in names
+            if name.startswith(prefix) and name[len(prefix):].replace("_", "").isdigit()
+        )
+
+    @classmethod
+    def relation_sql(cls, months: Sequence[str]) -> str:
+        """SELECT der breiten Form über genau die Partitionen ``months``."""
+        arms = [
+            cls.VIEW_SELECT_SQL.format(source=cls.partition_table(m)) for m in months
+        ]
+        if not arms:
+            arms = [cls.VIEW_SELECT_SQL.format(source=f"({cls.EMPTY_FACT_SQL})")]
+        return " UNION ALL ".join(arms)
+
+    def partitions(self) -> List[str]:
+        """Monate (``YYYY-MM``) aller vorhandenen Partitionen, aufsteigend."""
+        return self.partition_months(self._objects())
+
+    def _create_views(self) -> None:
+        """Erzeugt ``access_log_fact`` und ``access_log`` über alle Partitionen neu."""
+        months = self.partitions()
+        facts = [f"SELECT * FROM {self.partition_table(m)}" for m in months]
+        self._cur.execute("DROP VIEW IF EXISTS access_log_fact")
+        self._cur.execute(
+            "CREATE VIEW access_log_fact AS "
+            + " UNION ALL ".join(facts or [self.EMPTY_FACT_SQL])
+        )
+        self._cur.execute("DROP VIEW IF EXISTS access_log")
+        self._cur.execute("CREATE VIEW access_log AS " + self.relation_sql(months))
+
+    def create_partition(self, month: str) -> str:
+        """Legt die Partition eines Monats samt Indizes an (falls nötig)."""
+        table = self.partition_table(month)
+        if table not in self._objects():
+            self._cur.execute(self.TABLE_SQL.format(table=table))
+            for stmt in self.PARTITION_INDEX_SQLS:
+                self._cur.execute(
+                    stmt.format(table=table, suffix=table[len(self.PARTITION_PREFIX):])
+                )
+            self._create_views()
+        return table
+
+    def drop_partition(self, month: str) -> None:
+        """Entfernt einen Monat per ``DROP TABLE`` samt seiner Rollup-Zeilen."""
+        table = self.partition_table(month)
+        lower, upper = month_bounds(month)
+        self._cur.execute(f"DROP TABLE IF EXISTS {table}")
+        self._create_views()
+        for name in self.ROLLUP_SQLS:
+            self._cur.execute(
+                f"DELETE FROM {name} WHERE timestamp >= ? AND timestamp < ?",
+                (lower, upper),
+            )
+        self._con.commit()
+
+    def archive_partition(self, month: str, path: str) -> int:
+        """Schreibt einen Monat in eine eigene SQLite-Datei und entfernt ihn.
+
+        Die Datei enthält die Zeilen in der breiten Form als Tabelle
+        ``access_log`` und ist damit ohne die Dimensionstabellen lesbar.
+        Gibt die Anzahl archivierter Zeilen zurück.
+        """
+        if self.partition_table(month) not in self._objects():
+            raise ValueError(f"Keine Partition für {month}")
+        if os.path.exists(path):
+            raise FileExistsError(path)
+        self._con.commit()
+        self._cur.execute("ATTACH DATABASE ? AS archive", (path,))
+        try:
+            self._cur.execute(
+                f"CREATE TABLE archive.access_log AS {self.relation_sql([month])}"
+            )
+            rows = self._cur.execute(
+                "SELECT COUNT(*) FROM archive.access_log"
+            ).fetchone()[0]
+            self._con.commit()
+        finally:
+            self._cur.execute("DETACH DATABASE archive")
+        self.drop_partition(month)
+        return rows
+
     def init_db(self, force_reload: bool = False) -> None:
-        """Erzeugt die Datenbanktabelle und löscht sie optional vorher."""
+        """Erzeugt die Datenbanktabellen und löscht sie optional vorher.
+
+        Bestehende Datenbanken mit älterem Schema werden migriert. Fehlen die
+        Rollup-Tabellen, werden sie einmalig aus ``access_log`` aufgebaut.
+        """
         if force_reload:
-            self._cur.execute("DROP TABLE IF EXISTS access_log")
-            self._cur.execute(self.TABLE_SQL)
-            for stmt in self.INDEX_SQLS:
-                self._cur.execute(stmt)
+            for name, kind in self._objects().items():
+                if name == "etl_state":
+                    continue
+                if name == "access_log" or name.startswith(
+                    ("access_log_", "dim_", "rollup_", "etl_")
+                ):
+                    self._cur.execute(f"DROP {kind.upper()} IF EXISTS {name}")
+            self._cur.execute("PRAGMA user_version = 0")
+        for name in self.OBSOLETE_TABLES:
+            self._cur.execute(f"DROP TABLE IF EXISTS {name}")
+        existing = self._objects()
+        version = self._cur.execute("PRAGMA user_version").fetchone()[0]
+        if "access_log" not in existing:
+            version = self.SCHEMA_VERSION
+        if version == 6:
+            # nur neue Spalten, die Fakten bleiben unverändert
+            for column in self.IP_GEO_COLUMNS:
+                kind = "INTEGER" if column == "asn" else "TEXT"
+                self._cur.execute(f"ALTER TABLE dim_ip ADD COLUMN {column} {kind}")
+        elif version < self.SCHEMA_VERSION:
+            self._migrate_from_wide()
+        self._create_schema()
+        self._cur.execute(self.CHECKPOINT_SQL)
+        self._cur.execute(self.STATE_SQL)
+        for stmt in self.INDEX_SQLS:
+            self._cur.execute(stmt)
+        for stmt in self.ROLLUP_SQLS.values():
+            self._cur.execute(stmt)
+        if not set(self.ROLLUP_SQLS) <= set(existing):
+            self.rebuild_rollups(commit=False)
+        self._cur.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self._con.commit()
+
+    def _migrate_from_wide(self) -> None:
+        """Baut Dimensionen und Fakten aus der breiten Form ``access_log`` neu auf.
+
+        Alle bisherigen Schema-Versionen bieten ``access_log`` in dieser Form
+        an (als Tabelle oder View), daher genügt ein gemeinsamer Weg. Die
+        ``id``-Werte bleiben erhalten, die Rollups daher gültig. Die Migration
+        läuft in einer Transaktion, die ``init_db`` abschließt.
+        """
+        if not self._con.in_transaction:
+            self._cur.execute("BEGIN")
+        if self._objects().get("access_log") == "view":
+            self._cur.execute(
+                "CREATE TABLE access_log_wide AS SELECT * FROM access_log"
+            )
+            for name, kind in self._objects().items():
+                if name == "access_log" or name.startswith("access_log_fact"):
+                    self._cur.execute(f"DROP {kind.upper()} {name}")
+            for name in self.DIMENSIONS:
+                self._cur.execute(f"DROP TABLE IF EXISTS dim_{name}")
+        else:
+            self._cur.execute("ALTER TABLE access_log RENAME TO access_log_wide")
+        self._cur.execute(
+            "CREATE INDEX access_log_wide_timestamp ON access_log_wide (timestamp)"
+        )
+        self._create_schema()
+        for name in self.DIMENSIONS:
+            self._cur.execute(
+                f"INSERT OR IGNORE INTO dim_{name} (value)"
+                f" SELECT {name} FROM access_log_wide WHERE {name} IS NOT NULL"
+            )
+        joins = " ".join(
+            f"LEFT JOIN dim_{name} ON dim_{name}.value = w.{name}"
+            for name in self.DIMENSIONS
+        )
+        converted = {
+            "timestamp": "CAST(strftime('%s', w.timestamp) AS INTEGER)",
+            "size": (
+                "CASE WHEN typeof(w.size) = 'integer' THEN w.size"
+                " WHEN w.size GLOB '[0-9]*' AND w.size NOT GLOB '*[^0-9]*'"
+                " THEN CAST(w.size AS INTEGER) END"
+            ),
+            "flags": (
+                f"(CASE WHEN w.is_bot = 1 THEN {self.FLAG_BOT} ELSE 0 END)"
+                f" | (CASE WHEN w.is_admin_tech = 1 THEN {self.FLAG_ADMIN_TECH}"
+                " ELSE 0 END)"
+            ),
+            "segment": (
+                "audience_segment(w.is_bot = 1, COALESCE(w.is_admin_tech, 0) = 1,"
+                " w.method, COALESCE(w.path, ''))"
+            ),
+            "fingerprint": (
+                "fingerprint(w.timestamp, w.ip, w.method, w.path, w.query,"
+                " w.user_agent)"
+            ),
+        }
+        values = ", ".join(
+            f"dim_{c[:-3]}.id" if c.endswith("_id") else converted.get(c, f"w.{c}")
+            for c in self.FACT_COLUMNS
+        )
+        # Zeilen mit gleichem Fingerabdruck fallen gemäß der Kollisionsregel
+        # von ``fingerprint()`` weg.
+        self._con.create_function("fingerprint", 6, fingerprint, deterministic=True)
+        self._con.create_function(
+            "audience_segment",
+            4,
+            lambda *args: self.SEGMENTS[audience_segment(*args)],
+            deterministic=True,
+        )
+        months = [
+            month
+            for (month,) in self._cur.execute(
+                "SELECT DISTINCT substr(timestamp, 1, 7) FROM access_log_wide"
+                " WHERE timestamp GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]*'"
+            ).fetchall()
+        ]
+        for month in months:
+            self._cur.execute(
+                f"INSERT OR IGNORE INTO {self.create_partition(month)}"
+                f" (id, {', '.join(self.FACT_COLUMNS)})"
+                f" SELECT w.id, {values} FROM access_log_wide AS w {joins}"
+                " WHERE w.timestamp >= ? AND w.timestamp < ? ORDER BY w.id",
+                month_bounds(month),
+            )
+        self._cur.execute("DROP TABLE access_log_wide")
+        self.refresh_referrers(commit=False)
+
+    # ---------------------------------------------------------
+    # Rollups
+    # ---------------------------------------------------------
+    def _rollup_statements(self) -> Dict[str, Tuple[str, List]]:
+        """INSERT-Statements, die Zeilen mit ``id > ?`` in die Rollups addieren.
+
+        Die ``id``-Bedingung steht jeweils am Ende, ihr Parameter wird daher
+        hinter die Segment-Parameter gehängt.
+        """
+        content, content_params = AccessLogStats.segment_sql("content")
+        referrers, referrer_params = AccessLogStats.segment_sql("referrers")
+        segment = "CASE segment {} END".format(
+            " ".join(
+                f"WHEN {code} THEN '{name}'"
+                for name, code in AccessLogDB.SEGMENTS.items()
+            )
+        )
+        hour = "substr(timestamp, 1, 13) || ':00:00'"
+        day = "substr(timestamp, 1, 10) || 'T00:00:00'"
+
+        def upsert(keys: str) -> str:
+            return f"ON CONFLICT ({keys}) DO UPDATE SET hits = hits + excluded.hits"
+
+        return {
+            "rollup_hour_path": (
+                f"""INSERT INTO rollup_hour_path (timestamp, path, segment, hits)
+                SELECT {hour}, path, {segment}, COUNT(*) FROM access_log
+                WHERE id > ? GROUP BY 1, 2, 3
+                {upsert("timestamp, path, segment")}""",
+                content_params,
+            ),
+            "rollup_day_status_path": (
+                f"""INSERT INTO rollup_day_status_path (timestamp, status, path, hits)
+                SELECT {day}, status, path, COUNT(*) FROM access_log
+                WHERE id > ? GROUP BY 1, 2, 3
+                {upsert("timestamp, status, path")}""",
+                [],
+            ),
+            "rollup_day_bot": (
+                f"""INSERT INTO rollup_day_bot (timestamp, user_agent, hits)
+                SELECT {day}, user_agent, COUNT(*) FROM access_log
+                WHERE is_bot = 1 AND id > ? GROUP BY 1, 2
+                {upsert("timestamp, user_agent")}""",
+                [],
+            ),
+            "rollup_day_utm": (
+                f"""INSERT INTO rollup_day_utm (
+                    timestamp, utm_source, utm_medium, utm_campaign, hits
+                )
+                SELECT {day}, COALESCE(utm_source, ''), COALESCE(utm_medium, ''),
+                    COALESCE(utm_campaign, ''), COUNT(*) FROM access_log
+                WHERE {content} AND (utm_source IS NOT NULL
+                    OR utm_medium IS NOT NULL OR utm_campaign IS NOT NULL)
+                    AND id > ?
+                GROUP BY 1, 2, 3, 4
+                {upsert("timestamp, utm_source, utm_medium, utm_campaign")}""",
+                content_params,
+            ),
+            "rollup_day_referrer_host": (
+                f"""INSERT INTO rollup_day_referrer_host (
+                    timestamp, referrer_host, hits
+                )
+                SELECT {day}, referrer_host, COUNT(*) FROM access_log
+                WHERE {referrers} AND id > ?
+                GROUP BY 1, 2 {upsert("timestamp, referrer_host")}""",
+                referrer_params,
+            ),
+        }
+
+    def update_rollups(self, since_id: int, commit: bool = True) -> None:
+        """Addiert alle Zeilen mit ``id > since_id`` in die Rollup-Tabellen.
+
+        Neue Zeilen erhalten IDs oberhalb von ``max_id()``, daher sind das
+        genau die Zeilen, die seit ``since_id`` tatsächlich eingefügt wurden.
+        """
+        for sql, params in self._rollup_statements().values():
+            self._cur.execute(sql, params + [since_id])
+        if commit:
+            self._con.commit()
+
+    def rebuild_rollups(
+        self, commit: bool = True, tables: Optional[Iterable[str]] = None
+    ) -> None:
+        """Leert die (bzw. die angegebenen) Rollup-Tabellen und baut sie neu auf."""
+        statements = self._rollup_statements()
+        for name in self.ROLLUP_SQLS if tables is None else tables:
+            self._cur.execute(f"DELETE FROM {name}")
+            sql, params = statements[name]
+            self._cur.execute(sql, params + [0])
+        if commit:
             self._con.commit()
 
-    def insert_logs(self, records: Iterable[Tuple]) -> int:
-        """Fügt mehrere Logeinträge ein und gibt die Anzahl neuer Zeilen zurück."""
+    def refresh_referrers(self, commit: bool = True) -> int:
+        """Berechnet Host und Intern-Flag aller Referrer neu.
+
+        Nötig, wenn sich ``filters.IGNORED_REFERRERS`` oder die Normalisierung
+        geändert hat; das Referrer-Rollup wird danach neu aufgebaut. Gibt die
+        Anzahl geänderter Referrer zurück.
+        """
+        updates = []
+        rows = self._cur.execute(
+            "SELECT id, value, host, is_internal FROM dim_referrer"
+        ).fetchall()
+        for id_, value, old_host, old_internal in rows:
+            host = referrer_host(value)
+            internal = int(is_internal_referrer(host))
+            if (host, internal) != (old_host, old_internal):
+                updates.append((host, internal, id_))
+        self._cur.executemany(
+            "UPDATE dim_referrer SET host = ?, is_internal = ? WHERE id = ?", updates
+        )
+        changed = len(updates)
+        if "rollup_day_referrer_host" in self._objects():
+            self.rebuild_rollups(commit=False, tables=["rollup_day_referrer_host"])
+        if commit:
+            self._con.commit()
+        return changed
+
+    # ---------------------------------------------------------
+    # Geodaten
+    # ---------------------------------------------------------
+    def update_ip_geo(
+        self,
+        lookup: Callable[[Sequence[str]], Sequence[Tuple]],
+        refresh: bool = False,
+        batch_size: int = 5000,
+        commit: bool = True,
+    ) -> int:
+        """Trägt Land, Stadt und ASN für noch nicht aufgelöste IPs nach.
+
+        ``lookup`` erhält eine Liste von IPs und liefert je IP
+        ``(country, city, asn, asn_org)`` (siehe ``GeoIPLookup.lookup_many``).
+        Jede IP wird so nur einmal aufgelöst; mit ``refresh`` alle erneut,
+        etwa nach einem Update der GeoLite2-Datenbank. Gibt die Anzahl
+        aufgelöster IPs zurück.
+        """
+        pending = "" if refresh else " AND country IS NULL"
+        last_id = resolved = 0
+        while True:
+            rows = self._cur.execute(
+                f"SELECT id, value FROM dim_ip WHERE id > ?{pending}"
+                " ORDER BY id LIMIT ?",
+                (last_id, batch_size),
+            ).fetchall()
+            if not rows:
+                break
+            geo = lookup([value for _, value in rows])
+            self._cur.executemany(
+                "UPDATE dim_ip SET country = ?, city = ?, asn = ?, asn_org = ?"
+                " WHERE id = ?",
+                [(*values, id_) for (id_, _), values in zip(rows, geo)],
+            )
+            last_id = rows[-1][0]
+            resolved += len(rows)
+        if commit:
+            self._con.commit()
+        return resolved
+
+    # ---------------------------------------------------------
+    # Checkpoints
+    # ---------------------------------------------------------
+    def get_checkpoint(self, name: str) -> Optional[Checkpoint]:
+        """Liefert den gespeicherten Importstand einer Datei."""
+        row = self._cur.execute(
+            "SELECT * FROM etl_checkpoint WHERE name = ?", (name,)
+        ).fetchone()
+        return Checkpoint(*row) if row else None
+
+    def find_checkpoint(self, head_hash: str, head_size: int) -> Optional[Checkpoint]:
+        """Sucht einen Importstand über den Anfang der Datei (nach Rotation)."""
+        row = self._cur.execute(
+            "SELECT * FROM etl_checkpoint WHERE head_hash = ? AND head_size = ?"
+            " ORDER BY offset DESC LIMIT 1",
+            (head_hash, head_size),
+        ).fetchone()
+        return Checkpoint(*row) if row else None
+
+    def latest_checkpoint_mtime(self) -> Optional[int]:
+        """Jüngste ``mtime`` aller bereits importierten Dateien."""
+        return self._cur.execute(
+            "SELECT MAX(mtime) FROM etl_checkpoint"
+        ).fetchone()[0]
+
+    def save_checkpoint(self, checkpoint: Checkpoint) -> None:
+        """Speichert den Importstand einer Datei.
+
+        Während eines gestagten Massenimports wird er erst zusammen mit dem
+        Übernehmen der Zeilen in ``access_log`` geschrieben.
+        """
+        if self._staged is not None:
+            self._pending_checkpoints.append(checkpoint)
+            return
+        self._cur.execute(
+            "INSERT OR REPLACE INTO etl_checkpoint VALUES (?, ?, ?, ?, ?, ?)",
+            astuple(checkpoint),
+        )
+        self._con.commit()
+
+    def bump_generation(self) -> int:
+        """Erhöht die Daten-Generation und gibt den neuen Wert zurück."""
+        self._cur.execute(
+            "INSERT INTO etl_state (name, value) VALUES ('generation', 1)"
+            " ON CONFLICT (name) DO UPDATE SET value = value + 1"
+        )
+        self._con.commit()
+        return self._cur.execute(
+            "SELECT value FROM etl_state WHERE name = 'generation'"
+        ).fetchone()[0]
+
+    def max_id(self) -> int:
+        """Höchste vergebene ``id`` in ``access_log`` (0 bei leerer Tabelle)."""
+        maxima = " UNION ALL ".join(
+            f"SELECT MAX(id) AS id FROM {self.partition_table(m)}"
+            for m in self.partitions()
+        )
+        if not maxima:
+            return 0
+        return self._cur.execute(
+            f"SELECT COALESCE(MAX(id), 0) FROM ({maxima})"
+        ).fetchone()[0]
+
+    def _dimension_ids(self, name: str, values: Iterable[str]) -> Dict[str, int]:
+        """Liefert die IDs zu Werten einer Dimension und legt fehlende an.
+
+        Bekannte IDs kommen aus einem Cache je Verbindung, der bei mehr als
+        ``DIM_CACHE_SIZE`` Einträgen geleert wird.
+        """
+        cache = self._dim_cache[name]
+        values = {v for v in values if v is not None}
+        missing = [v for v in values if v not in cache]
+        if missing:
+            if len(cache) + len(missing) > DIM_CACHE_SIZE:
+                cache.clear()
+                missing = list(values)
+            if name == "referrer":
+                self._cur.executemany(
+                    "INSERT OR IGNORE INTO dim_referrer (value, host, is_internal)"
+                    " VALUES (?, ?, ?)",
+                    [
+                        (v, host, int(is_internal_referrer(host)))
+                        for v in missing
+                        for host in (referrer_host(v),)
+                    ],
+                )
+            else:
+                self._cur.executemany(
+                    f"INSERT OR IGNORE INTO dim_{name} (value) VALUES (?)",
+                    [(v,) for v in missing],
+                )
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                cache.update(
+                    self._cur.execute(
+                        f"SELECT value, id FROM dim_{name} WHERE value IN"
+                        f" ({', '.join('?' * len(chunk))})",
+                        chunk,
+                    )
+                )
+        return cache
+
+    def encode_records(self, records: Sequence[Tuple]) -> List[Tuple]:
+        """Wandelt Parser-Datensätze in Zeilen der Faktentabelle um.
+
+        ip, path, referrer und user_agent werden durch Dimensions-IDs ersetzt,
+        der Zeitstempel durch Epoch-Sekunden, die Größe durch eine Zahl und
+        die Flags durch ``flags``. Segment und Fingerabdruck kommen als 16.
+        und 17. Feld vom Parser und werden sonst hier bestimmt.
+        """
+        ips = self._dimension_ids("ip", (r[1] for r in records))
+        paths = self._dimension_ids("path", (r[3] for r in records))
+        referrers = self._dimension_ids("referrer", (r[7] for r in records))
+        agents = self._dimension_ids("user_agent", (r[8] for r in records))
+        segments = self.SEGMENTS
+        return [
+            (
+                epoch_seconds(timestamp),
+                ips.get(ip),
+                method,
+                paths.get(path),
+                query,
+                status,
+                parse_size(size),
+                referrers.get(referrer),
+                agents.get(user_agent),
+                (self.FLAG_BOT if is_bot else 0)
+                | (self.FLAG_ADMIN_TECH if is_admin_tech else 0),
+                segments[
+                    extra[0] if extra
+                    else audience_segment(is_bot, is_admin_tech, method, path)
+                ],
+                utm_source,
+                utm_medium,
+                utm_campaign,
+                extra[1] if extra
+                else fingerprint(timestamp, ip, method, path, query, user_agent),
+            )
+            for (
+                timestamp, ip, method, path, query, status, size, referrer,
+                user_agent, is_bot, is_admin_tech, _, utm_source, utm_medium,
+                utm_campaign, *extra,
+            ) in records
+        ]
+
+    def insert_logs(self, records: Iterable[Tuple], source: object = None) -> int:
+        """Fügt mehrere Logeinträge ein und gibt die Anzahl neuer Zeilen zurück.
+
+        Die Rollup-Tabellen werden in derselben Transaktion fortgeschrieben.
+        Die neuen Zeilen werden über ``total_changes`` gezählt statt über
+        ``COUNT`` vorher und nachher. Während ``bulk_load(staged=True)`` landen
+        die Einträge in der Staging-Tabelle, es wird 0 zurückgegeben; die
+        Anzahl je ``source`` liefert dann ``merge_staging``.
+        """
         records = list(records)
         if not records:
             return 0
-        before = self._cur.execute(
-            "SELECT COUNT(id) FROM access_log"
-        ).fetchone()[0]
-        self._cur.executemany(self.INSERT_SQL, records)
+        records = self.encode_records(records)
+        if self._staged is not None:
+            self._stage(records, source)
+            return 0
+        since_id = self.max_id()
+        by_month: Dict[str, List[Tuple]] = {}
+        for id_, row in enumerate(records, since_id + 1):
+            by_month.setdefault(month_of(row[0]), []).append((id_,) + row)
+        before = self._con.total_changes
+        for month, rows in by_month.items():
+            table = self.create_partition(month)
+            self._cur.executemany(self.INSERT_SQL.format(table=table), rows)
+        inserted = self._con.total_changes - before
+        self.update_rollups(since_id, commit=False)
         self._con.commit()
-        after = self._cur.execute(
-            "SELECT COUNT(id) FROM access_log"
+        return inserted
+
+    # ---------------------------------------------------------
+    # Massenimport
+    # ---------------------------------------------------------
+    def apply_load_pragmas(self) -> None:
+        """Stellt die Verbindung auf WAL und ``synchronous = NORMAL`` um."""
+        for pragma in self.LOAD_PRAGMAS:
+            self._cur.execute(pragma)
+
+    @contextmanager
+    def bulk_load(self, staged: bool = False):
+        """Schreibsitzung für große Importe.
+
+        Mit ``staged=True`` werden alle Einträge zunächst ohne Index-Pflege in
+        eine temporäre Tabelle geschrieben und am Ende von ``merge_staging``
+        in einem Schritt übernommen; die Sekundärindizes der betroffenen
+        Partitionen (``PARTITION_INDEX_SQLS``) werden dabei erst nach dem
+        Einfügen neu aufgebaut. Bricht der Import ab, bleiben ``access_log``
+        und die Checkpoints unverändert.
+        """
+        self.apply_load_pragmas()
+        if not staged:
+            yield self
+            return
+        self._cur.execute(self.STAGING_SQL)
+        self._cur.execute("DELETE FROM access_log_staging")
+        self._staged = []
+        self._pending_checkpoints = []
+        try:
+            yield self
+        finally:
+            self._staged = None
+            self._pending_checkpoints = []
+            self._con.rollback()
+            # zurückgerollte Dimensionseinträge dürfen nicht im Cache bleiben
+            for cache in self._dim_cache.values():
+                cache.clear()
+            self._cur.execute("DROP TABLE IF EXISTS temp.access_log_staging")
+
+    def _stage(self, records: List[Tuple], source: object) -> None:
+        first = self._cur.execute(
+            "SELECT COALESCE(MAX(seq), 0) + 1 FROM access_log_staging"
         ).fetchone()[0]
-        return after - before
+        self._cur.executemany(
+            f"INSERT INTO access_log_staging ({', '.join(self.FACT_COLUMNS)})"
+            f" VALUES ({', '.join('?' * len(self.FACT_COLUMNS))})",
+            records,
+        )
+        last = first + len(records) - 1
+        if self._staged and self._staged[-1][0] == source:
+            self._staged[-1] = (source, self._staged[-1][1], last)
+        else:
+            self._staged.append((source, first, last))
+
+    def merge_staging(self) -> Dict[object, int]:
+        """Übernimmt die gestagten Zeilen nach ``access_log``.
+
+        Gibt je ``source`` die Anzahl tatsächlich neuer Zeilen zurück. Rollups,
+        Indizes und aufgeschobene Checkpoints werden in derselben Transaktion
+        aktualisiert.
+        """
+        if self._staged is None:
+            raise RuntimeError("merge_staging() nur innerhalb von bulk_load(staged=True)")
+        columns = ", ".join(self.FACT_COLUMNS)
+        months = [
+            month
+            for (month,) in self._cur.execute(
+                f"SELECT DISTINCT {self.MONTH_SQL} FROM access_log_staging"
+            ).fetchall()
+        ]
+        tables = [self.create_partition(month) for month in months]
+        indexes = self._cur.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index'"
+            f" AND tbl_name IN ({', '.join('?' * len(tables))}) AND sql IS NOT NULL",
+            tables,
+        ).fetchall()
+        for name, _ in indexes:
+            self._cur.execute(f"DROP INDEX {name}")
+        since_id = self.max_id()
+        imported: Dict[object, int] = {}
+        for source, first, last in self._staged:
+            before = self._con.total_changes
+            for month, table in zip(months, tables):
+                # ``id`` folgt der Einfügereihenfolge wie bei ``insert_logs``
+                self._cur.execute(
+                    f"INSERT OR IGNORE INTO {table} (id, {columns})"
+                    f" SELECT ? + seq, {columns} FROM access_log_staging"
+                    " WHERE seq BETWEEN ? AND ? AND timestamp >= ? AND timestamp < ?"
+                    " ORDER BY seq",
+                    (since_id, first, last)
+                    + tuple(epoch_seconds(b) for b in month_bounds(month)),
+                )
+            imported[source] = (
+                imported.get(source, 0) + self._con.total_changes - before
+            )
+        for _, sql in indexes:
+            self._cur.execute(sql)
+        self.update_rollups(since_id, commit=False)
+        for checkpoint in self._pending_checkpoints:
+            self._cur.execute(
+                "INSERT OR REPLACE INTO etl_checkpoint VALUES (?, ?, ?, ?, ?, ?)",
+                astuple(checkpoint),
+            )
+        self._con.commit()
+        self._cur.execute("DELETE FROM access_log_staging")
+        self._con.commit()
+        self._staged = []
+        self._pending_checkpoints = []
+        return imported
+
+
+class AccessLogStats:
+    """SQL-Aggregationen für die Dashboard-Routen.
+
+    Alle Auswertungen laufen als ``GROUP BY ... ORDER BY ... LIMIT`` direkt in
+    SQLite, sodass nur die kleinen Ergebnismengen in Python ankommen. Ist der
+    Filter tages- bzw. stundengenau, werden die Rollup-Tabellen statt
+    ``access_log`` abgefragt.
+    """
+
+    # Zeitschlüssel, die eine Rollup-Auflösung beantworten kann
+    TIME_KEYS = {
+        "hour": {"date", "hour", "weekday"},
+        "day": {"date", "weekday"},
+    }
+
+    # Abgeleitete Gruppierungsschlüssel (Alias -> SQL-Ausdruck)
+    EXPRESSIONS = {
+        "date": "substr(timestamp, 1, 10)",
+        "hour": "CAST(substr(timestamp, 12, 2) AS INTEGER)",
+        "weekday": "(CAST(strftime('%w', timestamp) AS INTEGER) + 6) % 7",
+        "combo": (
+            "COALESCE(utm_source, '–') || ' | ' || COALESCE(utm_medium, '–')"
+            " || ' | ' || COALESCE(utm_campaign, '–')"
+        ),
+    }
+
+    # Auf ``access_log`` rechnen die Zeitschlüssel mit den Epoch-Sekunden
+    # (``ts``) statt mit dem abgeleiteten ISO-Text. 1970-01-01 war ein
+    # Donnerstag, daher der Versatz 3 für Montag = 0.
+    RAW_EXPRESSIONS = {
+        **EXPRESSIONS,
+        "date": "date(ts, 'unixepoch')",
+        "hour": "ts / 3600 % 24",
+        "weekday": "(ts / 86400 + 3) % 7",
+    }
+
+    # Dieselben Ausdrücke für DuckDB, dort ist ``/`` keine Ganzzahldivision
+    DUCKDB_EXPRESSIONS = {
+        **RAW_EXPRESSIONS,
+        "date": "strftime(epoch_ms(ts * 1000), '%Y-%m-%d')",
+        "hour": "ts // 3600 % 24",
+        "weekday": "(ts // 86400 + 3) % 7",
+    }
+
+    def __init__(
+        self,
+        from_date: Optional[str] = None,
+        to_date: Optional[str] = None,
+        db_file: str = DB_FILE,
+        use_rollups: bool = True,
+        backend: Optional[str] = None,
+        parquet_dir: Optional[str] = None,
+    ):
+        self.from_date = from_date
+        self.to_date = to_date
+        self.db_file = db_file
+        self.backend = backend or DB_BACKEND
+        self.parquet_dir = parquet_dir or PARQUET_DIR
+        # das Parquet-Archiv enthält nur die Rohdaten
+        self.use_rollups = use_rollups and self.backend == "sqlite"
+        self._rollup_tables = None
+        self._partitions = None
+
+    # ---------------------------------------------------------
+    # Segmente (entsprechen den bisherigen pandas-Filtern)
+    # ---------------------------------------------------------
+    @staticmethod
+    def segment_sql(segment: str) -> Tuple[str, List]:
+        """Liefert Bedingung und Parameter für ein Zielgruppen-Segment."""
+        if segment == "all":
+            return "1", []
+        codes = AccessLogDB.SEGMENTS
+        if segment == "bots":
+            return f"segment = {codes['bot']}", []
+        if segment == "errors":
+            return "(status >= 400 AND status < 600)", []
+        if segment in ("content", "utm", "referrers"):
+            # als Literal, damit SQLite die Teilindizes verwenden kann
+            clause = f"segment = {codes['content']}"
+            params: List = []
+            if segment == "utm":
+                clause += (
+                    " AND (utm_source IS NOT NULL OR utm_medium IS NOT NULL"
+                    " OR utm_campaign IS NOT NULL)"
+                )
+            elif segment == "referrers":
+                clause += " AND referrer_host IS NOT NULL AND is_internal_referrer = 0"
+            return clause, params
+        raise ValueError(f"Unbekanntes Segment: {segment}")
+
+    def _bounds_sql(self, raw: bool = True) -> Tuple[List[str], List]:
+        """Datumsgrenzen für ``access_log`` (``ts``) bzw. Rollups (ISO-Text)."""
+        lower, upper = timestamp_bounds(self.from_date, self.to_date)
+        column, convert = ("ts", epoch_seconds) if raw else ("timestamp", str)
+        conditions: List[str] = []
+        params: List = []
+        if lower:
+            conditions.append(f"{column} >= ?")
+            params.append(convert(lower))
+        if upper:
+            conditions.append(f"{column} < ?")
+            params.append(convert(upper))
+        return conditions, params
+
+    def _where(self, segment: str) -> Tuple[str, List]:
+        clause, params = self.segment_sql(segment)
+        bounds, bound_params = self._bounds_sql()
+        return " AND ".join([clause] + bounds), list(params) + bound_params
+
+    # ---------------------------------------------------------
+    # Rollup-Auswahl
+    # ---------------------------------------------------------
+    # Rollups, deren gespeicherte Werte vor dem Lesen normalisiert werden
+    ROLLUP_VIEWS = {
+        "rollup_day_utm": (
+            "(SELECT timestamp, NULLIF(utm_source, '') AS utm_source,"
+            " NULLIF(utm_medium, '') AS utm_medium,"
+            " NULLIF(utm_campaign, '') AS utm_campaign, hits"
+            " FROM rollup_day_utm)"
+        ),
+    }
+
+    @staticmethod
+    def rollups() -> List[Tuple[str, str, Dict[str, Tuple[str, List]], set]]:
+        """Rollup-Tabellen: (Name, Auflösung, Segmente, Schlüssel)."""
+        return [
+            (
+                "rollup_hour_path",
+                "hour",
+                {
+                    "all": ("1", []),
+                    "content": ("segment = 'content'", []),
+                    "bots": ("segment = 'bot'", []),
+                },
+                {"path"},
+            ),
+            (
+                "rollup_day_status_path",
+                "day",
+                {
+                    "all": ("1", []),
+                    "errors": ("(status >= 400 AND status < 600)", []),
+                },
+                {"status", "path"},
+            ),
+            ("rollup_day_bot", "day", {"bots": ("1", [])}, {"user_agent"}),
+            (
+                "rollup_day_utm",
+                "day",
+                {"utm": ("1", [])},
+                {"utm_source", "utm_medium", "utm_campaign", "combo"},
+            ),
+            (
+                "rollup_day_referrer_host",
+                "day",
+                {"referrers": ("1", [])},
+                {"referrer_host"},
+            ),
+        ]
+
+    def _available_rollups(self) -> set:
+        if self._rollup_tables is None:
+            rows = self.query(
+                "SELECT name FROM sqlite_master"
+                " WHERE type = 'table' AND name LIKE 'rollup_%'"
+            )
+            self._rollup_tables = {row["name"] for row in rows}
+        return self._rollup_tables
+
+    def _relation(self) -> str:
+        """FROM-Ausdruck für ``access_log``, beschränkt auf den Datumsbereich.
+
+        Es werden nur die Monatspartitionen gelesen, die sich mit dem Filter
+        überschneiden; ohne Einschränkung bleibt es bei der View.
+        """
+        if self.backend == "duckdb":
+            return "access_log"
+        if self._partitions is None:
+            rows = self.query("SELECT name FROM sqlite_master WHERE type = 'table'")
+            self._partitions = AccessLogDB.partition_months(row["name"] for row in rows)
+        months = months_in_range(
+            self._partitions, *timestamp_bounds(self.from_date, self.to_date)
+        )
+        if months == self._partitions:
+            return "access_log"
+        return f"({AccessLogDB.relation_sql(months)})"
+
+    def data_generation(self) -> int:
+        """Aktuelle Daten-Generation (siehe ``AccessLogDB.bump_generation``)."""
+        try:
+            row = READ_CONNECTIONS.get(self.db_file).execute(
+                "SELECT value FROM etl_state WHERE name = 'generation'"
+            ).fetchone()
+        except sqlite3.OperationalError:  # Datenbank vor dem ersten Import
+            return 0
+        return int(row[0]) if row else 0
+
+    def _from(self, source: str) -> str:
+        return self._relation() if source == "access_log" else source
+
+    def _aligned(self, resolution: str) -> bool:
+        """True, wenn der Datumsfilter auf die Rollup-Auflösung passt."""
+        suffix = "T00:00:00" if resolution == "day" else ":00:00"
+        return all(
+            bound is None or bound.endswith(suffix)
+            for bound in timestamp_bounds(self.from_date, self.to_date)
+        )
+
+    def _source(self, segment: str, keys: Sequence[str]) -> Tuple[str, str, str, List]:
+        """Wählt die Datenquelle: (FROM, Zählausdruck, Bedingung, Parameter)."""
+        if self.use_rollups:
+            available = self._available_rollups()
+            for table, resolution, segments, columns in self.rollups():
+                if (
+                    table in available
+                    and segment in segments
+                    and set(keys) <= columns | self.TIME_KEYS[resolution]
+                    and self._aligned(resolution)
+                ):
+                    clause, params = segments[segment]
+                    bounds, bound_params = self._bounds_sql(raw=False)
+                    where = " AND ".join([clause] + bounds)
+                    source = self.ROLLUP_VIEWS.get(table, table)
+                    return source, "SUM(hits)", where, list(params) + bound_params
+        where, params = self._where(segment)
+        return "access_log", "COUNT(*)", where, params
+
+    def _key_sql(self, key: str, source: str = "access_log") -> str:
+        if source != "access_log":
+            expressions = self.EXPRESSIONS
+        elif self.backend == "duckdb":
+            expressions = self.DUCKDB_EXPRESSIONS
+        else:
+            expressions = self.RAW_EXPRESSIONS
+        if key in expressions:
+            return f"{expressions[key]} AS {key}"
+        if key in AccessLogDB.COLUMNS:
+            return key
+        raise ValueError(f"Unbekannter Schlüssel: {key}")
+
+    def query(self, sql: str, params=None) -> List[Dict]:
+        """Führt eine Abfrage aus und gibt die Zeilen als Dicts zurück."""
+        if self.backend == "duckdb":
+            with closing(parquet_store.connect(self.parquet_dir)) as con:
+                cur = con.execute(sql, params or [])
+                names = [column[0] for column in cur.description]
+                return [dict(zip(names, row)) for row in cur.fetchall()]
+        with closing(READ_CONNECTIONS.get(self.db_file).cursor()) as cur:
+            cur.row_factory = sqlite3.Row
+            rows = cur.execute(sql, params or []).fetchall()
+        return [dict(row) for row in rows]
+
+    # ---------------------------------------------------------
+    # Aggregationen
+    # ---------------------------------------------------------
+    def counts(
+        self,
+        keys: Sequence[str],
+        segment: str = "all",
+        limit: Optional[int] = None,
+        order: str = "hits",
+        skip_null: bool = False,
+    ) -> List[Dict]:
+        """Zählt Zugriffe je Schlüssel, optional als Top-N-Liste.
+
+        ``order="hits"`` sortiert absteigend nach Treffern (bei Gleichstand nach
+        Schlüssel), ``order="key"`` aufsteigend nach Schlüssel. Mit
+        ``skip_null`` werden wie bei ``DataFrame.groupby`` NULL-Schlüssel
+        ausgelassen.
+        """
+        keys = list(keys)
+        source, agg, where, params = self._source(segment, keys)
+        select = ", ".join(self._key_sql(k, source) for k in keys)
+        group = ", ".join(keys)
+        if skip_null:
+            where += "".join(f" AND {k} IS NOT NULL" for k in keys)
+        sql = (
+            f"SELECT {select}, {agg} AS hits FROM {self._from(source)}"
+            f" WHERE {where} GROUP BY {group}"
+        )
+        if order == "hits":
+            sql += f" ORDER BY hits DESC, {group}"
+        else:
+            sql += f" ORDER BY {group}"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return self.query(sql, params)
+
+    def count(self, segment: str = "all") -> int:
+        """Anzahl der Zugriffe im Segment."""
+        source, agg, where, params = self._source(segment, [])
+        sql = (
+            f"SELECT COALESCE({agg}, 0) AS n FROM {self._from(source)}"
+            f" WHERE {where}"
+        )
+        return int(self.query(sql, params)[0]["n"])
+
+    def distinct(self, column: str, segment: str = "all") -> int:
+        """Anzahl unterschiedlicher Werte einer Spalte im Segment."""
+        if column not in AccessLogDB.COLUMNS:
+            raise ValueError(f"Unbekannte Spalte: {column}")
+        where, params = self._where(segment)
+        sql = (
+            f"SELECT COUNT(DISTINCT {column}) AS n FROM {self._relation()}"
+            f" WHERE {where}"
+        )
+        return int(self.query(sql, params)[0]["n"])
+
+    def kpis(self) -> Dict[str, int]:
+        """Kennzahlen der Übersicht.
+
+        Aus den Rollups als vier kleine Abfragen, sonst in einem einzigen
+        Durchlauf über ``access_log``.
+        """
+        names = ("content", "bots", "errors")
+        if all(self._source(n, [])[0] != "access_log" for n in ("all",) + names):
+            return {
+                "total": self.count("all"),
+                "real_users": self.count("content"),
+                "bots": self.count("bots"),
+                "errors": self.count("errors"),
+            }
+        parts = []
+        params: List = []
+        for name in names:
+            clause, seg_params = self.segment_sql(name)
+            parts.append(f"COALESCE(SUM(CASE WHEN {clause} THEN 1 ELSE 0 END), 0)")
+            params.extend(seg_params)
+        where, where_params = self._where("all")
+        sql = (
+            f"SELECT COUNT(*) AS total, {parts[0]} AS real_users,"
+            f" {parts[1]} AS bots, {parts[2]} AS errors"
+            f" FROM {self._relation()} WHERE {where}"
+        )
+        row = self.query(sql, params + where_params)[0]
+        return {k: int(v) for k, v in row.items()}
@@ -16,6 +16,47 @@ IGNORED_REFERRERS = [
 ]
 
 
+def audience_segment(is_bot, is_admin_tech, method, path):
+    """Zielgruppe einer Logzeile: ``content``, ``bot``, ``admin`` oder ``other``.
+
+    ``content`` sind echte Seitenaufrufe: kein Bot, kein Admin-/Technikpfad,
+    ``GET`` und kein Pfad aus ``IGNORED_PATH_PREFIXES``.
+    """
+    if is_bot:
+        return "bot"
+    if is_admin_tech:
+        return "admin"
+    if method == "GET" and not path.startswith(IGNORED_PATH_PREFIXES):
+        return "content"
+    return "other"
+
+
+def referrer_host(referrer):
+    """Normalisierter Host eines Referrers (klein, ohne Port und ``www.``).
+
+    Für ``-``, leere Werte und Referrer ohne Host wird ``None`` geliefert.
+    """
+    if not referrer or referrer == "-":
+        return None
+    from urllib.parse import urlsplit
+
+    try:
+        host = urlsplit(referrer.strip()).hostname
+    except ValueError:
+        return None
+    if not host:
+        return None
+    return host[4:] if host.startswith("www.") else host
+
+
+def is_internal_referrer(host):
+    """True, wenn der Host zu ``IGNORED_REFERRERS`` gehört (inkl. Subdomains)."""
+    if not host:
+        return False
+    internal = {referrer_host(f"//{r}") for r in IGNORED_REFERRERS}
+    return any(host == h or host.endswith("." + h) for h in internal if h)
+
+
 def filter_content_paths(df):
     """Filtert technische Pfade aus dem DataFrame."""
     return df[~df["path"].str.startswith(IGNORED_PATH_PREFIXES)]
@@ -28,18 +69,3 @@ def filter_referrers(df):
     pattern = "|".join(re.escape(r) for r in IGNORED_REFERRERS)
     return df[~df["referrer"].str.contains(pattern, na=False)]
 
-
-def apply_date_filter(df, from_date, to_date):
-    import pandas as pd
-
-    if "timestamp" not in df.columns or df.empty:
-        return df
-    dfi = df.copy()
-    dfi["timestamp"] = pd.to_datetime(dfi["timestamp"])
-    if from_date:
-        dfi = dfi[dfi["timestamp"] >= pd.to_datetime(from_date)]
-    if to_date:
-        dfi = dfi[
-            dfi["timestamp"] < (pd.to_datetime(to_date) + pd.Timedelta(days=1))
-        ]
-    return dfi
@@ -1,26 +1,62 @@
+import os
+
 import geoip2.database
 
+# Obergrenze für den Cache von ``country_city``; wird sie überschritten,
+# beginnt der Cache von vorn.
+GEO_CACHE_SIZE = int(os.environ.get("GEO_CACHE_SIZE", 100000))
+
 
 class GeoIPLookup:
     _instance = None
-    """Singleton wrapper for GeoIP city lookups."""
+    """Singleton wrapper for GeoIP city and (optional) ASN lookups."""
 
-    def __new__(cls, db_path="./GeoLite2-City.mmdb"):
+    def __new__(cls, db_path="./GeoLite2-City.mmdb", asn_path=None):
         if cls._instance is None:
+            # MODE_MMAP: Prozesse teilen sich die Datenbank im Page-Cache
+            mode = geoip2.database.MODE_MMAP
             cls._instance = super().__new__(cls)
-            cls._instance.reader = geoip2.database.Reader(db_path)
+            cls._instance.reader = geoip2.database.Reader(db_path, mode=mode)
+            cls._instance.asn_reader = (
+                geoip2.database.Reader(asn_path, mode=mode)
+                if asn_path and os.path.exists(asn_path)
+                else None
+            )
             cls._instance._cache = {}
         return cls._instance
 
-    def country_city(self, ip):
-        if ip in self._cache:
-            return self._cache[ip]
+    def _city(self, ip):
         try:
             resp = self.reader.city(ip)
             country = resp.country.name or resp.country.iso_code or "?"
             city = resp.city.name or "-"
-            result = (country, city)
+            return (country, city)
         except Exception:
-            result = ("?", "-")
+            return ("?", "-")
+
+    def country_city(self, ip):
+        if ip in self._cache:
+            return self._cache[ip]
+        result = self._city(ip)
+        if len(self._cache) >= GEO_CACHE_SIZE:
+            self._cache.clear()
         self._cache[ip] = result
         return result
+
+    def asn(self, ip):
+        """(Nummer, Organisation) des autonomen Systems bzw. (None, None)."""
+        if self.asn_reader is None:
+            return (None, None)
+        try:
+            resp = self.asn_reader.asn(ip)
+            return (resp.autonomous_system_number, resp.autonomous_system_organization)
+        except Exception:
+            return (None, None)
+
+    def lookup_many(self, ips):
+        """(country, city, asn, asn_org) je IP, für ``AccessLogDB.update_ip_geo``.
+
+        Nicht auflösbare IPs erhalten wie bei ``country_city`` "?" und "-".
+        Am Cache vorbei, da das ETL jede IP nur einmal auflöst.
+        """
+        return [self._city(ip) + self.asn(ip) for ip in ips]
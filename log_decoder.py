@@ -0,0 +1,101 @@
+"""Schnelle Dekodierung der Felder einer Access-Log-Zeile.
+
+Die Funktionen liefern exakt dieselben Ergebnisse wie ``datetime.strptime``
+bzw. ``urlparse``/``parse_qs``, vermeiden deren Kosten aber für den Normalfall
+und cachen wiederkehrende Werte.
+"""
+
+import os
+from datetime import datetime
+from functools import lru_cache
+from urllib.parse import parse_qs, urlparse
+
+APACHE_TIME_FORMAT = "%d/%b/%Y:%H:%M:%S"
+MONTHS = {
+    "Jan": 1,
+    "Feb": 2,
+    "Mar": 3,
+    "Apr": 4,
+    "May": 5,
+    "Jun": 6,
+    "Jul": 7,
+    "Aug": 8,
+    "Sep": 9,
+    "Oct": 10,
+    "Nov": 11,
+    "Dec": 12,
+}
+MINUTE_CACHE_SIZE = 4096
+UTM_CACHE_SIZE = int(os.environ.get("UTM_CACHE_SIZE", 65536))
+
+
+@lru_cache(maxsize=MINUTE_CACHE_SIZE)
+def _minute_prefix(minute):
+    """ISO-Präfix ``YYYY-MM-DDTHH:MM`` für ``dd/Mon/YYYY:HH:MM``."""
+    ts = datetime(
+        int(minute[7:11]),
+        MONTHS[minute[3:6]],
+        int(minute[0:2]),
+        int(minute[12:14]),
+        int(minute[15:17]),
+    )
+    return ts.isoformat()[:16]
+
+
+def _is_fixed_width(raw):
+    return (
+        len(raw) == 20
+        and raw[2] == "/"
+        and raw[6] == "/"
+        and raw[11] == ":"
+        and raw[14] == ":"
+        and raw[17] == ":"
+        and raw[3:6] in MONTHS
+        and raw[0:2].isdigit()
+        and raw[7:11].isdigit()
+        and raw[12:14].isdigit()
+        and raw[15:17].isdigit()
+        and raw[18:20].isdigit()
+        and raw[18:20] < "60"
+        and raw.isascii()
+    )
+
+
+def parse_timestamp(value):
+    """Wandelt ``01/Jan/2021:10:00:00 +0000`` in ``2021-01-01T10:00:00`` um.
+
+    Die Zeitzone wird wie bisher ignoriert. Abweichende Formate laufen über
+    ``datetime.strptime`` und verhalten sich damit wie zuvor.
+    """
+    raw = value[:20]
+    if value[20:21] in ("", " ") and _is_fixed_width(raw):
+        try:
+            return f"{_minute_prefix(raw[:17])}:{raw[18:20]}"
+        except ValueError:
+            pass
+    return datetime.strptime(value.split()[0], APACHE_TIME_FORMAT).isoformat()
+
+
+def split_url(url):
+    """Zerlegt die Request-URL in ``(path, query)`` wie ``urlparse``.
+
+    Für gewöhnliche Pfade genügt ein ``partition('?')``; URLs mit Host,
+    Fragment oder ``;``-Parametern gehen weiter über ``urlparse``.
+    """
+    if url[:1] == "/" and url[1:2] != "/" and ";" not in url and "#" not in url:
+        path, _, query = url.partition("?")
+        return path, query
+    parsed = urlparse(url)
+    return parsed.path, parsed.query
+
+
+@lru_cache(maxsize=UTM_CACHE_SIZE)
+def extract_utm(referrer):
+    """Liest ``utm_source``, ``utm_medium`` und ``utm_campaign`` aus dem Referrer."""
+    utm_source = utm_medium = utm_campaign = None
+    if referrer and referrer != "-":
+        params = parse_qs(urlparse(referrer).query)
+        utm_source = params.get("utm_source", [None])[0]
+        utm_medium = params.get("utm_medium", [None])[0]
+        utm_campaign = params.get("utm_campaign", [None])[0]
+    return utm_source, utm_medium, utm_campaign
@@ -1,19 +1,35 @@
+import bz2
+import hashlib
+import io
 import os
+import queue
 import re
 import gzip
-import shutil
-from dataclasses import dataclass, replace
-from datetime import datetime
-from urllib.parse import urlparse, parse_qs
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from itertools import islice
+from typing import List, Optional
 import argparse
 import logging
 
-from bot_utils import is_bot
+from bot_utils import BOT_MATCHER, is_bot
+from log_decoder import extract_utm, parse_timestamp, split_url
 
 import paramiko
-from db_utils import AccessLogDB
+import parquet_store
+from db_utils import AccessLogDB, Checkpoint, fingerprint
+from sftp_fetch import COPY_BUFFER_SIZE, HEAD_BYTES, SFTPFetcher
 from utils import load_env
-from filters import IGNORED_PATH_PREFIXES
+from filters import IGNORED_PATH_PREFIXES, audience_segment
+from geo_utils import GeoIPLookup
+
+try:  # optional: zstd-komprimierte Logs
+    import zstandard
+except ImportError:  # pragma: no cover - abhängig von der Umgebung
+    zstandard = None
 
 load_env()
 
@@ -39,6 +55,20 @@ class ETLConfig:
     force_reload: bool
     db_file: str
     logfile_pattern: str
+    workers: int = 1
+    fetch_workers: int = 4
+    staged: bool = False
+    batch_size: int = 10000
+    rebuild_rollups: bool = False
+    refresh_referrers: bool = False
+    archive_dir: str = "./archive"
+    archive_months: List[str] = field(default_factory=list)
+    drop_months: List[str] = field(default_factory=list)
+    parquet_export: bool = False
+    parquet_dir: str = "./parquet"
+    geoip_db: str = "./geo/GeoLite2-City.mmdb"
+    asn_db: str = "./geo/GeoLite2-ASN.mmdb"
+    refresh_geo: bool = False
 
 
 def get_config() -> ETLConfig:
@@ -56,8 +86,17 @@ def get_config() -> ETLConfig:
         force_reload=os.environ.get("FORCE_RELOAD", "False").lower() == "true",
         db_file=os.environ.get("DB_FILE", "accesslog.db"),
         logfile_pattern=os.environ.get(
-            "LOGFILE_PATTERN", r"access\.log\.\d+(\.\d+)?(\.gz)?$"
+            "LOGFILE_PATTERN", r"access\.log\.\d+(\.\d+)?(\.(gz|bz2|zst))?$"
         ),
+        workers=int(os.environ.get("ETL_WORKERS", 1)),
+        fetch_workers=int(os.environ.get("SFTP_WORKERS", 4)),
+        staged=os.environ.get("ETL_STAGED", "False").lower() == "true",
+        batch_size=int(os.environ.get("ETL_BATCH_SIZE", 10000)),
+        archive_dir=os.environ.get("ARCHIVE_DIR", "./archive"),
+        parquet_export=os.environ.get("PARQUET_EXPORT", "False").lower() == "true",
+        parquet_dir=os.environ.get("PARQUET_DIR", "./parquet"),
+        geoip_db=os.environ.get("GEOIP_DB", "./geo/GeoLite2-City.mmdb"),
+        asn_db=os.environ.get("GEOIP_ASN_DB", "./geo/GeoLite2-ASN.mmdb"),
     )
 
 
@@ -78,6 +117,59 @@ def parse_args():
         choices=["bulk", "daily"],
         help="Override MODE from .env",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Override ETL_WORKERS from .env (parallel parse processes)",
+    )
+    parser.add_argument(
+        "--fetch-workers",
+        type=int,
+        help="Override SFTP_WORKERS from .env (parallel downloads)",
+    )
+    parser.add_argument(
+        "--staged",
+        action="store_true",
+        help="Load via a staging table and rebuild indexes afterwards "
+        "(ETL_STAGED, always on with --force-reload)",
+    )
+    parser.add_argument(
+        "--rebuild-rollups",
+        action="store_true",
+        help="Rebuild the pre-aggregated rollup tables from access_log",
+    )
+    parser.add_argument(
+        "--refresh-referrers",
+        action="store_true",
+        help="Recompute referrer hosts and internal flags (after changing "
+        "IGNORED_REFERRERS)",
+    )
+    parser.add_argument(
+        "--archive-month",
+        action="append",
+        default=[],
+        metavar="YYYY-MM",
+        help="Move a month partition into its own file in ARCHIVE_DIR",
+    )
+    parser.add_argument(
+        "--drop-month",
+        action="append",
+        default=[],
+        metavar="YYYY-MM",
+        help="Drop a month partition and its rollup rows",
+    )
+    parser.add_argument(
+        "--refresh-geo",
+        action="store_true",
+        help="Resolve country, city and ASN again for all known IPs (after "
+        "updating the GeoLite2 databases)",
+    )
+    parser.add_argument(
+        "--parquet",
+        action="store_true",
+        help="Export every changed day to PARQUET_DIR (PARQUET_EXPORT, "
+        "needs pyarrow)",
+    )
     return parser.parse_args()
 
 
@@ -89,16 +181,99 @@ LOG_PATTERN = re.compile(
 # Bot-Erkennung ueber externe Liste
 
 
-def clear_local_dir(local_dir):
-    """Löscht alle Dateien im lokalen Download-Ordner."""
-    for f in os.listdir(local_dir):
-        file_path = os.path.join(local_dir, f)
-        try:
-            if os.path.isfile(file_path):
-                os.unlink(file_path)
-                logger.info(f"Lösche lokale Datei: {file_path}")
-        except Exception as e:
-            logger.error(f"Fehler beim Löschen von {file_path}: {e}")
+# --- Checkpoints ---
+@dataclass
+class LogFile:
+    """Zu importierender Byte-Bereich einer lokalen Logdatei.
+
+    ``end is None`` steht für die ganze (komprimierte) Datei; ``checkpoint``
+    ist der Importstand, der nach erfolgreichem Import gespeichert wird.
+    """
+
+    path: str
+    checkpoint: Checkpoint
+    start: int = 0
+    end: Optional[int] = None
+
+    @property
+    def range(self):
+        return self.path, self.start, self.end
+
+
+def head_hash(head):
+    return hashlib.sha1(head).hexdigest()
+
+
+def resolve_offset(db, name, size, head):
+    """Byte-Offset, ab dem eine entfernte Datei noch nicht importiert ist.
+
+    Zuerst zählt der Checkpoint unter demselben Namen, sofern der Dateianfang
+    unverändert ist. Sonst wird über den Anfang nach einer rotierten Datei
+    gesucht (z. B. ``access.log.current`` -> ``access.log.1``).
+    """
+    cp = db.get_checkpoint(name)
+    if cp and cp.offset <= size and head_hash(head[: cp.head_size]) == cp.head_hash:
+        return cp.offset
+    if len(head) == HEAD_BYTES:
+        cp = db.find_checkpoint(head_hash(head), HEAD_BYTES)
+        if cp and cp.offset <= size:
+            return cp.offset
+    return 0
+
+
+def complete_length(path):
+    """Länge der Datei bis einschließlich des letzten Zeilenumbruchs."""
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        while pos > 0:
+            step = min(COPY_BUFFER_SIZE, pos)
+            f.seek(pos - step)
+            idx = f.read(step).rfind(b"\n")
+            if idx >= 0:
+                return pos - step + idx + 1
+            pos -= step
+    return 0
+
+
+def select_logfiles(attrs, mode, since=None):
+    """Wählt die zu importierenden Dateien aus ``listdir_attr``-Einträgen.
+
+    Im Daily-Modus sind das alle Dateien, die seit dem letzten Import geändert
+    wurden, mindestens aber die neueste Datei.
+    """
+    if mode != "daily" or not attrs:
+        return list(attrs)
+    newest = max(attrs, key=lambda a: a.st_mtime)
+    selected = [a for a in attrs if since is not None and a.st_mtime > since]
+    if newest not in selected:
+        selected.append(newest)
+    return selected
+
+
+def prepare_logfile(path, attr, db):
+    """Bestimmt den noch nicht importierten Bereich einer geladenen Datei.
+
+    Unkomprimierte Dateien werden ab dem Checkpoint-Offset bis zur letzten
+    vollständigen Zeile gelesen, komprimierte ganz, sofern sie neu oder
+    verändert sind. Gibt ``None`` zurück, wenn es nichts Neues gibt.
+    """
+    name = attr.filename
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(HEAD_BYTES)
+    offset = resolve_offset(db, name, size, head)
+    if is_compressed(name):
+        start, end, done = 0, None, size
+    else:
+        start, end = offset, complete_length(path)
+        done = end
+    if offset >= done:
+        logger.info(f"{name}: keine neuen Daten seit dem letzten Import.")
+        return None
+    checkpoint = Checkpoint(
+        name, size, int(attr.st_mtime), head_hash(head), len(head), done
+    )
+    return LogFile(path, checkpoint, start, end)
 
 
 # --- SFTP Download Funktion ---
@@ -106,67 +281,108 @@ def sftp_download_logs(config: ETLConfig):
     sftp_cfg = config.sftp
     local_dir = config.local_dir
     logfile_pattern = re.compile(config.logfile_pattern)
-    os.makedirs(local_dir, exist_ok=True)
-    clear_local_dir(local_dir)
     logger.info("Verbinde mit SFTP-Server ...")
     client = paramiko.Transport((sftp_cfg.host, sftp_cfg.port))
+    fetched = []
     try:
         client.connect(username=sftp_cfg.user, password=sftp_cfg.password)
-        sftp = paramiko.SFTPClient.from_transport(client)
-        files = sftp.listdir(".")
-        logger.info(f"Gefundene Dateien auf SFTP: {files}")
-
-        # Dateifilter: access.log.*, KEINE .gz, KEIN traffic.db, sftp.log, access.log.current
-        logfiles = [
-            f
-            for f in files
-            if logfile_pattern.match(f)
-            and f not in {"traffic.db", "sftp.log", "access.log.current"}
-        ]
-        logger.info(f"Logfiles nach Pattern-Match: {logfiles}")
-        if config.mode == "daily":
-            mtimes = [(f, sftp.stat(f).st_mtime) for f in logfiles]
-            if mtimes:
-                mtimes.sort(key=lambda x: x[1], reverse=True)
-                logfiles = [mtimes[0][0]]
-                logger.info(f"Daily Mode: Verarbeite nur Datei: {logfiles[0]}")
-            else:
-                logger.info("Daily Mode: Keine passenden Logfiles gefunden!")
-                logfiles = []
-        for fname in logfiles:
-            remote = fname
-            local = os.path.join(local_dir, fname)
-            if not os.path.exists(local):
-                logger.info(f"Lade {fname} ...")
-                sftp.get(remote, local)
-            else:
-                logger.info(f"{fname} existiert bereits lokal, wird übersprungen.")
+        with SFTPFetcher(
+            lambda: paramiko.SFTPClient.from_transport(client),
+            local_dir,
+            config.fetch_workers,
+        ) as fetcher:
+            attrs = fetcher.listdir_attr(".")
+            logger.info(f"Gefundene Dateien auf SFTP: {[a.filename for a in attrs]}")
+
+            # Dateifilter: access.log.* (auch komprimiert und access.log.current), KEIN traffic.db, sftp.log
+            attrs = [
+                a
+                for a in attrs
+                if (
+                    logfile_pattern.match(a.filename)
+                    or a.filename == "access.log.current"
+                )
+                and a.filename not in {"traffic.db", "sftp.log"}
+            ]
+            logger.info(f"Logfiles nach Pattern-Match: {[a.filename for a in attrs]}")
+            fetcher.prune(a.filename for a in attrs)
+            with AccessLogDB(config.db_file) as db:
+                attrs = select_logfiles(
+                    attrs, config.mode, db.latest_checkpoint_mtime()
+                )
+                if config.mode == "daily":
+                    logger.info(
+                        f"Daily Mode: Verarbeite geänderte Dateien: {[a.filename for a in attrs]}"
+                    )
+                attrs = sorted(attrs, key=lambda a: a.st_mtime)
+                for attr, path in zip(attrs, fetcher.fetch(attrs)):
+                    logfile = prepare_logfile(path, attr, db)
+                    if logfile:
+                        fetched.append(logfile)
     finally:
-        try:
-            sftp.close()
-        finally:
-            client.close()
-    # GZ entpacken falls nötig
-    for fname in logfiles:
-        if fname.endswith(".gz"):
-            gz_path = os.path.join(local_dir, fname)
-            out_path = os.path.join(local_dir, fname[:-3])
-            if not os.path.exists(out_path):
-                logger.info(f"Entpacke: {gz_path} -> {out_path}")
-                with gzip.open(gz_path, "rb") as f_in, open(out_path, "wb") as f_out:
-                    shutil.copyfileobj(f_in, f_out)
-            else:
-                logger.info(f"{out_path} existiert bereits lokal, wird übersprungen.")
-    # Gib alle Log-Dateien (entpackt, falls nötig) zurück
-    all_files = [
-        f
-        for f in os.listdir(local_dir)
-        if logfile_pattern.match(f)
-        and f != "access.log.current"
-        and not f.endswith(".gz")
-    ]
-    logger.info(f"Dateien für Import: {all_files}")
-    return [os.path.join(local_dir, f) for f in all_files]
+        client.close()
+    logger.info(f"Dateien für Import: {[f.path for f in fetched]}")
+    return fetched
+
+
+COMPRESSED_SUFFIXES = (".gz", ".bz2", ".zst")
+READ_BUFFER_SIZE = 1024 * 1024
+
+
+def is_compressed(filepath):
+    """True, wenn die Datei anhand ihrer Endung komprimiert ist."""
+    return filepath.endswith(COMPRESSED_SUFFIXES)
+
+
+class _RangeReader(io.RawIOBase):
+    """Liest höchstens ``length`` Bytes aus einer bereits positionierten Datei."""
+
+    def __init__(self, raw, length):
+        self._raw = raw
+        self._left = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._left <= 0:
+            return 0
+        view = memoryview(buffer)[: self._left]
+        n = self._raw.readinto(view)
+        self._left -= n
+        return n
+
+    def close(self):
+        self._raw.close()
+        super().close()
+
+
+def open_logfile(filepath, start=0, end=None):
+    """Öffnet eine Logdatei als Textstrom und entpackt .gz/.bz2/.zst dabei.
+
+    Es entsteht keine entpackte Kopie auf der Platte; Zeilenenden werden wie
+    beim normalen Textmodus behandelt. Unkomprimierte Dateien können auf den
+    Byte-Bereich ``[start, end)`` beschränkt werden.
+    """
+    if filepath.endswith(".gz"):
+        raw = gzip.open(filepath, "rb")
+    elif filepath.endswith(".bz2"):
+        raw = bz2.open(filepath, "rb")
+    elif filepath.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(
+                f"{filepath}: für .zst-Dateien wird das Paket 'zstandard' benötigt."
+            )
+        fh = open(filepath, "rb")
+        raw = zstandard.ZstdDecompressor().stream_reader(fh, closefd=True)
+    else:
+        raw = open(filepath, "rb", buffering=0)
+        if start or end is not None:
+            raw.seek(start)
+            if end is not None:
+                raw = _RangeReader(raw, end - start)
+    buffered = io.BufferedReader(raw, buffer_size=READ_BUFFER_SIZE)
+    return io.TextIOWrapper(buffered, encoding="utf-8")
 
 
 # --- Duplikat-Erkennung & DB-Initialisierung ---
@@ -177,82 +393,379 @@ def is_admin_tech(path):
     return path.startswith(IGNORED_PATH_PREFIXES)
 
 
-def extract_utm(referrer):
-    utm_source = utm_medium = utm_campaign = None
-    if referrer and referrer != "-":
-        params = parse_qs(urlparse(referrer).query)
-        utm_source = params.get("utm_source", [None])[0]
-        utm_medium = params.get("utm_medium", [None])[0]
-        utm_campaign = params.get("utm_campaign", [None])[0]
-    return utm_source, utm_medium, utm_campaign
+def parse_line(line):
+    """Parst eine Logzeile in einen Datensatz oder gibt None zurück."""
+    m = LOG_PATTERN.match(line)
+    if not m:
+        return None
+    d = m.groupdict()
+    d["timestamp"] = parse_timestamp(d["time"])
+    d["path"], d["query"] = split_url(d["url"])
+    d["is_bot"] = is_bot(d["user_agent"])
+    d["is_admin_tech"] = is_admin_tech(d["path"])
+    d["is_content"] = not d["is_admin_tech"]
+    utm_source, utm_medium, utm_campaign = extract_utm(d["referrer"])
+    d["utm_source"] = utm_source
+    d["utm_medium"] = utm_medium
+    d["utm_campaign"] = utm_campaign
+    # vhost wird nicht gebraucht, deshalb hier ignoriert!
+    return [
+        d["timestamp"],
+        d["ip"],
+        d["method"],
+        d["path"],
+        d["query"],
+        d["status"],
+        d["size"],
+        d["referrer"],
+        d["user_agent"],
+        d["is_bot"],
+        d["is_admin_tech"],
+        d["is_content"],
+        d["utm_source"],
+        d["utm_medium"],
+        d["utm_campaign"],
+        audience_segment(d["is_bot"], d["is_admin_tech"], d["method"], d["path"]),
+        fingerprint(
+            d["timestamp"], d["ip"], d["method"], d["path"], d["query"],
+            d["user_agent"],
+        ),
+    ]
 
 
-def process_logfile(filepath):
-    logger.info(f"Starte Verarbeitung von {filepath} ...")
+def parse_lines(lines):
+    """Parst alle Zeilen und gibt (Datensätze, Zeilenanzahl) zurück."""
     records = []
     total_lines = 0
-    with open(filepath, "r", encoding="utf-8") as f:
+    for line in lines:
+        total_lines += 1
+        record = parse_line(line)
+        if record is not None:
+            records.append(record)
+    return records, total_lines
+
+
+# --- Streaming-Pipeline ---
+BATCH_SIZE = CONFIG.batch_size
+QUEUE_SIZE = int(os.environ.get("ETL_QUEUE_SIZE", 4))
+CHUNK_SIZE = int(os.environ.get("ETL_CHUNK_SIZE", 32 * 1024 * 1024))
+
+
+def iter_logfile_batches(filepath, batch_size=BATCH_SIZE, start=0, end=None):
+    """Parst eine Logdatei zeilenweise und liefert Blöcke fester Größe.
+
+    Es wird nie mehr als ein Block gleichzeitig im Speicher gehalten.
+    ``start``/``end`` begrenzen unkomprimierte Dateien auf einen Byte-Bereich.
+    """
+    logger.info(f"Starte Verarbeitung von {filepath} ...")
+    total_lines = parsed = 0
+    batch = []
+    with open_logfile(filepath, start, end) as f:
         for line in f:
             total_lines += 1
-            m = LOG_PATTERN.match(line)
-            if not m:
+            record = parse_line(line)
+            if record is None:
+                continue
+            batch.append(record)
+            if len(batch) >= batch_size:
+                parsed += len(batch)
+                yield batch
+                batch = []
+    if batch:
+        parsed += len(batch)
+        yield batch
+    logger.info(
+        f"{parsed} von {total_lines} Zeilen in {filepath} erfolgreich geparst."
+    )
+
+
+def process_logfile(filepath):
+    """Parst eine komplette Logdatei in eine Liste (für kleine Dateien)."""
+    return [
+        record
+        for batch in iter_logfile_batches(filepath)
+        for record in batch
+    ]
+
+
+def split_logfile(filepath, chunk_size=CHUNK_SIZE, start=0, end=None):
+    """Teilt eine Datei in Byte-Bereiche, die jeweils an Zeilenanfängen liegen.
+
+    Komprimierte Dateien lassen sich nicht an beliebiger Stelle lesen und
+    bilden daher einen einzigen Abschnitt ``(datei, 0, None)``. Bei
+    unkomprimierten Dateien wird nur ``[start, end)`` aufgeteilt.
+    """
+    if is_compressed(filepath):
+        return [(filepath, 0, None)]
+    size = os.path.getsize(filepath) if end is None else end
+    bounds = [start]
+    with open(filepath, "rb") as f:
+        while bounds[-1] + chunk_size < size:
+            f.seek(bounds[-1] + chunk_size)
+            f.readline()
+            if f.tell() >= size:
+                break
+            bounds.append(f.tell())
+    bounds.append(size)
+    return [(filepath, a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def parse_chunk(chunk):
+    """Parst den Byte-Bereich ``(datei, start, ende)`` einer Logdatei.
+
+    Die Zeilen werden wie beim Lesen im Textmodus getrennt, damit das Ergebnis
+    exakt dem von ``process_logfile`` entspricht. Bei ``ende is None`` wird die
+    ganze (ggf. komprimierte) Datei gelesen; ``iter_batches`` reicht solche
+    Abschnitte nicht an den Prozesspool weiter, sondern liest sie blockweise.
+    """
+    filepath, start, end = chunk
+    if end is None:
+        with open_logfile(filepath) as f:
+            return parse_lines(f)
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return parse_lines(io.StringIO(data.decode("utf-8"), newline=None))
+
+
+def _as_range(f):
+    return (f, 0, None) if isinstance(f, str) else tuple(f)
+
+
+def iter_batches(files, workers=1, batch_size=BATCH_SIZE, chunk_size=CHUNK_SIZE):
+    """Liefert ``(datei, block)`` in Datei- und Zeilenreihenfolge.
+
+    ``files`` enthält Pfade oder Bereiche ``(datei, start, ende)``. Mit mehr
+    als einem Worker werden die Byte-Bereiche aller Dateien in einem
+    Prozesspool geparst. Es sind höchstens ``2 * workers`` Abschnitte
+    gleichzeitig in Arbeit, die Ergebnisse werden in Eingangsreihenfolge
+    weitergereicht.
+    """
+    ranges = [_as_range(f) for f in files]
+    if workers <= 1:
+        for f, start, end in ranges:
+            for batch in iter_logfile_batches(f, batch_size, start, end):
+                yield f, batch
+        return
+    chunks = (
+        c
+        for f, start, end in ranges
+        for c in split_logfile(f, chunk_size, start, end)
+    )
+    logger.info(f"Parse {len(files)} Datei(en) mit {workers} Prozessen ...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+
+        def submit(chunk):
+            # Komprimierte Dateien bilden einen einzigen Abschnitt; sie werden
+            # erst an der Reihe im Hauptprozess gestreamt, damit nie eine
+            # ganze Datei als ein Ergebnis im Speicher liegt
+            if chunk[2] is None:
+                return chunk, None
+            return chunk, pool.submit(parse_chunk, chunk)
+
+        pending = deque(submit(chunk) for chunk in islice(chunks, 2 * workers))
+        while pending:
+            (filepath, start, end), future = pending.popleft()
+            if future is None:
+                for chunk in islice(chunks, 1):
+                    pending.append(submit(chunk))
+                for batch in iter_logfile_batches(filepath, batch_size):
+                    yield filepath, batch
                 continue
-            d = m.groupdict()
-            ts = datetime.strptime(d["time"].split()[0], "%d/%b/%Y:%H:%M:%S")
-            d["timestamp"] = ts.isoformat()
-            d["path"] = urlparse(d["url"]).path
-            d["query"] = urlparse(d["url"]).query
-            d["is_bot"] = is_bot(d["user_agent"])
-            d["is_admin_tech"] = is_admin_tech(d["path"])
-            d["is_content"] = not d["is_admin_tech"]
-            utm_source, utm_medium, utm_campaign = extract_utm(d["referrer"])
-            d["utm_source"] = utm_source
-            d["utm_medium"] = utm_medium
-            d["utm_campaign"] = utm_campaign
-            # vhost wird nicht gebraucht, deshalb hier ignoriert!
-            records.append(
-                [
-                    d["timestamp"],
-                    d["ip"],
-                    d["method"],
-                    d["path"],
-                    d["query"],
-                    d["status"],
-                    d["size"],
-                    d["referrer"],
-                    d["user_agent"],
-                    d["is_bot"],
-                    d["is_admin_tech"],
-                    d["is_content"],
-                    d["utm_source"],
-                    d["utm_medium"],
-                    d["utm_campaign"],
-                ]
+            records, total_lines = future.result()
+            for chunk in islice(chunks, 1):
+                pending.append(submit(chunk))
+            logger.debug(
+                f"{len(records)} von {total_lines} Zeilen in {filepath} "
+                f"[{start}:{end}] erfolgreich geparst."
             )
+            for i in range(0, len(records), batch_size):
+                yield filepath, records[i:i + batch_size]
+
+
+@dataclass
+class StageStats:
+    """Durchsatzmessung einer Pipeline-Stufe."""
+
+    name: str
+    rows: int = 0
+    seconds: float = 0.0
+    waited: float = 0.0
+
+    def log(self):
+        rate = self.rows / self.seconds if self.seconds else 0.0
+        logger.info(
+            f"{self.name}: {self.rows} Zeilen in {self.seconds:.1f}s "
+            f"({rate:.0f} Zeilen/s), {self.waited:.1f}s gewartet."
+        )
+
+
+class BatchWriter(threading.Thread):
+    """Schreibt Blöcke aus einer begrenzten Queue in die Datenbank.
+
+    Ist die Queue voll, blockiert ``put`` den Parser (Backpressure), sodass
+    höchstens ``queue_size`` Blöcke zwischen Parsen und Schreiben liegen.
+    Checkpoints laufen durch dieselbe Queue und werden daher erst nach den
+    Zeilen ihrer Datei gespeichert. Mit ``staged=True`` läuft der Import über
+    die Staging-Tabelle von ``AccessLogDB.bulk_load`` und wird erst beim
+    Schließen in ``access_log`` übernommen.
+    """
+
+    def __init__(self, db_file, queue_size=QUEUE_SIZE, staged=False):
+        super().__init__(name="etl-writer", daemon=True)
+        self.db_file = db_file
+        self.staged = staged
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = StageStats("Schreiben")
+        self.results = {}
+        self.error = None
+
+    def run(self):
+        done = False
+        try:
+            with AccessLogDB(self.db_file) as db, db.bulk_load(self.staged):
+                while True:
+                    waited = time.perf_counter()
+                    item = self.queue.get()
+                    started = time.perf_counter()
+                    self.stats.waited += started - waited
+                    if item is None:
+                        done = True
+                        break
+                    if isinstance(item, Checkpoint):
+                        db.save_checkpoint(item)
+                        continue
+                    filepath, batch = item
+                    imported = db.insert_logs(batch, filepath)
+                    self.stats.seconds += time.perf_counter() - started
+                    self.stats.rows += len(batch)
+                    counts = self.results.setdefault(filepath, [0, 0])
+                    counts[0] += len(batch)
+                    counts[1] += imported
+                if self.staged:
+                    started = time.perf_counter()
+                    logger.info("Übernehme Staging-Tabelle nach access_log ...")
+                    for filepath, imported in db.merge_staging().items():
+                        self.results[filepath][1] += imported
+                    self.stats.seconds += time.perf_counter() - started
+        except Exception as e:
+            self.error = e
+            # Queue weiter leeren, damit der Parser nicht hängen bleibt; nach
+            # dem Endzeichen (Fehler beim Übernehmen) kommt nichts mehr
+            while not done and self.queue.get() is not None:
+                pass
+
+    def put(self, filepath, batch):
+        if self.error:
+            raise self.error
+        self.queue.put((filepath, batch))
+
+    def put_checkpoint(self, checkpoint):
+        """Speichert den Importstand, sobald alle vorherigen Blöcke geschrieben sind."""
+        if self.error:
+            raise self.error
+        self.queue.put(checkpoint)
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+        if self.error:
+            raise self.error
+
+
+def enrich_geo(config: ETLConfig) -> None:
+    """Löst Land, Stadt und ASN für neue IPs einmalig auf (``dim_ip``)."""
+    if not os.path.exists(config.geoip_db):
+        logger.warning(
+            f"GeoIP-Datenbank {config.geoip_db} fehlt, Geodaten werden übersprungen."
+        )
+        return
+    geoip = GeoIPLookup(config.geoip_db, config.asn_db)
+    started = time.perf_counter()
+    with AccessLogDB(config.db_file) as db:
+        resolved = db.update_ip_geo(geoip.lookup_many, refresh=config.refresh_geo)
     logger.info(
-        f"{len(records)} von {total_lines} Zeilen in {filepath} erfolgreich geparst."
+        f"Geodaten für {resolved} IPs in {time.perf_counter() - started:.1f} s"
+        " ergänzt."
     )
-    return records
 
 
 def main(config: ETLConfig = CONFIG):
-    files = sftp_download_logs(config)
-    total_imported = 0
     with AccessLogDB(config.db_file) as db:
         db.init_db(config.force_reload)
-        for f in files:
-            logger.info(f"Verarbeite: {f}")
-            data = process_logfile(f)
-            imported = db.insert_logs(data)
-            skipped = len(data) - imported
-            logger.info(f"{imported} neue Zeilen aus {f} importiert.")
-            logger.info(
-                f"{skipped} Zeilen aus {f} waren Duplikate und wurden übersprungen."
-            )
-            total_imported += imported
+        if config.rebuild_rollups:
+            logger.info("Baue Rollup-Tabellen neu auf ...")
+            db.rebuild_rollups()
+        if config.refresh_referrers:
+            changed = db.refresh_referrers()
+            logger.info(f"Referrer neu bewertet: {changed} geändert.")
+        for month in config.archive_months:
+            os.makedirs(config.archive_dir, exist_ok=True)
+            path = os.path.join(config.archive_dir, f"access_log_{month}.db")
+            rows = db.archive_partition(month, path)
+            logger.info(f"{rows} Zeilen aus {month} nach {path} archiviert.")
+        for month in config.drop_months:
+            db.drop_partition(month)
+            logger.info(f"Partition {month} gelöscht.")
+        if (
+            config.rebuild_rollups or config.refresh_referrers
+            or config.archive_months or config.drop_months
+        ):
+            db.bump_generation()
+        since_id = db.max_id()
+    files = sftp_download_logs(config)
+    checkpoints = {f.path: f.checkpoint for f in files}
+    writer = BatchWriter(config.db_file, staged=config.force_reload or config.staged)
+    writer.start()
+    parse_stats = StageStats("Parsen")
+    try:
+        current = None
+        started = time.perf_counter()
+        for f, batch in iter_batches(
+            [f.range for f in files], config.workers, config.batch_size
+        ):
+            parsed = time.perf_counter()
+            parse_stats.seconds += parsed - started
+            parse_stats.rows += len(batch)
+            if f != current and current in checkpoints:
+                writer.put_checkpoint(checkpoints.pop(current))
+            current = f
+            writer.put(f, batch)
+            started = time.perf_counter()
+            parse_stats.waited += started - parsed
+        for checkpoint in checkpoints.values():
+            writer.put_checkpoint(checkpoint)
+    finally:
+        writer.close()
+    parse_stats.log()
+    writer.stats.log()
+    if config.workers <= 1:
+        bot_cache = BOT_MATCHER.cache_stats()
+        logger.info(
+            f"Bot-Erkennung: {bot_cache['hits']} Cache-Treffer, "
+            f"{bot_cache['misses']} Fehlschläge ({bot_cache['hit_rate']:.1%})."
+        )
+    total_imported = 0
+    for f, (parsed, imported) in writer.results.items():
+        skipped = parsed - imported
+        logger.info(f"{imported} neue Zeilen aus {f} importiert.")
+        logger.info(
+            f"{skipped} Zeilen aus {f} waren Duplikate und wurden übersprungen."
+        )
+        total_imported += imported
     logger.info(
         f"Import abgeschlossen. Insgesamt {total_imported} Zeilen verarbeitet (nur neue gespeichert)."
     )
+    enrich_geo(config)
+    if config.parquet_export:
+        if config.force_reload:
+            parquet_store.clear_export(config.parquet_dir)
+        days = parquet_store.changed_days(config.db_file, since_id)
+        rows = parquet_store.export_days(config.db_file, days, config.parquet_dir)
+        logger.info(f"Parquet-Export: {len(days)} Tage, {rows} Zeilen.")
+    with AccessLogDB(config.db_file) as db:
+        generation = db.bump_generation()
+    logger.info(f"Daten-Generation {generation}: Dashboard-Cache wird verworfen.")
 
 
 if __name__ == "__main__":
@@ -262,4 +775,15 @@ if __name__ == "__main__":
         config.force_reload = args.force_reload
     if args.mode:
         config.mode = args.mode
+    if args.workers is not None:
+        config.workers = args.workers
+    if args.fetch_workers is not None:
+        config.fetch_workers = args.fetch_workers
+    config.rebuild_rollups = args.rebuild_rollups
+    config.refresh_referrers = args.refresh_referrers
+    config.archive_months = args.archive_month
+    config.drop_months = args.drop_month
+    config.parquet_export = config.parquet_export or args.parquet
+    config.refresh_geo = args.refresh_geo
+    config.staged = config.staged or args.staged
     main(config)
@@ -0,0 +1,178 @@
+"""Spaltenorientiertes Parquet-Archiv der Access-Logs und DuckDB-Zugriff.
+
+Der Import schreibt jeden geänderten Tag nach ``<dir>/date=YYYY-MM-DD/`` als
+Parquet-Datei; Textspalten sind dictionary-kodiert. ``connect`` öffnet eine
+eingebettete DuckDB, in der ``access_log`` dieselbe breite Form wie die
+SQLite-View hat, sodass die Abfragen aus ``db_utils`` unverändert laufen.
+Beide Pakete (``pyarrow``, ``duckdb``) sind optional.
+"""
+
+import calendar
+import glob
+import logging
+import os
+import shutil
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from typing import Iterable, List
+
+try:  # optional: Parquet-Export
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - abhängig von der Umgebung
+    pa = pq = None
+
+try:  # optional: DuckDB-Backend
+    import duckdb
+except ImportError:  # pragma: no cover - abhängig von der Umgebung
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+PARTITION_GLOB = "date=*/*.parquet"
+
+# Gespeicherte Spalten in der Reihenfolge der View ``access_log`` und ihr
+# Arrow-Typ; ``None`` steht für dictionary-kodierten Text. ``timestamp``
+# (ISO-Text) wird in DuckDB aus ``ts`` abgeleitet.
+COLUMNS = (
+    ("id", "int64"),
+    ("ip", None),
+    ("method", None),
+    ("path", None),
+    ("query", None),
+    ("status", "int64"),
+    ("size", "int64"),
+    ("referrer", None),
+    ("user_agent", None),
+    ("is_bot", "int64"),
+    ("is_admin_tech", "int64"),
+    ("is_content", "int64"),
+    ("utm_source", None),
+    ("utm_medium", None),
+    ("utm_campaign", None),
+    ("ts", "int64"),
+    ("flags", "int64"),
+    ("segment", "int64"),
+    ("fingerprint", "int64"),
+    ("referrer_host", None),
+    ("is_internal_referrer", "int64"),
+    ("country", None),
+    ("city", None),
+    ("asn", "int64"),
+    ("asn_org", None),
+)
+
+# Spalten der DuckDB-View ``access_log`` (wie ``AccessLogDB.VIEW_SELECT_SQL``)
+# Ohne Geodaten (ältere Exporte) wie in SQLite "?" bzw. "-"
+GEO_DEFAULTS = {"country": "?", "city": "-"}
+VIEW_COLUMNS = (
+    "id",
+    "strftime(epoch_ms(ts * 1000), '%Y-%m-%dT%H:%M:%S') AS timestamp",
+    *(
+        f"COALESCE({name}, '{GEO_DEFAULTS[name]}') AS {name}"
+        if name in GEO_DEFAULTS
+        else name
+        for name, _ in COLUMNS[1:]
+    ),
+)
+
+
+def _require(module, name: str):
+    if module is None:
+        raise RuntimeError(f"Für diese Funktion wird das Paket '{name}' benötigt.")
+    return module
+
+
+def day_dir(out_dir: str, day: str) -> str:
+    return os.path.join(out_dir, f"date={day}")
+
+
+def changed_days(db_file: str, since_id: int) -> List[str]:
+    """Tage (``YYYY-MM-DD``), in denen Zeilen mit ``id > since_id`` liegen."""
+    with closing(sqlite3.connect(db_file)) as con:
+        rows = con.execute(
+            "SELECT DISTINCT date(ts, 'unixepoch') FROM access_log WHERE id > ?"
+            " ORDER BY 1",
+            (since_id,),
+        ).fetchall()
+    return [day for (day,) in rows]
+
+
+def clear_export(out_dir: str) -> None:
+    """Entfernt alle exportierten Tage (z. B. vor einem ``--force-reload``)."""
+    for path in glob.glob(os.path.join(out_dir, "date=*")):
+        shutil.rmtree(path)
+
+
+def export_days(db_file: str, days: Iterable[str], out_dir: str) -> int:
+    """Schreibt die angegebenen Tage vollständig neu als Parquet.
+
+    Ein Tag wird immer als Ganzes ersetzt (über eine temporäre Datei), da
+    spätere Importe Zeilen zu einem bereits exportierten Tag ergänzen können.
+    Gibt die Anzahl geschriebener Zeilen zurück.
+    """
+    _require(pa, "pyarrow")
+    select = ", ".join(name for name, _ in COLUMNS)
+    written = 0
+    with closing(sqlite3.connect(db_file)) as con:
+        for day in days:
+            lower = calendar.timegm(datetime.fromisoformat(day).timetuple())
+            bounds = (lower, lower + 86400)
+            rows = con.execute(
+                f"SELECT {select} FROM access_log WHERE ts >= ? AND ts < ?"
+                " ORDER BY id",
+                bounds,
+            ).fetchall()
+            target = day_dir(out_dir, day)
+            if not rows:
+                shutil.rmtree(target, ignore_errors=True)
+                continue
+            os.makedirs(target, exist_ok=True)
+            path = os.path.join(target, "part-0.parquet")
+            pq.write_table(
+                _to_table(rows), path + ".tmp", use_dictionary=True,
+                compression="zstd",
+            )
+            os.replace(path + ".tmp", path)
+            written += len(rows)
+            logger.info(f"Parquet: {len(rows)} Zeilen für {day} geschrieben.")
+    return written
+
+
+def _to_table(rows: List[tuple]):
+    values = list(zip(*rows))
+    arrays = []
+    for (_, kind), column in zip(COLUMNS, values):
+        if kind is None:
+            arrays.append(pa.array(column, type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(column, type=pa.type_for_alias(kind)))
+    return pa.Table.from_arrays(arrays, names=[name for name, _ in COLUMNS])
+
+
+def connect(parquet_dir: str):
+    """Eingebettete DuckDB mit der View ``access_log`` über das Parquet-Archiv.
+
+    NULL-Werte werden wie in SQLite aufsteigend zuerst bzw. absteigend
+    zuletzt sortiert, damit beide Backends dieselbe Reihenfolge liefern.
+    """
+    con = _require(duckdb, "duckdb").connect()
+    con.execute("SET default_null_order = 'nulls_first_on_asc_last_on_desc'")
+    pattern = os.path.join(parquet_dir, PARTITION_GLOB)
+    if glob.glob(pattern):
+        # ältere Exporte ohne Geo-Spalten liefern dort NULL
+        source = "read_parquet('{}', union_by_name = true)".format(
+            pattern.replace("'", "''")
+        )
+    else:
+        source = "(SELECT {} WHERE false)".format(
+            ", ".join(
+                f"CAST(NULL AS {'VARCHAR' if kind is None else 'BIGINT'}) AS {name}"
+                for name, kind in COLUMNS
+            )
+        )
+    con.execute(
+        f"CREATE VIEW access_log AS SELECT {', '.join(VIEW_COLUMNS)} FROM {source}"
+    )
+    return con
@@ -0,0 +1,258 @@
+"""Optionaler, im Dashboard-Prozess gehaltener DataFrame der letzten Tage.
+
+Die Zeilen der letzten ``RESIDENT_DAYS`` Tage werden einmal geladen und in
+sparsamer Form gehalten: Texte als ``category``, Flags und Segment als
+``int8``, der Zeitstempel einmalig als ``datetime64``. Nach einem Import
+(neue Daten-Generation) werden nur Zeilen mit ``id > last_seen_id``
+nachgeladen. ``FrameStats`` beantwortet die Abfragen von ``AccessLogStats``
+für Zeiträume innerhalb des Fensters direkt aus dem DataFrame.
+"""
+
+import logging
+import os
+import threading
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from db_utils import (
+    DB_FILE,
+    AccessLogDB,
+    AccessLogStats,
+    epoch_seconds,
+    timestamp_bounds,
+)
+from utils import load_env
+
+load_env()
+
+logger = logging.getLogger(__name__)
+
+RESIDENT_DAYS = int(os.environ.get("RESIDENT_DAYS", 0))
+
+CATEGORY_COLUMNS = (
+    "ip",
+    "method",
+    "path",
+    "referrer",
+    "user_agent",
+    "utm_source",
+    "utm_medium",
+    "utm_campaign",
+    "referrer_host",
+)
+INT8_COLUMNS = (
+    "is_bot",
+    "is_admin_tech",
+    "is_content",
+    "segment",
+    "is_internal_referrer",
+)
+
+
+class ResidentFrame:
+    """Hält die Zeilen ab ``heute - days`` und lädt neue Zeilen nach."""
+
+    def __init__(self, days: int, db_file: str = DB_FILE):
+        self.days = days
+        self.db_file = db_file
+        self.df: Optional[pd.DataFrame] = None
+        self.window_start: Optional[str] = None
+        self.last_seen_id = 0
+        self.generation: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _load(self, since_id: int, start: str) -> pd.DataFrame:
+        columns = ("id", "ts", "status") + CATEGORY_COLUMNS + INT8_COLUMNS
+        df = AccessLogDB.get_dataframe(
+            f"SELECT {', '.join(columns)} FROM access_log WHERE id > ? AND ts >= ?",
+            params=[since_id, epoch_seconds(start)],
+            db_file=self.db_file,
+        )
+        df["timestamp"] = pd.to_datetime(df.pop("ts"), unit="s")
+        df["status"] = df["status"].astype("int16")
+        for column in CATEGORY_COLUMNS:
+            df[column] = df[column].astype("category")
+        for column in INT8_COLUMNS:
+            df[column] = df[column].astype("int8")
+        return df
+
+    def _append(self, new: pd.DataFrame) -> None:
+        frames = [self.df, new]
+        data = {}
+        for column in self.df.columns:
+            if column in CATEGORY_COLUMNS:
+                parts = [f[column] for f in frames]
+                # ein Block nur mit NULL hat Kategorien eines anderen Typs
+                dtype = next(
+                    (p.dtype for p in parts if len(p.cat.categories)), parts[0].dtype
+                )
+                data[column] = pd.api.types.union_categoricals(
+                    [p if len(p.cat.categories) else p.astype(dtype) for p in parts],
+                    sort_categories=True,
+                )
+            else:
+                data[column] = pd.concat([f[column] for f in frames], ignore_index=True)
+        self.df = pd.DataFrame(data)
+
+    def refresh(self, generation: int) -> None:
+        """Lädt neue Zeilen nach; bei Abweichung zur Datenbank alles neu."""
+        start = (date.today() - timedelta(days=self.days)).isoformat() + "T00:00:00"
+        if self.df is None or start != self.window_start:
+            self.df = self._load(0, start)
+            self.window_start = start
+        else:
+            new = self._load(self.last_seen_id, start)
+            if len(new):
+                self._append(new)
+        # gelöschte Partitionen oder ein Neuaufbau: vollständig neu laden
+        expected = AccessLogStats(db_file=self.db_file).query(
+            "SELECT COUNT(*) AS n FROM access_log WHERE ts >= ?",
+            [epoch_seconds(start)],
+        )[0]["n"]
+        if expected != len(self.df):
+            self.df = self._load(0, start)
+        self.last_seen_id = int(self.df["id"].max()) if len(self.df) else 0
+        self.generation = generation
+        logger.info(
+            f"Resident-Frame: {len(self.df)} Zeilen seit {start[:10]}, "
+            f"{self.df.memory_usage(deep=True).sum() / 2**20:.1f} MB"
+        )
+
+    def stats(self, from_date, to_date) -> Optional["FrameStats"]:
+        """``FrameStats`` für den Zeitraum oder None, wenn er nicht im Fenster liegt."""
+        probe = AccessLogStats(from_date, to_date, db_file=self.db_file)
+        with self._lock:
+            generation = probe.data_generation()
+            if self.df is None or generation != self.generation:
+                self.refresh(generation)
+            lower = timestamp_bounds(from_date, to_date)[0]
+            if lower is None or lower < self.window_start:
+                return None
+            return FrameStats(self.df, from_date, to_date, db_file=self.db_file)
+
+
+class FrameStats(AccessLogStats):
+    """``AccessLogStats`` auf einem ``ResidentFrame`` statt auf SQLite.
+
+    Liefert dieselben Ergebnisse wie die SQL-Variante; Schlüssel und
+    Spalten, die der Frame nicht hält, werden weiter per SQL beantwortet.
+    """
+
+    DERIVED_KEYS = {"date", "hour", "weekday", "combo"}
+
+    def __init__(self, df: pd.DataFrame, from_date=None, to_date=None, db_file=DB_FILE):
+        super().__init__(from_date, to_date, db_file=db_file, use_rollups=False)
+        self.df = df
+
+    def _rows(self, segment: str) -> pd.DataFrame:
+        df = self.df
+        lower, upper = timestamp_bounds(self.from_date, self.to_date)
+        mask = pd.Series(True, index=df.index)
+        if lower:
+            mask &= df["timestamp"] >= pd.Timestamp(lower)
+        if upper:
+            mask &= df["timestamp"] < pd.Timestamp(upper)
+        return df[mask & self._segment_mask(df, segment)]
+
+    @staticmethod
+    def _segment_mask(df: pd.DataFrame, segment: str) -> "pd.Series":
+        codes = AccessLogDB.SEGMENTS
+        if segment == "all":
+            return pd.Series(True, index=df.index)
+        if segment == "bots":
+            return df["segment"] == codes["bot"]
+        if segment == "errors":
+            return (df["status"] >= 400) & (df["status"] < 600)
+        content = df["segment"] == codes["content"]
+        if segment == "content":
+            return content
+        if segment == "utm":
+            return content & (
+                df["utm_source"].notna()
+                | df["utm_medium"].notna()
+                | df["utm_campaign"].notna()
+            )
+        if segment == "referrers":
+            return (
+                content
+                & df["referrer_host"].notna()
+                & (df["is_internal_referrer"] == 0)
+            )
+        raise ValueError(f"Unbekanntes Segment: {segment}")
+
+    def _key(self, rows: pd.DataFrame, key: str) -> "pd.Series":
+        if key == "date":
+            return rows["timestamp"].dt.normalize()
+        if key == "hour":
+            return rows["timestamp"].dt.hour
+        if key == "weekday":
+            return rows["timestamp"].dt.weekday
+        if key == "combo":
+            parts = [
+                rows[c].astype(object).where(rows[c].notna(), "–")
+                for c in ("utm_source", "utm_medium", "utm_campaign")
+            ]
+            return parts[0] + " | " + parts[1] + " | " + parts[2]
+        return rows[key]
+
+    def _supports(self, keys: Sequence[str]) -> bool:
+        return all(k in self.DERIVED_KEYS or k in self.df.columns for k in keys)
+
+    @staticmethod
+    def _values(key: str, column: "pd.Series") -> list:
+        """Spalte als Python-Werte, fehlende Werte als None (wie sqlite3)."""
+        if key == "date":
+            column = column.dt.strftime("%Y-%m-%d")
+        column = column.astype(object)
+        return column.where(column.notna(), None).tolist()
+
+    def counts(
+        self,
+        keys: Sequence[str],
+        segment: str = "all",
+        limit: Optional[int] = None,
+        order: str = "hits",
+        skip_null: bool = False,
+    ) -> List[Dict]:
+        keys = list(keys)
+        if not self._supports(keys):
+            return super().counts(keys, segment, limit, order, skip_null)
+        rows = self._rows(segment)
+        table = pd.DataFrame({k: self._key(rows, k) for k in keys}, index=rows.index)
+        grouped = table.groupby(keys, dropna=skip_null, observed=True, sort=False)
+        result = grouped.size().reset_index(name="hits")
+        # Sortierung wie in SQLite: nach Werten, nicht nach Kategorie-Codes
+        for key in keys:
+            if key != "date":
+                result[key] = result[key].astype(object)
+        by = ["hits"] + keys if order == "hits" else keys
+        result = result.sort_values(
+            by,
+            ascending=[k != "hits" for k in by],
+            na_position="first",
+            kind="mergesort",
+        )
+        if limit:
+            result = result.head(int(limit))
+        columns = [self._values(k, result[k]) for k in keys]
+        columns.append(result["hits"].tolist())
+        names = keys + ["hits"]
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
+    def count(self, segment: str = "all") -> int:
+        return int(len(self._rows(segment)))
+
+    def distinct(self, column: str, segment: str = "all") -> int:
+        if column not in self.df.columns:
+            return super().distinct(column, segment)
+        return int(self._rows(segment)[column].nunique())
+
+    def kpis(self) -> Dict[str, int]:
+        return {
+            "total": self.count("all"),
+            "real_users": self.count("content"),
+            "bots": self.count("bots"),
+            "errors": self.count("errors"),
+        }
@@ -0,0 +1,97 @@
+"""LRU-Cache für berechnete Dashboard-Ansichten mit Speicherbudget.
+
+Einträge gelten für eine Daten-Generation (siehe
+``AccessLogDB.bump_generation``); ändert sie sich, wird der Cache beim
+nächsten Zugriff geleert. Die Größe eines Eintrags wird über die Länge
+seiner Pickle-Darstellung abgeschätzt.
+"""
+
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Tuple
+
+from utils import load_env
+
+load_env()
+
+CACHE_BUDGET_MB = float(os.environ.get("DASHBOARD_CACHE_MB", 64))
+
+
+class ResultCache:
+    """Thread-sicherer LRU-Cache mit Obergrenze in Bytes."""
+
+    def __init__(self, max_bytes: int = int(CACHE_BUDGET_MB * 2**20)):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[object, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get_or_compute(
+        self, key: Hashable, generation: int, compute: Callable[[], object]
+    ) -> object:
+        """Liefert den gespeicherten Wert oder berechnet und speichert ihn.
+
+        Der Wert wird außerhalb der Sperre berechnet; gleichzeitige Anfragen
+        zum selben Schlüssel rechnen daher ggf. doppelt.
+        """
+        with self._lock:
+            self._check_generation(generation)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        value = compute()
+        self.put(key, generation, value)
+        return value
+
+    def put(self, key: Hashable, generation: int, value: object) -> None:
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            self._check_generation(generation)
+            if generation != self._generation or size > self.max_bytes:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def _check_generation(self, generation: int) -> None:
+        # nur vorwärts: ein Nachzügler mit alter Generation leert nichts
+        if self._generation is None or generation > self._generation:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.bytes = 0
+            self._generation = generation
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Trefferstatistik und Belegung des Caches."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "generation": self._generation,
+            }
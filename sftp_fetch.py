@@ -0,0 +1,166 @@
+"""Paralleler, fortsetzbarer Download von Logdateien per SFTP.
+
+Ein lokales Manifest merkt sich Größe und Änderungszeit jeder geladenen
+Datei, sodass unveränderte Dateien nicht erneut übertragen werden. Gewachsene
+Dateien und abgebrochene Downloads (``*.part``) werden ab der vorhandenen
+Länge fortgesetzt.
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = ".manifest.json"
+PART_SUFFIX = ".part"
+HEAD_BYTES = 1024
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class FetchManifest:
+    """Lokales Verzeichnis der geladenen Dateien (Name -> Größe, mtime)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries: Dict[str, Dict] = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def is_current(self, name: str, size: int, mtime: int) -> bool:
+        entry = self.entries.get(name)
+        return bool(entry) and entry["size"] == size and entry["mtime"] == mtime
+
+    def update(self, name: str, size: int, mtime: int) -> None:
+        with self._lock:
+            self.entries[name] = {"size": size, "mtime": mtime}
+            self._save()
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            if self.entries.pop(name, None) is not None:
+                self._save()
+
+    def _save(self) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+class SFTPFetcher:
+    """Lädt Dateien über mehrere SFTP-Kanäle gleichzeitig in ``local_dir``.
+
+    ``connect`` liefert bei jedem Aufruf einen neuen SFTP-Client (z. B. einen
+    weiteren Kanal auf demselben ``paramiko.Transport``); jeder Worker-Thread
+    verwendet seinen eigenen.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], object],
+        local_dir: str,
+        workers: int = 4,
+        manifest: FetchManifest = None,
+    ):
+        self.connect = connect
+        self.local_dir = local_dir
+        self.workers = max(1, workers)
+        os.makedirs(local_dir, exist_ok=True)
+        self.manifest = manifest or FetchManifest(
+            os.path.join(local_dir, MANIFEST_FILE)
+        )
+        self._local = threading.local()
+        self._clients: List[object] = []
+        self._clients_lock = threading.Lock()
+
+    def client(self):
+        """SFTP-Client des aktuellen Threads (wird bei Bedarf geöffnet)."""
+        sftp = getattr(self._local, "sftp", None)
+        if sftp is None:
+            sftp = self._local.sftp = self.connect()
+            with self._clients_lock:
+                self._clients.append(sftp)
+        return sftp
+
+    def close(self) -> None:
+        with self._clients_lock:
+            clients, self._clients = self._clients, []
+        for sftp in clients:
+            sftp.close()
+        self._local = threading.local()
+
+    def __enter__(self) -> "SFTPFetcher":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def listdir_attr(self, path: str = ".") -> List:
+        return self.client().listdir_attr(path)
+
+    def fetch(self, attrs: Iterable) -> List[str]:
+        """Lädt alle Dateien parallel und gibt die lokalen Pfade zurück."""
+        attrs = list(attrs)
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="sftp-fetch"
+        ) as pool:
+            return list(pool.map(self.fetch_one, attrs))
+
+    def fetch_one(self, attr) -> str:
+        """Lädt eine Datei bzw. den fehlenden Rest und liefert den lokalen Pfad."""
+        name, size, mtime = attr.filename, attr.st_size, int(attr.st_mtime)
+        local = os.path.join(self.local_dir, name)
+        if self.manifest.is_current(name, size, mtime) and os.path.exists(local):
+            logger.info(f"{name} ist unverändert, wird übersprungen.")
+            return local
+        part = local + PART_SUFFIX
+        if not os.path.exists(part) and os.path.exists(local):
+            os.replace(local, part)
+        with self.client().open(name, "rb") as remote:
+            offset = self._resume_offset(remote, part, size)
+            if offset:
+                logger.info(f"Setze {name} ab Byte {offset} von {size} fort ...")
+            else:
+                logger.info(f"Lade {name} ...")
+            remote.seek(offset)
+            if hasattr(remote, "prefetch"):
+                remote.prefetch(size)
+            with open(part, "ab" if offset else "wb") as out:
+                shutil.copyfileobj(remote, out, COPY_BUFFER_SIZE)
+        os.replace(part, local)
+        self.manifest.update(name, size, mtime)
+        return local
+
+    @staticmethod
+    def _resume_offset(remote, part: str, size: int) -> int:
+        """Länge der Teildatei, sofern sie ein Anfangsstück der Quelle ist."""
+        if not os.path.exists(part):
+            return 0
+        have = os.path.getsize(part)
+        if have == 0 or have > size:
+            return 0
+        with open(part, "rb") as f:
+            head = f.read(HEAD_BYTES)
+        remote.seek(0)
+        return have if remote.read(len(head)) == head else 0
+
+    def prune(self, keep: Iterable[str]) -> None:
+        """Entfernt lokale Kopien von Dateien, die es entfernt nicht mehr gibt."""
+        keep = set(keep)
+        for name in list(self.manifest.entries):
+            if name in keep:
+                continue
+            local = os.path.join(self.local_dir, name)
+            for path in (local, local + PART_SUFFIX):
+                if os.path.exists(path):
+                    os.unlink(path)
+                    logger.info(f"Lösche lokale Datei: {path}")
+            self.manifest.remove(name)
@@ -17,6 +17,7 @@ def redirect(location):
 class RequestHolder:
     def __init__(self):
         self.args = {}
+        self.headers = {}
 
 request = RequestHolder()
 
@@ -51,17 +52,19 @@ class Flask:
         return Client()
 
     @contextlib.contextmanager
-    def test_request_context(self, path):
+    def test_request_context(self, path, headers=None):
         global request, flask_stub
         parsed = urlparse(path)
         args = dict(parse_qsl(parsed.query))
-        old_args = request.args
+        old_args, old_headers = request.args, request.headers
         request.args = args
+        request.headers = headers or {}
         flask_stub.request = request
         try:
             yield
         finally:
             request.args = old_args
+            request.headers = old_headers
             flask_stub.request = request
 
 
@@ -78,7 +81,10 @@ sys.modules.setdefault("paramiko", paramiko_stub)
 
 # Minimal geoip2 stub
 geoip2_stub = types.ModuleType("geoip2")
-geoip2_stub.database = types.SimpleNamespace(Reader=lambda path: types.SimpleNamespace(city=lambda ip: None))
+geoip2_stub.database = types.SimpleNamespace(
+    MODE_MMAP=1,
+    Reader=lambda path, mode=None: types.SimpleNamespace(city=lambda ip: None),
+)
 sys.modules.setdefault("geoip2", geoip2_stub)
 sys.modules.setdefault("geoip2.database", geoip2_stub.database)
 
@@ -92,6 +98,8 @@ sys.modules.setdefault("plotly.io", plotly_stub.io)
 plotly_stub.graph_objs.Bar = lambda *a, **k: None
 plotly_stub.graph_objs.Scatter = lambda *a, **k: None
 plotly_stub.graph_objs.Pie = lambda *a, **k: None
+plotly_stub.offline = types.SimpleNamespace(get_plotlyjs=lambda: "/* plotly.js */")
+sys.modules.setdefault("plotly.offline", plotly_stub.offline)
 
 # Minimal pandas stub
 pandas_stub = types.ModuleType('pandas')
@@ -18,42 +18,144 @@ def test_root_redirect():
     assert resp.headers["Location"].endswith("/overview")
 
 
-class FakeSeries(list):
-    def astype(self, typ):
-        return FakeSeries([typ(x) if x is not None else 0 for x in self])
-
-    def fillna(self, val):
-        return FakeSeries([val if x is None else x for x in self])
-
-
-class FakeDataFrame(dict):
-    def __contains__(self, item):
-        return dict.__contains__(self, item)
-
-    def __getitem__(self, item):
-        return dict.__getitem__(self, item)
-
-    def __setitem__(self, key, value):
-        dict.__setitem__(self, key, value)
-
-
-def test_get_df_filtered(monkeypatch):
-    df = FakeDataFrame({
-        "is_bot": FakeSeries([0, 1]),
-        "is_content": FakeSeries([1, 0]),
-        "is_admin_tech": FakeSeries([0, None]),
-    })
-
-    monkeypatch.setattr(ad.AccessLogDB, "load_access_logs", staticmethod(lambda: df))
-    monkeypatch.setattr(ad, "apply_date_filter", lambda d, f, t: d)
+def test_get_stats(monkeypatch):
     monkeypatch.setattr(ad, "get_date_params", lambda: ("2021-01-01", "2021-01-31"))
 
     with ad.app.test_request_context("/overview"):
-        result_df, params, f_from, f_to = ad.get_df_filtered()
+        stats, params, f_from, f_to = ad.get_stats()
 
-    assert isinstance(result_df, FakeDataFrame)
-    assert result_df["is_admin_tech"] == [0, 0]
+    assert isinstance(stats, ad.AccessLogStats)
+    assert (stats.from_date, stats.to_date) == ("2021-01-01", "2021-01-31")
     assert f_from == "2021-01-01"
     assert f_to == "2021-01-31"
     assert params == {}
 
+
+def fetch_widget(tab, widget, query, headers=None):
+    with ad.app.test_request_context(f"/api/{tab}/{widget}?{query}", headers):
+        return ad.widget_api(tab, widget)
+
+
+def test_overview(monkeypatch, tmp_path):
+    from tests.test_db_utils import make_stats_db
+
+    from db_utils import AccessLogDB
+
+    db_path = make_stats_db(tmp_path)
+    with AccessLogDB(db_path) as db:
+        db.update_ip_geo(lambda ips: [
+            ("DE", "Berlin", 3320, "DTAG") if ip == "2.2.2.2" else ("?", "-", None, None)
+            for ip in ips
+        ])
+    stats_cls = ad.AccessLogStats
+    monkeypatch.setattr(ad, "AccessLogStats", lambda f, t: stats_cls(f, t, db_file=db_path))
+    monkeypatch.setattr(ad, "to_plotly_figure", lambda x, y, *a, **k: (list(x), list(y)))
+
+    with ad.app.test_request_context("/overview?from=2021-01-04&to=2021-01-05"):
+        template, ctx = ad.overview()
+    assert template[0] == "overview.html"
+    assert ctx["tab_api_url"].startswith("/tab_api?tab=overview")
+    with ad.app.test_request_context("/overview?tab=x&_external=1&from=2021-01-04"):
+        _, ctx = ad.overview()
+    assert ctx["tab_api_url"] == "/tab_api?tab=overview&from=2021-01-04"
+
+    query = "from=2021-01-04&to=2021-01-05"
+    data = {w: fetch_widget("overview", w, query)[0] for w in ad.WIDGETS["overview"]}
+    assert data["kpis"]["values"]["total"] == 5
+    assert data["kpis"]["values"]["unique_users"] == 2
+    assert data["hourly"]["values"]["peak_hour"] == 10
+    assert data["hourly"]["chart"] == ([10, 11], [2, 1])
+    assert data["top_pages"]["rows"][0] == {"path": "/blog", "hits": 2}
+    assert data["top_bots"]["rows"] == [{"user_agent": "Googlebot", "hits": 1}]
+    assert data["geo"]["rows"] == [
+        {"country": "DE", "city": "Berlin", "hits": 2},
+        {"country": "?", "city": "-", "hits": 1},
+    ]
+
+
+def test_widgets_are_cached_per_generation(monkeypatch, tmp_path):
+    from db_utils import AccessLogDB
+    from tests.test_db_utils import make_stats_db
+
+    db_path = make_stats_db(tmp_path)
+    stats_cls = ad.AccessLogStats
+    monkeypatch.setattr(ad, "AccessLogStats", lambda f, t: stats_cls(f, t, db_file=db_path))
+    monkeypatch.setattr(ad, "RESULT_CACHE", ad.ResultCache())
+    calls = []
+    detail = ad.errors_detail
+    monkeypatch.setitem(
+        ad.WIDGETS["errors"], "detail", lambda s: calls.append(1) or detail(s)
+    )
+
+    for query in ("from=2021-01-04&to=2021-01-05",
+                  "from=2021-01-04T00:00:00&to=2021-01-05"):
+        data, status, headers = fetch_widget("errors", "detail", query)
+    assert len(calls) == 1
+    assert status == 200
+    assert data["rows"][0]["hits"] == 1
+    assert ad.cache_stats()["hits"] == 1
+
+    etag = headers["ETag"]
+    assert headers["Cache-Control"] == "no-cache"
+    body, status, _ = fetch_widget(
+        "errors", "detail", "from=2021-01-04&to=2021-01-05", {"If-None-Match": etag}
+    )
+    assert (body, status) == ("", 304)
+    # anderer Zeitraum, anderes ETag
+    assert fetch_widget("errors", "detail", "from=2021-01-03")[2]["ETag"] != etag
+
+    with AccessLogDB(db_path) as db:
+        db.bump_generation()
+    _, status, headers = fetch_widget(
+        "errors", "detail", "from=2021-01-04&to=2021-01-05", {"If-None-Match": etag}
+    )
+    assert status == 200 and headers["ETag"] != etag
+    assert len(calls) == 3
+
+
+def test_unknown_widget():
+    assert ad.widget_api("overview", "nope")[1] == 404
+
+
+def test_plotly_js_is_served_once_per_version():
+    body, digest = ad.plotly_bundle()
+    content, status, headers = ad.plotly_js(digest)
+    assert (content, status) == (body, 200)
+    assert "immutable" in headers["Cache-Control"]
+    assert ad.plotly_js("outdated")[1] == 404
+
+
+def test_tab_widgets_run_concurrently(monkeypatch, tmp_path, caplog):
+    import threading
+
+    from tests.test_db_utils import make_stats_db
+
+    db_path = make_stats_db(tmp_path)
+    stats_cls = ad.AccessLogStats
+    monkeypatch.setattr(ad, "AccessLogStats", lambda f, t: stats_cls(f, t, db_file=db_path))
+    monkeypatch.setattr(ad, "RESULT_CACHE", ad.ResultCache())
+    threads = set()
+    # jedes Widget wartet, bis alle anderen ebenfalls laufen; nacheinander
+    # ausgeführt bricht die Barriere nach dem Timeout
+    barrier = threading.Barrier(len(ad.WIDGETS["errors"]), timeout=10)
+
+    def together(compute):
+        def run(stats):
+            threads.add(threading.get_ident())
+            barrier.wait()
+            return compute(stats)
+        return run
+
+    for name, compute in list(ad.WIDGETS["errors"].items()):
+        monkeypatch.setitem(ad.WIDGETS["errors"], name, together(compute))
+
+    caplog.set_level("INFO", logger=ad.logger.name)
+    with ad.app.test_request_context("/api/errors?from=2021-01-04&to=2021-01-05"):
+        data, status, _ = ad.tab_api("errors")
+    assert not barrier.broken
+    assert status == 200
+    assert set(data) == set(ad.WIDGETS["errors"])
+    assert data["detail"]["rows"][0]["hits"] == 1
+    assert len(threads) == 3
+    assert "Widget errors/detail:" in caplog.text
+    assert ad.tab_api("nope")[1] == 404
@@ -1,6 +1,7 @@
 import re
 
-from bot_utils import load_bot_list, is_bot
+import bot_utils
+from bot_utils import BotMatcher, load_bot_list, is_bot
 
 
 def test_load_bot_list(tmp_path):
@@ -11,7 +12,36 @@ def test_load_bot_list(tmp_path):
 
 
 def test_is_bot(monkeypatch):
-    pattern = re.compile("bot", re.I)
-    monkeypatch.setattr("bot_utils.BOT_PATTERN", pattern)
+    monkeypatch.setattr("bot_utils.BOT_MATCHER", BotMatcher(["bot"]))
     assert is_bot("GreatBot/1.0")
     assert not is_bot("Mozilla/5.0")
+    assert not is_bot(None)
+
+
+def test_matcher_agrees_with_regex():
+    rules = load_bot_list("bot_user_agents.txt") + ["Bot", "she", "hers", "his"]
+    rules = sorted(set(rules))
+    pattern = re.compile("|".join(re.escape(r) for r in rules), re.I)
+    matcher = BotMatcher(rules)
+    agents = [
+        "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Firefox/120.0",
+        "ushers", "HIS and hers", "", None, "curl/8.0", "python-requests/2.31",
+        "Mozilla/5.0 (compatible; AhrefsBot/7.0)",
+    ]
+    for ua in agents:
+        m = pattern.search((ua or "").lower())
+        expected = m and next(r for r in rules if r.lower() == m.group(0))
+        assert matcher.is_bot(ua) == bool(m)
+        assert matcher.match(ua) == (expected or None)
+
+
+def test_matcher_reports_rule_and_stats():
+    matcher = BotMatcher(["bingbot", "bot", "crawler"])
+    assert matcher.match("Mozilla (bingbot)") == "bingbot"
+    assert matcher.match("Mozilla (bingbot)") == "bingbot"
+    assert matcher.audit(["a crawler", "x"]) == {"bingbot": 0, "bot": 0, "crawler": 1}
+    stats = matcher.cache_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 3
+    assert BotMatcher([]).is_bot("anything")
+    assert bot_utils.BOT_MATCHER.rules == bot_utils.BOT_USER_AGENTS
@@ -1,5 +1,8 @@
+import os
 import sqlite3
 
+import pytest
+
 import db_utils as du
 
 
@@ -35,3 +38,443 @@ def test_insert_logs(tmp_path):
         assert inserted == 1
         inserted_none = db.insert_logs([])
         assert inserted_none == 0
+
+
+def _record(ts, ip='1.1.1.1', method='GET', path='/blog', status=200,
+            referrer='-', ua='Mozilla', bot=False, utm=(None, None, None)):
+    admin = path.startswith(('/wp-admin', '/wp-login.php'))
+    return (ts, ip, method, path, '', status, '0', referrer, ua,
+            bot, admin, not admin) + tuple(utm)
+
+
+def make_stats_db(tmp_path):
+    db_path = str(tmp_path / 'stats.db')
+    records = [
+        _record('2021-01-04T10:00:00', referrer='https://google.com/?q=1'),
+        _record('2021-01-04T10:05:00', ip='2.2.2.2', referrer='https://leichtgesagt.blog/x'),
+        _record('2021-01-05T11:00:00', ip='2.2.2.2', path='/other',
+                utm=('news', None, None)),
+        _record('2021-01-05T12:00:00', path='/wp-login.php', status=404),
+        _record('2021-01-05T12:30:00', ua='Googlebot', bot=True, status=500),
+        _record('2021-01-07T09:00:00', method='POST'),
+    ]
+    with du.AccessLogDB(db_path) as db:
+        db.init_db(force_reload=True)
+        db.insert_logs(records)
+    return db_path
+
+
+def test_access_log_stats(tmp_path):
+    db_path = make_stats_db(tmp_path)
+    stats = du.AccessLogStats('2021-01-04', '2021-01-05', db_file=db_path)
+    assert stats.kpis() == {'total': 5, 'real_users': 3, 'bots': 1, 'errors': 2}
+    assert stats.distinct('ip', 'content') == 2
+    assert stats.counts(['path'], 'content', limit=1) == [{'path': '/blog', 'hits': 2}]
+    assert stats.counts(['hour'], 'content', order='key') == [
+        {'hour': 10, 'hits': 2}, {'hour': 11, 'hits': 1}
+    ]
+    assert stats.counts(['weekday'], 'content', order='key') == [
+        {'weekday': 0, 'hits': 2}, {'weekday': 1, 'hits': 1}
+    ]
+    assert stats.counts(['referrer'], 'referrers') == [
+        {'referrer': 'https://google.com/?q=1', 'hits': 1}
+    ]
+    assert stats.counts(['referrer_host'], 'referrers') == [
+        {'referrer_host': 'google.com', 'hits': 1}
+    ]
+    assert stats.counts(['combo'], 'utm') == [{'combo': 'news | – | –', 'hits': 1}]
+    assert stats.counts(['utm_medium'], 'utm', skip_null=True) == []
+    assert stats.counts(['status', 'path'], 'errors') == [
+        {'status': 404, 'path': '/wp-login.php', 'hits': 1},
+        {'status': 500, 'path': '/blog', 'hits': 1},
+    ]
+
+    everything = du.AccessLogStats(db_file=db_path)
+    assert everything.count() == 6
+    with pytest.raises(ValueError):
+        everything.counts(['nope'])
+
+
+def test_rollups_match_raw_queries(tmp_path):
+    db_path = make_stats_db(tmp_path)
+    rolled = du.AccessLogStats('2021-01-04', '2021-01-05', db_file=db_path)
+    raw = du.AccessLogStats('2021-01-04', '2021-01-05', db_file=db_path, use_rollups=False)
+    assert rolled._source('content', ['path'])[0] == 'rollup_hour_path'
+    assert rolled._source('errors', ['ip'])[0] == 'access_log'
+    queries = [
+        (['path'], 'content'), (['hour'], 'content'), (['weekday'], 'content'),
+        (['user_agent'], 'bots'), (['path'], 'bots'), (['date'], 'bots'),
+        (['status', 'path'], 'errors'), (['status'], 'errors'),
+        (['referrer'], 'referrers'), (['referrer_host'], 'referrers'),
+        (['combo'], 'utm'), (['date'], 'utm'),
+        (['utm_source'], 'utm'),
+    ]
+    for keys, segment in queries:
+        assert rolled.counts(keys, segment) == raw.counts(keys, segment)
+    assert rolled.kpis() == raw.kpis()
+
+    partial = du.AccessLogStats('2021-01-04T10:30:00', None, db_file=db_path)
+    assert partial._source('content', ['path'])[0] == 'access_log'
+
+
+def test_rollups_ignore_duplicates_and_rebuild(tmp_path):
+    db_path = make_stats_db(tmp_path)
+    stats = du.AccessLogStats(db_file=db_path)
+    before = stats.counts(['path'], 'all')
+    with du.AccessLogDB(db_path) as db:
+        db.init_db()
+        assert db.insert_logs([_record('2021-01-04T10:00:00', referrer='https://google.com/?q=1')]) == 0
+        assert stats.counts(['path'], 'all') == before
+        db.rebuild_rollups()
+        assert stats.counts(['path'], 'all') == before
+        db.init_db(force_reload=True)
+    assert stats.count('all') == 0
+
+
+def test_staged_bulk_load_matches_direct_insert(tmp_path):
+    records = [
+        _record(f'2021-01-0{d}T1{h}:00:00', ip=f'1.1.1.{h}', ua=f'UA {d}')
+        for d in range(1, 4) for h in range(4)
+    ]
+    direct = str(tmp_path / 'direct.db')
+    with du.AccessLogDB(direct) as db:
+        db.init_db(force_reload=True)
+        assert db.insert_logs(records[:6]) == 6
+        assert db.insert_logs(records) == len(records) - 6
+
+    staged = str(tmp_path / 'staged.db')
+    checkpoint = du.Checkpoint('access.log.1', 10, 1, 'abc', 10, 10)
+    with du.AccessLogDB(staged) as db:
+        db.init_db(force_reload=True)
+        with db.bulk_load(staged=True):
+            assert db.insert_logs(records[:6], 'a') == 0
+            assert db.insert_logs(records, 'b') == 0
+            db.save_checkpoint(checkpoint)
+            assert db.get_checkpoint('access.log.1') is None
+            assert db.merge_staging() == {'a': 6, 'b': len(records) - 6}
+        assert db.get_checkpoint('access.log.1') == checkpoint
+
+    def dump(path):
+        with sqlite3.connect(path) as con:
+            indexes = con.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' ORDER BY name"
+            ).fetchall()
+            rows = con.execute('SELECT * FROM access_log ORDER BY id').fetchall()
+            rollup = con.execute('SELECT * FROM rollup_hour_path ORDER BY 1, 2, 3').fetchall()
+        return indexes, rows, rollup
+
+    assert dump(staged) == dump(direct)
+    with sqlite3.connect(staged) as con:
+        assert con.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_staged_bulk_load_rolls_back_on_error(tmp_path):
+    db_path = str(tmp_path / 'staged.db')
+    with du.AccessLogDB(db_path) as db:
+        db.init_db(force_reload=True)
+        with pytest.raises(RuntimeError):
+            with db.bulk_load(staged=True):
+                db.insert_logs([_record('2021-01-01T10:00:00')], 'a')
+                db.save_checkpoint(du.Checkpoint('a', 1, 1, 'x', 1, 1))
+                raise RuntimeError('parse error')
+        assert db.max_id() == 0
+        assert db.get_checkpoint('a') is None
+        assert db.insert_logs([_record('2021-01-01T10:00:00')]) == 1
+
+
+LEGACY_TABLE_SQL = """
+CREATE TABLE access_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, ip TEXT, method TEXT,
+    path TEXT, query TEXT, status INTEGER, size TEXT, referrer TEXT,
+    user_agent TEXT, is_bot BOOLEAN, is_admin_tech BOOLEAN, is_content BOOLEAN,
+    utm_source TEXT, utm_medium TEXT, utm_campaign TEXT,
+    UNIQUE(timestamp, ip, method, path, query, user_agent)
+)
+"""
+
+
+def test_dimension_tables_store_distinct_values(tmp_path, monkeypatch):
+    monkeypatch.setattr(du, 'DIM_CACHE_SIZE', 3)
+    db_path = str(tmp_path / 'dim.db')
+    records = [
+        _record(f'2021-01-01T10:00:0{i}', ip=f'1.1.1.{i % 2}', ua=f'UA {i % 3}')
+        for i in range(8)
+    ]
+    with du.AccessLogDB(db_path) as db:
+        db.init_db(force_reload=True)
+        assert db.insert_logs(records[:5]) == 5
+        assert db.insert_logs(records) == 3
+    with sqlite3.connect(db_path) as con:
+        assert con.execute('SELECT COUNT(*) FROM dim_user_agent').fetchone()[0] == 3
+        assert con.execute('SELECT COUNT(*) FROM dim_ip').fetchone()[0] == 2
+        rows = con.execute(
+            'SELECT timestamp, ip, method, path, query, status, size, referrer,'
+            ' user_agent, is_bot, is_admin_tech, is_content, utm_source,'
+            ' utm_medium, utm_campaign FROM access_log ORDER BY id'
+        ).fetchall()
+    assert rows == [
+        r[:6] + (int(r[6]),) + r[7:9] + (int(r[9]), int(r[10]), int(r[11])) + r[12:]
+        for r in records
+    ]
+
+
+def test_init_db_migrates_wide_table(tmp_path):
+    db_path = str(tmp_path / 'legacy.db')
+    with sqlite3.connect(db_path) as con:
+        con.execute(LEGACY_TABLE_SQL)
+        con.executemany(
+            'INSERT INTO access_log (timestamp, ip, method, path, query, status,'
+            ' size, referrer, user_agent, is_bot, is_admin_tech, is_content,'
+            ' utm_source, utm_medium, utm_campaign)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [_record('2021-01-04T10:00:00'), _record('2021-01-05T10:00:00', ua='Bot', bot=True)],
+        )
+        before = con.execute('SELECT * FROM access_log ORDER BY id').fetchall()
+    with du.AccessLogDB(db_path) as db:
+        db.init_db()
+        assert db.insert_logs([_record('2021-01-04T10:00:00')]) == 0
+        assert db.insert_logs([_record('2021-01-06T10:00:00')]) == 1
+    with sqlite3.connect(db_path) as con:
+        kinds = dict(con.execute('SELECT name, type FROM sqlite_master'))
+        after = con.execute('SELECT * FROM access_log ORDER BY id').fetchall()
+        version = con.execute('PRAGMA user_version').fetchone()[0]
+    assert kinds['access_log'] == 'view' and 'access_log_wide' not in kinds
+    assert version == du.AccessLogDB.SCHEMA_VERSION
+    assert [r[:7] + (str(r[7]),) + r[8:16] for r in after[:2]] == before
+    assert after[2][1] == '2021-01-06T10:00:00'
+    stats = du.AccessLogStats('2021-01-04', '2021-01-06', db_file=db_path)
+    assert stats.kpis()['bots'] == 1
+
+
+def test_init_db_rebuilds_older_dimension_schema(tmp_path):
+    db_path = make_stats_db(tmp_path)
+    with sqlite3.connect(db_path) as con:
+        before = con.execute('SELECT * FROM access_log ORDER BY id').fetchall()
+        con.execute('PRAGMA user_version = 1')
+    with du.AccessLogDB(db_path) as db:
+        db.init_db()
+    with sqlite3.connect(db_path) as con:
+        assert con.execute('SELECT * FROM access_log ORDER BY id').fetchall() == before
+        assert con.execute('PRAGMA user_version').fetchone()[0] == du.AccessLogDB.SCHEMA_VERSION
+
+
+def test_typed_columns(tmp_path):
+    db_path = str(tmp_path / 'typed.db')
+    record = _record('2021-01-04T10:00:05', ua='Googlebot', bot=True, path='/wp-admin/x')
+    record = record[:6] + ('-',) + record[7:]
+    with du.AccessLogDB(db_path) as db:
+        db.init_db(force_reload=True)
+        db.insert_logs([record])
+    with sqlite3.connect(db_path) as con:
+        row = con.execute('SELECT timestamp, size, flags FROM access_log_fact').fetchone()
+        view = con.execute(
+            'SELECT timestamp, is_bot, is_admin_tech, is_content FROM access_log'
+        ).fetchone()
+    assert row == (1609754405, None, du.AccessLogDB.FLAG_BOT | du.AccessLogDB.FLAG_ADMIN_TECH)
+    assert view == ('2021-01-04T10:00:05', 1, 1, 0)
+    assert du.epoch_seconds('2021-01-04T10:00:05') == 1609754405
+
+
+def test_fingerprint_dedup(tmp_path):
+    key = ('2021-01-04T10:00:00', '1.1.1.1', 'GET', '/blog', '', 'Mozilla')
+    assert du.fingerprint(*key) == du.fingerprint(*key)
+    assert du.fingerprint(*key) != du.fingerprint(*key[:4], 'a=1', key[5])
+    assert -2 ** 63 <= du.fingerprint(*key) < 2 ** 63
+    db_path = str(tmp_path / 'fp.db')
+    record = _record('2021-01-04T10:00:00')
+    with du.AccessLogDB(db_path) as db:
+        db.init_db(force_reload=True)
+        assert db.insert_logs([record]) == 1
+        # gleicher Schlüssel, andere Nicht-Schlüsselfelder: Duplikat
+        assert db.insert_logs([record[:5] + (404,) + record[6:]]) == 0
+        # vorberechneter Fingerabdruck aus dem Parser wird übernommen
+        assert db.insert_logs([_record('2021-01-05T10:00:00') + ('content', 42)]) == 1
+    with sqlite3.connect(db_path) as con:
+        assert con.execute('SELECT fingerprint FROM access_log_fact ORDER BY id').fetchall() == [
+            (du.fingerprint(*key),), (42,)
+        ]
+
+
+def test_migration_rebuilds_fingerprints(tmp_path):
+    db_path = make_stats_db(tmp_path)
+    with sqlite3.connect(db_path) as con:
+        for (table,) in con.execute(
+            "SELECT name FROM sqlite_master WHERE name GLOB 'access_log_fact_*'"
+        ).fetchall():
+            con.execute(f'UPDATE {table} SET fingerprint = -id')
+        con.execute('PRAGMA user_version = 2')
+    with du.AccessLogDB(db_path) as db:
+        db.init_db()
+        assert db.insert_logs([_record('2021-01-04T10:00:00', referrer='x')]) == 0
+    with sqlite3.connect(db_path) as con:
+        rows = con.execute(
+            'SELECT fingerprint, timestamp, ip, method, path, query, user_agent'
+            ' FROM access_log ORDER BY id'
+        ).fetchall()
+    assert len(rows) == 6
+    assert all(fp == du.fingerprint(*key) for fp, *key in rows)
+
+
+def test_segment_stored_and_partial_index_used(tmp_path):
+    db_path = make_stats_db(tmp_path)
+    with sqlite3.connect(db_path) as con:
+        segments = con.execute('SELECT segment FROM access_log ORDER BY id').fetchall()
+        stats = du.AccessLogStats('2021-01-04', '2021-01-05', db_file=db_path)
+        where, params = stats._where('content')
+        plan = con.execute(
+            f'EXPLAIN QUERY PLAN SELECT path, COUNT(*) FROM access_log WHERE {where}'
+            ' GROUP BY path', params
+        ).fetchall()
+    codes = du.AccessLogDB.SEGMENTS
+    assert [s for (s,) in segments] == [
+        codes['content'], codes['content'], codes['content'], codes['admin'],
+        codes['bot'], codes['other'],
+    ]
+    assert any('access_log_content_index' in row[-1] for row in plan)
+
+
+def test_refresh_referrers(tmp_path, monkeypatch):
+    import filters
+
+    db_path = make_stats_db(tmp_path)
+    stats = du.AccessLogStats('2021-01-04', '2021-01-05', db_file=db_path)
+    assert stats._source('referrers', ['referrer_host'])[0] == 'rollup_day_referrer_host'
+    monkeypatch.setattr(filters, 'IGNORED_REFERRERS', ['google.com'])
+    with du.AccessLogDB(db_path) as db:
+        assert db.refresh_referrers() == 2
+        assert db.refresh_referrers() == 0
+    assert stats.counts(['referrer_host'], 'referrers') == [
+        {'referrer_host': 'leichtgesagt.blog', 'hits': 1}
+    ]
+
+
+def test_update_ip_geo_once_per_ip(tmp_path):
+    db_path = make_stats_db(tmp_path)
+    looked_up = []
+
+    def lookup(ips):
+        looked_up.extend(ips)
+        return [('DE', 'Berlin', 3320, 'DTAG') for _ in ips]
+
+    # noch nicht aufgelöst bzw. ohne GeoIP-Datenbank: "?" und "-" wie bisher
+    assert du.AccessLogStats(db_file=db_path).counts(['country', 'city'], 'all') == [
+        {'country': '?', 'city': '-', 'hits': 6}
+    ]
+    with du.AccessLogDB(db_path) as db:
+        assert db.update_ip_geo(lookup, batch_size=1) == 2
+        assert db.update_ip_geo(lookup) == 0
+        db.insert_logs([_record('2021-01-06T08:00:00', ip='3.3.3.3')])
+        assert db.update_ip_geo(lookup) == 1
+        assert db.update_ip_geo(lookup, refresh=True) == 3
+    assert sorted(looked_up[:3]) == ['1.1.1.1', '2.2.2.2', '3.3.3.3']
+    stats = du.AccessLogStats('2021-01-04', '2021-01-06', db_file=db_path)
+    assert stats.counts(['country', 'city', 'asn'], 'content') == [
+        {'country': 'DE', 'city': 'Berlin', 'asn': 3320, 'hits': 4}
+    ]
+
+    # Datenbank mit Schema 6: nur die Spalten kommen hinzu
+    with sqlite3.connect(db_path) as con:
+        con.execute('DROP VIEW access_log')
+        con.execute('DROP INDEX dim_ip_geo_pending_index')
+        for column in du.AccessLogDB.IP_GEO_COLUMNS:
+            con.execute(f'ALTER TABLE dim_ip DROP COLUMN {column}')
+        con.execute('CREATE VIEW access_log AS SELECT 1')
+        con.execute('PRAGMA user_version = 6')
+    with du.AccessLogDB(db_path) as db:
+        db.init_db()
+        assert db.update_ip_geo(lookup) == 3
+    assert stats.count() == 6
+
+
+def test_monthly_partitions(tmp_path):
+    records = [
+        _record('2020-12-31T23:59:59'),
+        _record('2021-01-04T10:00:00'),
+        _record('2021-02-01T00:00:00', ip='2.2.2.2'),
+    ]
+    db_path = str(tmp_path / 'parts.db')
+    with du.AccessLogDB(db_path) as db:
+        db.init_db(force_reload=True)
+        assert db.insert_logs(records[1:]) == 2
+        with db.bulk_load(staged=True):
+            db.insert_logs(records, 'a')
+            assert db.merge_staging() == {'a': 1}
+        assert db.partitions() == ['2020-12', '2021-01', '2021-02']
+        assert db.max_id() == 3
+        with sqlite3.connect(db_path) as con:
+            assert con.execute(
+                'SELECT id, timestamp FROM access_log_fact_2021_02'
+            ).fetchall() == [(2, 1612137600)]
+
+        stats = du.AccessLogStats('2021-01-15', '2021-02-10', db_file=db_path)
+        relation = stats._relation()
+        assert 'access_log_fact_2021_01' in relation
+        assert 'access_log_fact_2021_02' in relation
+        assert 'access_log_fact_2020_12' not in relation
+        assert stats.count() == 1
+        assert du.AccessLogStats(db_file=db_path)._relation() == 'access_log'
+
+        archive = str(tmp_path / 'access_log_2020-12.db')
+        assert db.archive_partition('2020-12', archive) == 1
+        db.drop_partition('2021-01')
+        assert db.partitions() == ['2021-02']
+        assert du.AccessLogStats(db_file=db_path, use_rollups=False).count() == 1
+        assert du.AccessLogStats('2021-01-01', '2021-01-31', db_file=db_path).count() == 0
+        with pytest.raises(ValueError):
+            db.drop_partition('2021-1; DROP TABLE dim_ip')
+    with sqlite3.connect(archive) as con:
+        assert con.execute('SELECT timestamp, ip FROM access_log').fetchall() == [
+            ('2020-12-31T23:59:59', '1.1.1.1')
+        ]
+
+
+def test_duckdb_backend_uses_raw_data_and_dialect():
+    stats = du.AccessLogStats('2021-01-04', '2021-01-04', backend='duckdb')
+    assert not stats.use_rollups
+    assert stats._source('content', ['path'])[0] == 'access_log'
+    assert stats._key_sql('hour') == 'ts // 3600 % 24 AS hour'
+    assert du.AccessLogStats()._key_sql('hour') == 'ts / 3600 % 24 AS hour'
+
+
+def test_read_connections_pooled_read_only(tmp_path):
+    db_path = make_stats_db(tmp_path)
+    pool = du.ReadConnections(mmap_size=2**20, cache_kib=1024)
+    con = pool.get(db_path)
+    assert pool.get(db_path) is con
+    assert con.execute('PRAGMA query_only').fetchone()[0] == 1
+    assert con.execute('PRAGMA cache_size').fetchone()[0] == -1024
+    with pytest.raises(sqlite3.OperationalError):
+        con.execute('DELETE FROM dim_ip')
+
+    # ersetzte Datei: neue Verbindung
+    (tmp_path / 'new').mkdir()
+    os.replace(make_stats_db(tmp_path / 'new'), db_path)
+    assert pool.get(db_path) is not con
+    con = pool.get(db_path)
+
+    # Import im WAL-Modus bei offener Leseverbindung
+    with du.AccessLogDB(db_path) as db:
+        with db.bulk_load():
+            db.insert_logs([_record('2021-01-08T10:00:00')])
+            assert con.execute('SELECT COUNT(*) FROM access_log').fetchone()[0] == 7
+    assert pool.get(db_path) is con
+    pool.close()
+
+
+def test_read_connections_released_with_thread(tmp_path):
+    import gc
+    import threading
+
+    db_path = make_stats_db(tmp_path)
+    pool = du.ReadConnections()
+    pool.get(db_path)
+    for _ in range(20):
+        threads = [threading.Thread(target=pool.get, args=(db_path,)) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    gc.collect()
+    # nur die Verbindung des Test-Threads bleibt offen
+    assert len(pool._connections) == 1
+    pool.close()
@@ -1,7 +1,3 @@
-import sys
-import types
-import datetime
-
 import filters as f
 
 
@@ -62,19 +58,19 @@ def test_filter_referrers():
     assert result['referrer'] == ['https://google.com']
 
 
-def test_apply_date_filter(monkeypatch):
-    def to_datetime(val):
-        if isinstance(val, FakeSeries):
-            return FakeSeries([datetime.datetime.fromisoformat(v) for v in val])
-        return datetime.datetime.fromisoformat(val)
-    pd_stub = types.ModuleType('pandas')
-    pd_stub.to_datetime = to_datetime
-    pd_stub.Timedelta = datetime.timedelta
-    monkeypatch.setitem(sys.modules, 'pandas', pd_stub)
+def test_audience_segment():
+    assert f.audience_segment(True, False, 'GET', '/blog') == 'bot'
+    assert f.audience_segment(False, True, 'GET', '/wp-admin/x') == 'admin'
+    assert f.audience_segment(False, False, 'GET', '/blog') == 'content'
+    assert f.audience_segment(False, False, 'POST', '/blog') == 'other'
+    assert f.audience_segment(False, False, 'GET', '/robots.txt') == 'other'
 
-    df = FakeDataFrame({'timestamp': FakeSeries(['2021-01-01', '2021-01-05', '2021-01-10'])})
-    result = f.apply_date_filter(df, '2021-01-02', '2021-01-06')
-    assert result['timestamp'] == [datetime.datetime(2021, 1, 5)]
 
-    df_no_ts = FakeDataFrame({'other': FakeSeries([1])})
-    assert f.apply_date_filter(df_no_ts, '2021-01-01', '2021-01-02') is df_no_ts
+def test_referrer_host():
+    assert f.referrer_host('https://WWW.Google.com:443/search?q=1') == 'google.com'
+    assert f.referrer_host('-') is None
+    assert f.referrer_host('android-app://') is None
+    assert f.is_internal_referrer('leicht-gesagt.blog')
+    assert f.is_internal_referrer('m.leichtgesagt.blog')
+    assert not f.is_internal_referrer('google.com')
+    assert not f.is_internal_referrer(None)
@@ -17,7 +17,9 @@ def setup_geoip(monkeypatch):
             if ip == 'bad':
                 raise Exception('boom')
             return self.Response()
-    database_stub = types.SimpleNamespace(Reader=lambda path: FakeReader(path))
+    database_stub = types.SimpleNamespace(
+        MODE_MMAP=1, Reader=lambda path, mode=None: FakeReader(path)
+    )
     geoip2_stub = types.ModuleType('geoip2')
     geoip2_stub.database = database_stub
     monkeypatch.setitem(sys.modules, 'geoip2', geoip2_stub)
@@ -45,3 +47,26 @@ def test_geoip_lookup(monkeypatch):
 
     assert lookup1.country_city('bad') == ('?', '-')
     assert lookup1.reader.calls == ['1.1.1.1', 'bad']
+
+
+def test_lookup_many_with_asn(monkeypatch, tmp_path):
+    FakeReader = setup_geoip(monkeypatch)
+    FakeReader.asn = lambda self, ip: types.SimpleNamespace(
+        autonomous_system_number=64500, autonomous_system_organization='Example'
+    )
+    geo_utils = importlib.reload(importlib.import_module('geo_utils'))
+    geo_utils.GeoIPLookup._instance = None
+    asn_path = tmp_path / 'asn.mmdb'
+    asn_path.write_bytes(b'')
+
+    lookup = geo_utils.GeoIPLookup('city.mmdb', str(asn_path))
+    assert lookup.lookup_many(['1.1.1.1', 'bad']) == [
+        ('X', 'Y', 64500, 'Example'),
+        ('?', '-', 64500, 'Example'),
+    ]
+    assert lookup._cache == {}
+
+    geo_utils.GeoIPLookup._instance = None
+    lookup = geo_utils.GeoIPLookup('city.mmdb', str(tmp_path / 'missing.mmdb'))
+    assert lookup.lookup_many(['1.1.1.1']) == [('X', 'Y', None, None)]
+    geo_utils.GeoIPLookup._instance = None
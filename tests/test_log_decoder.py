@@ -0,0 +1,47 @@
+from datetime import datetime
+from urllib.parse import urlparse
+
+import pytest
+
+import log_decoder as ld
+
+
+@pytest.mark.parametrize("value", [
+    "01/Jan/2021:10:00:00 +0000",
+    "31/Dec/1999:23:59:59 -0500",
+    "29/Feb/2020:00:00:05",
+    "1/Jan/2021:10:00:00 +0000",
+    "01/jan/2021:10:00:00 +0000",
+])
+def test_parse_timestamp_matches_strptime(value):
+    expected = datetime.strptime(value.split()[0], ld.APACHE_TIME_FORMAT).isoformat()
+    assert ld.parse_timestamp(value) == expected
+
+
+@pytest.mark.parametrize("value", ["30/Feb/2021:10:00:00 +0000", "01/Jan/2021:10:00:60"])
+def test_parse_timestamp_invalid(value):
+    with pytest.raises(ValueError):
+        ld.parse_timestamp(value)
+
+
+@pytest.mark.parametrize("url", [
+    "/blog/post.html",
+    "/search?q=a&b=c",
+    "/a;b?x=1",
+    "/page#frag",
+    "//evil.com/path?x",
+    "http://example.com/path?x=1",
+    "*",
+    "/?",
+])
+def test_split_url_matches_urlparse(url):
+    parsed = urlparse(url)
+    assert ld.split_url(url) == (parsed.path, parsed.query)
+
+
+def test_extract_utm_is_cached():
+    ld.extract_utm.cache_clear()
+    url = "http://example.com/?utm_source=news"
+    assert ld.extract_utm(url) == ("news", None, None)
+    assert ld.extract_utm(url) == ("news", None, None)
+    assert ld.extract_utm.cache_info().hits == 1
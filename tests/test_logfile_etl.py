@@ -2,6 +2,7 @@ import tempfile
 from pathlib import Path
 
 import logfile_etl as le
+from tests.test_sftp_fetch import FakeSFTP
 
 
 def test_extract_utm():
@@ -40,4 +41,281 @@ def test_process_logfile(monkeypatch, tmp_path):
     assert rec2[9] is True
     assert rec2[10] is True
     assert rec2[11] is False
+    assert (rec1[15], rec2[15]) == ("content", "bot")
+    assert rec1[16] == le.fingerprint(
+        rec1[0], "127.0.0.1", "GET", "/blog/page.html", "", "Mozilla/5.0"
+    )
 
+
+
+def _write_log(path, count):
+    lines = [
+        f"10.0.0.{i % 7} - - [01/Jan/2021:10:{i % 60:02d}:00 +0000] \"GET /p{i}?a={i} HTTP/1.1\" 200 {i} example.com \"-\" \"UA {i}\" \"-\""
+        for i in range(count)
+    ]
+    lines.insert(3, "garbage line")
+    path.write_bytes("\r\n".join(lines).encode("utf-8"))
+
+
+def test_split_logfile_aligns_to_lines(tmp_path):
+    log_path = tmp_path / "access.log.1"
+    _write_log(log_path, 50)
+    chunks = le.split_logfile(str(log_path), chunk_size=500)
+    assert len(chunks) > 1
+    data = log_path.read_bytes()
+    assert chunks[0][1] == 0 and chunks[-1][2] == len(data)
+    for _, start, end in chunks[1:]:
+        assert data[start - 1:start] == b"\n"
+
+
+def test_parallel_parse_matches_sequential(tmp_path):
+    files = []
+    for n in (40, 25):
+        log_path = tmp_path / f"access.log.{n}"
+        _write_log(log_path, n)
+        files.append(str(log_path))
+    sequential = list(le.iter_batches(files, workers=1))
+    parallel = list(le.iter_batches(files, workers=2, batch_size=4, chunk_size=700))
+    assert len(parallel) > len(files)
+
+    def flatten(parts, name):
+        return [rec for f, recs in parts if f == name for rec in recs]
+
+    for name in files:
+        assert flatten(parallel, name) == flatten(sequential, name)
+    assert len(flatten(sequential, files[0])) == 40
+
+
+def test_iter_logfile_batches(tmp_path):
+    log_path = tmp_path / "access.log.1"
+    _write_log(log_path, 10)
+    batches = list(le.iter_logfile_batches(str(log_path), batch_size=4))
+    assert [len(b) for b in batches] == [4, 4, 2]
+    assert [r for b in batches for r in b] == le.process_logfile(str(log_path))
+
+
+def test_main_streams_into_db(monkeypatch, tmp_path):
+    import sqlite3
+    from dataclasses import replace
+    from db_utils import AccessLogStats
+
+    log_path = tmp_path / "access.log.1"
+    _write_log(log_path, 30)
+    db_file = str(tmp_path / "etl.db")
+    files = [le.LogFile(str(log_path), le.Checkpoint("access.log.1", 0, 0, "", 0, 0))]
+    monkeypatch.setattr(le, "sftp_download_logs", lambda config: files)
+    config = replace(le.CONFIG, db_file=db_file, force_reload=True, batch_size=7)
+    le.main(config)
+    with sqlite3.connect(db_file) as con:
+        assert con.execute("SELECT COUNT(*) FROM access_log").fetchone()[0] == 30
+    assert AccessLogStats(db_file=db_file).data_generation() == 1
+    le.main(config)
+    assert AccessLogStats(db_file=db_file).data_generation() == 2
+
+
+def test_main_resolves_geo_once_per_new_ip(monkeypatch, tmp_path):
+    import sqlite3
+    from dataclasses import replace
+
+    log_path = tmp_path / "access.log.1"
+    _write_log(log_path, 30)
+    geoip_db = tmp_path / "city.mmdb"
+    geoip_db.write_bytes(b"")
+    files = [le.LogFile(str(log_path), le.Checkpoint("access.log.1", 0, 0, "", 0, 0))]
+    monkeypatch.setattr(le, "sftp_download_logs", lambda config: files)
+    looked_up = []
+
+    class FakeLookup:
+        def __init__(self, path, asn_path):
+            assert path == str(geoip_db)
+
+        def lookup_many(self, ips):
+            looked_up.extend(ips)
+            return [("DE", "Berlin", None, None) for _ in ips]
+
+    monkeypatch.setattr(le, "GeoIPLookup", FakeLookup)
+    db_file = str(tmp_path / "etl.db")
+    config = replace(
+        le.CONFIG, db_file=db_file, force_reload=True, geoip_db=str(geoip_db)
+    )
+    le.main(config)
+    assert sorted(looked_up) == [f"10.0.0.{i}" for i in range(7)]
+    le.main(replace(config, force_reload=False))
+    assert len(looked_up) == 7
+    with sqlite3.connect(db_file) as con:
+        assert con.execute(
+            "SELECT country, COUNT(*) FROM access_log GROUP BY country"
+        ).fetchall() == [("DE", 30)]
+
+
+def test_batch_writer_propagates_errors(tmp_path):
+    import sqlite3
+    import pytest
+
+    writer = le.BatchWriter(str(tmp_path / "missing" / "x.db"), queue_size=1)
+    writer.start()
+    with pytest.raises(sqlite3.OperationalError):
+        try:
+            for _ in range(5):
+                writer.put("f", [["x"]])
+        finally:
+            writer.close()
+
+
+def test_batch_writer_propagates_merge_errors(monkeypatch, tmp_path):
+    import threading
+    import pytest
+    from db_utils import AccessLogDB
+
+    def fail(self):
+        raise RuntimeError("merge failed")
+
+    db_file = str(tmp_path / "etl.db")
+    with AccessLogDB(db_file) as db:
+        db.init_db(force_reload=True)
+    monkeypatch.setattr(AccessLogDB, "merge_staging", fail)
+    writer = le.BatchWriter(db_file, staged=True)
+    writer.start()
+    log_path = tmp_path / "access.log.1"
+    _write_log(log_path, 5)
+    writer.put("f", le.process_logfile(str(log_path)))
+    errors = []
+
+    def close():
+        with pytest.raises(RuntimeError, match="merge failed"):
+            writer.close()
+        errors.append(writer.error)
+
+    closer = threading.Thread(target=close, daemon=True)
+    closer.start()
+    closer.join(timeout=10)
+    assert not closer.is_alive(), "close() hängt nach Fehler in merge_staging"
+    assert len(errors) == 1
+
+
+def test_compressed_logs_are_streamed(tmp_path):
+    import bz2
+    import gzip
+
+    plain = tmp_path / "access.log.1"
+    _write_log(plain, 20)
+    expected = le.process_logfile(str(plain))
+    for suffix, opener in ((".gz", gzip.open), (".bz2", bz2.open)):
+        packed = tmp_path / f"access.log.2{suffix}"
+        with opener(packed, "wb") as f:
+            f.write(plain.read_bytes())
+        assert le.split_logfile(str(packed)) == [(str(packed), 0, None)]
+        assert le.process_logfile(str(packed)) == expected
+        records, total = le.parse_chunk((str(packed), 0, None))
+        assert records == expected and total == 21
+
+
+def test_parallel_parse_streams_compressed_logs(monkeypatch, tmp_path):
+    import gzip
+
+    streamed = []
+    iter_logfile_batches = le.iter_logfile_batches
+    monkeypatch.setattr(
+        le, "iter_logfile_batches",
+        lambda path, *args: streamed.append(path) or iter_logfile_batches(path, *args),
+    )
+    plain = tmp_path / "access.log.1"
+    _write_log(plain, 30)
+    packed = tmp_path / "access.log.2.gz"
+    with gzip.open(packed, "wb") as f:
+        f.write(plain.read_bytes())
+    batches = list(le.iter_batches([str(packed), str(plain)], workers=2, batch_size=4))
+    # die komprimierte Datei liest der Hauptprozess blockweise, nicht ein Worker
+    assert streamed == [str(packed)]
+    packed_batches = [b for f, b in batches if f == str(packed)]
+    assert max(len(b) for b in packed_batches) <= 4
+    assert [r for b in packed_batches for r in b] == le.process_logfile(str(packed))
+    assert [r for f, b in batches if f == str(plain) for r in b] == le.process_logfile(
+        str(plain)
+    )
+
+
+def install_fake_sftp(monkeypatch, root):
+    import types
+
+    class FakeTransport:
+        def __init__(self, addr):
+            pass
+
+        def connect(self, username, password):
+            pass
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(le.paramiko, "Transport", FakeTransport, raising=False)
+    monkeypatch.setattr(
+        le.paramiko, "SFTPClient",
+        types.SimpleNamespace(from_transport=lambda t: FakeSFTP(str(root))),
+        raising=False,
+    )
+
+
+def _line(i):
+    return (
+        f"10.0.0.1 - - [02/Jan/2021:10:00:{i:02d} +0000] \"GET /p{i} HTTP/1.1\" 200 1 "
+        f"example.com \"-\" \"UA\" \"-\"\n"
+    )
+
+
+def test_daily_checkpoints_parse_only_new_tail(monkeypatch, tmp_path):
+    import os
+    import sqlite3
+    from dataclasses import replace
+
+    remote = tmp_path / "remote"
+    remote.mkdir()
+    install_fake_sftp(monkeypatch, remote)
+    config = replace(
+        le.CONFIG, db_file=str(tmp_path / "etl.db"), local_dir=str(tmp_path / "local"),
+        mode="daily", force_reload=False,
+    )
+    current = remote / "access.log.current"
+    download = le.sftp_download_logs
+    fetched = []
+    monkeypatch.setattr(
+        le, "sftp_download_logs", lambda c: fetched.append(download(c)) or fetched[-1]
+    )
+
+    def ranges():
+        return [(os.path.basename(f.path), f.start, f.end) for f in fetched[-1]]
+
+    def count():
+        with sqlite3.connect(config.db_file) as con:
+            return con.execute("SELECT COUNT(*) FROM access_log").fetchone()[0]
+
+    content = "".join(_line(i) for i in range(40)) + _line(40)[:20]
+    current.write_text(content)
+    os.utime(current, (1000, 1000))
+    le.main(config)
+    assert count() == 40
+
+    current.write_text(content + _line(40)[20:] + _line(41))
+    os.utime(current, (2000, 2000))
+    le.main(config)
+    assert count() == 42
+    end = len(content) + len(_line(40)) - 20 + len(_line(41))
+    assert ranges() == [("access.log.current", end - len(_line(40)) - len(_line(41)), end)]
+
+    # Rotation: der bisherige current-Inhalt wandert nach access.log.1
+    with open(current, "a") as f:
+        f.write(_line(42))
+    os.rename(current, remote / "access.log.1")
+    os.utime(remote / "access.log.1", (3000, 3000))
+    current.write_text(_line(50))
+    os.utime(current, (3001, 3001))
+    le.main(config)
+    assert count() == 44
+    assert ranges() == [
+        ("access.log.1", end, end + len(_line(42))),
+        ("access.log.current", 0, len(_line(50))),
+    ]
+
+    le.main(config)
+    assert count() == 44
+    assert ranges() == []
@@ -0,0 +1,36 @@
+import pytest
+
+import db_utils as du
+import parquet_store
+from tests.test_db_utils import make_stats_db
+
+
+def test_duckdb_backend_matches_sqlite(tmp_path):
+    pytest.importorskip('pyarrow')
+    pytest.importorskip('duckdb')
+    db_path = make_stats_db(tmp_path)
+    out_dir = str(tmp_path / 'parquet')
+    days = parquet_store.changed_days(db_path, 0)
+    assert days == ['2021-01-04', '2021-01-05', '2021-01-07']
+    assert parquet_store.export_days(db_path, days, out_dir) == 6
+
+    for from_date, to_date in [(None, None), ('2021-01-04', '2021-01-05')]:
+        sqlite = du.AccessLogStats(from_date, to_date, db_file=db_path, use_rollups=False)
+        duck = du.AccessLogStats(from_date, to_date, backend='duckdb', parquet_dir=out_dir)
+        for run in (
+            lambda s: s.kpis(),
+            lambda s: s.distinct('ip', 'content'),
+            lambda s: s.counts(['hour'], 'content', order='key'),
+            lambda s: s.counts(['date', 'weekday'], 'all', order='key'),
+            lambda s: s.counts(['referrer_host'], 'referrers', limit=10),
+            lambda s: s.counts(['combo'], 'utm'),
+            lambda s: s.counts(['utm_medium', 'status'], 'all'),
+            lambda s: s.counts(['country', 'city'], 'content'),
+        ):
+            assert run(duck) == run(sqlite)
+
+
+def test_duckdb_empty_archive(tmp_path):
+    pytest.importorskip('duckdb')
+    stats = du.AccessLogStats(backend='duckdb', parquet_dir=str(tmp_path))
+    assert stats.kpis() == {'total': 0, 'real_users': 0, 'bots': 0, 'errors': 0}
@@ -0,0 +1,147 @@
+from datetime import date, timedelta
+
+import pytest
+
+import db_utils as du
+import resident_frame as rf
+from tests.test_db_utils import _record
+
+if not hasattr(rf.pd, 'Series'):
+    pytest.skip('pandas nicht installiert', allow_module_level=True)
+
+
+def _day(days_ago, time='10:00:00'):
+    return f'{(date.today() - timedelta(days=days_ago)).isoformat()}T{time}'
+
+
+def _import(db_path, records):
+    with du.AccessLogDB(db_path) as db:
+        db.insert_logs(records)
+        db.bump_generation()
+
+
+def make_recent_db(tmp_path):
+    db_path = str(tmp_path / 'recent.db')
+    with du.AccessLogDB(db_path) as db:
+        db.init_db(force_reload=True)
+    _import(db_path, [
+        _record(_day(20), path='/old'),
+        _record(_day(3), referrer='https://google.com/?q=1'),
+        _record(_day(3, '10:05:00'), ip='2.2.2.2', referrer='https://leichtgesagt.blog/x'),
+        _record(_day(2, '11:00:00'), ip='2.2.2.2', path='/other',
+                utm=('news', None, None)),
+        _record(_day(2, '11:30:00'), ip='3.3.3.3', path='/other',
+                utm=('news', 'mail', 'spring')),
+        _record(_day(2, '12:00:00'), path='/wp-login.php', status=404),
+        _record(_day(1, '12:30:00'), ua='Googlebot', bot=True, status=500),
+        _record(_day(1, '09:00:00'), method='POST', path='/blog/a'),
+    ])
+    return db_path
+
+
+QUERIES = [
+    lambda s: s.kpis(),
+    lambda s: s.count('content'),
+    lambda s: s.distinct('ip', 'content'),
+    lambda s: s.distinct('user_agent', 'bots'),
+    lambda s: s.counts(['path'], 'content'),
+    lambda s: s.counts(['path'], 'content', limit=2),
+    lambda s: s.counts(['path'], 'content', order='key'),
+    lambda s: s.counts(['hour'], 'content', order='key'),
+    lambda s: s.counts(['date', 'weekday'], 'all', order='key'),
+    lambda s: s.counts(['date'], 'bots', order='key'),
+    lambda s: s.counts(['referrer_host'], 'referrers', limit=10),
+    lambda s: s.counts(['combo'], 'utm'),
+    lambda s: s.counts(['utm_medium'], 'utm'),
+    lambda s: s.counts(['utm_medium'], 'utm', skip_null=True),
+    lambda s: s.counts(['utm_source', 'utm_campaign'], 'all', order='key'),
+    lambda s: s.counts(['status', 'path'], 'errors', limit=20),
+    # nicht im Frame gehalten: Rückfall auf SQL
+    lambda s: s.counts(['country', 'city'], 'content', limit=10),
+]
+
+
+def assert_matches_sqlite(stats, db_path):
+    sqlite = du.AccessLogStats(
+        stats.from_date, stats.to_date, db_file=db_path, use_rollups=False
+    )
+    for run in QUERIES:
+        assert run(stats) == run(sqlite)
+
+
+def test_frame_stats_match_sqlite(tmp_path):
+    db_path = make_recent_db(tmp_path)
+    frame = rf.ResidentFrame(7, db_file=db_path)
+    for from_date, to_date in [
+        (_day(7)[:10], None),
+        (_day(3)[:10], _day(2)[:10]),
+        (_day(1)[:10], _day(1)[:10]),
+    ]:
+        stats = frame.stats(from_date, to_date)
+        assert isinstance(stats, rf.FrameStats)
+        assert_matches_sqlite(stats, db_path)
+    assert len(frame.df) == 7
+
+
+def test_stats_outside_window(tmp_path):
+    db_path = make_recent_db(tmp_path)
+    frame = rf.ResidentFrame(7, db_file=db_path)
+    assert frame.stats(_day(20)[:10], None) is None
+    assert frame.stats(None, None) is None
+    assert frame.stats(_day(7)[:10], None) is not None
+
+
+def test_new_rows_are_appended(tmp_path, monkeypatch):
+    db_path = make_recent_db(tmp_path)
+    frame = rf.ResidentFrame(7, db_file=db_path)
+    loads = []
+    load = frame._load
+    monkeypatch.setattr(
+        frame, '_load', lambda since_id, start: loads.append(since_id) or load(since_id, start)
+    )
+    from_date = _day(7)[:10]
+    frame.stats(from_date, None)
+    assert loads == [0]
+    last_seen = frame.last_seen_id
+
+    # ohne Import (gleiche Generation) wird nichts nachgeladen
+    frame.stats(from_date, None)
+    assert loads == [0]
+
+    _import(db_path, [
+        _record(_day(0, '08:00:00'), ip='4.4.4.4', path='/neu'),
+        _record(_day(0, '08:10:00'), ip='4.4.4.4', path='/neu',
+                utm=('news', 'mail', None)),
+    ])
+    stats = frame.stats(from_date, None)
+    assert loads == [0, last_seen]
+    assert frame.last_seen_id > last_seen
+    assert len(frame.df) == 9
+    assert '/neu' in frame.df['path'].cat.categories
+    assert_matches_sqlite(stats, db_path)
+
+
+def test_moving_window_reloads(tmp_path, monkeypatch):
+    db_path = make_recent_db(tmp_path)
+    frame = rf.ResidentFrame(2, db_file=db_path)
+    frame.stats(_day(2)[:10], None)
+    assert len(frame.df) == 5
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return date.today() + timedelta(days=1)
+
+    loads = []
+    load = frame._load
+    monkeypatch.setattr(
+        frame, '_load', lambda since_id, start: loads.append(since_id) or load(since_id, start)
+    )
+    monkeypatch.setattr(rf, 'date', Tomorrow)
+    _import(db_path, [_record(_day(0, '08:00:00'), path='/neu')])
+    stats = frame.stats(_day(1)[:10], None)
+    assert loads == [0]
+    assert frame.window_start == _day(1, '00:00:00')
+    assert len(frame.df) == 3
+    assert frame.stats(_day(2)[:10], None) is None
+    assert_matches_sqlite(stats, db_path)
@@ -0,0 +1,34 @@
+from result_cache import ResultCache
+
+
+def test_lru_eviction_with_budget():
+    cache = ResultCache(max_bytes=400)
+    for key in 'abc':
+        assert cache.get_or_compute(key, 0, lambda: key * 100) == key * 100
+    assert cache.get_or_compute('a', 0, lambda: 'x') == 'a' * 100
+    cache.get_or_compute('d', 0, lambda: 'd' * 100)
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 4
+    assert stats['evictions'] == 1 and stats['bytes'] <= 400
+    # 'b' war am längsten unbenutzt
+    assert cache.get_or_compute('b', 0, lambda: 'new') == 'new'
+    assert cache.get_or_compute('a', 0, lambda: 'x') == 'a' * 100
+
+
+def test_generation_invalidates():
+    cache = ResultCache()
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+    assert cache.get_or_compute('k', 1, compute) == 1
+    assert cache.get_or_compute('k', 1, compute) == 1
+    assert cache.get_or_compute('k', 2, compute) == 2
+    # verspätete Anfrage mit alter Generation verdrängt nichts
+    assert cache.get_or_compute('k', 1, compute) == 2
+    assert cache.stats()['invalidations'] == 1
+    assert cache.stats()['generation'] == 2
+
+
+def test_oversized_value_not_stored():
+    cache = ResultCache(max_bytes=10)
+    cache.get_or_compute('k', 0, lambda: 'x' * 100)
+    assert cache.stats()['entries'] == 0
@@ -0,0 +1,94 @@
+import os
+import types
+
+from sftp_fetch import MANIFEST_FILE, PART_SUFFIX, FetchManifest, SFTPFetcher
+
+
+class FakeSFTP:
+    """SFTP-Client-Ersatz, der ein lokales Verzeichnis bereitstellt."""
+
+    def __init__(self, root, opened=None):
+        self.root = root
+        self.opened = opened if opened is not None else []
+
+    def listdir_attr(self, path):
+        return [
+            types.SimpleNamespace(
+                filename=name,
+                st_size=os.path.getsize(os.path.join(self.root, name)),
+                st_mtime=int(os.path.getmtime(os.path.join(self.root, name))),
+            )
+            for name in sorted(os.listdir(self.root))
+        ]
+
+    def open(self, name, mode="rb"):
+        self.opened.append(name)
+        return open(f"{self.root}/{name}", mode)
+
+    def close(self):
+        pass
+
+
+def _fetcher(remote, local, opened=None, workers=2):
+    return SFTPFetcher(lambda: FakeSFTP(str(remote), opened), str(local), workers)
+
+
+def test_fetch_skips_unchanged_files(tmp_path):
+    remote = tmp_path / "remote"
+    remote.mkdir()
+    for i in range(5):
+        (remote / f"access.log.{i}").write_bytes(b"x" * (100 + i))
+    opened = []
+    with _fetcher(remote, tmp_path / "local", opened, workers=3) as fetcher:
+        attrs = fetcher.listdir_attr()
+        paths = fetcher.fetch(attrs)
+    assert [os.path.basename(p) for p in paths] == [a.filename for a in attrs]
+    for a, p in zip(attrs, paths):
+        assert os.path.getsize(p) == a.st_size
+    assert sorted(opened) == [a.filename for a in attrs]
+
+    opened.clear()
+    with _fetcher(remote, tmp_path / "local", opened) as fetcher:
+        fetcher.fetch(fetcher.listdir_attr())
+    assert opened == []
+
+
+def test_fetch_resumes_partial_and_grown_files(tmp_path):
+    remote, local = tmp_path / "remote", tmp_path / "local"
+    remote.mkdir()
+    local.mkdir()
+    data = bytes(range(256)) * 20
+    (remote / "a.log").write_bytes(data)
+    (local / ("a.log" + PART_SUFFIX)).write_bytes(data[:1500])
+    with _fetcher(remote, local) as fetcher:
+        fetcher.fetch(fetcher.listdir_attr())
+    assert (local / "a.log").read_bytes() == data
+    assert not (local / ("a.log" + PART_SUFFIX)).exists()
+
+    (remote / "a.log").write_bytes(data + b"tail")
+    os.utime(remote / "a.log", (5000, 5000))
+    with _fetcher(remote, local) as fetcher:
+        fetcher.fetch(fetcher.listdir_attr())
+    assert (local / "a.log").read_bytes() == data + b"tail"
+    assert FetchManifest(str(local / MANIFEST_FILE)).is_current(
+        "a.log", len(data) + 4, 5000
+    )
+
+    # Anderer Anfang (z. B. nach einer Rotation): komplett neu laden
+    (remote / "a.log").write_bytes(b"new" + data)
+    with _fetcher(remote, local) as fetcher:
+        fetcher.fetch(fetcher.listdir_attr())
+    assert (local / "a.log").read_bytes() == b"new" + data
+
+
+def test_prune_removes_vanished_files(tmp_path):
+    remote, local = tmp_path / "remote", tmp_path / "local"
+    remote.mkdir()
+    (remote / "a.log").write_bytes(b"a")
+    (remote / "b.log").write_bytes(b"b")
+    with _fetcher(remote, local) as fetcher:
+        fetcher.fetch(fetcher.listdir_attr())
+        fetcher.prune(["b.log"])
+    assert not (local / "a.log").exists()
+    assert (local / "b.log").exists()
+    assert list(FetchManifest(str(local / MANIFEST_FILE)).entries) == ["b.log"]
@@ -0,0 +1,26 @@
+import json
+
+import visualization
+
+
+def test_chart_fragment_is_json_spec():
+    html = visualization.to_plotly_figure(
+        [1, 2], [3, 4], "Stunde", "Zugriffe", "</script>", "line"
+    )
+    assert html.count("</script>") == 1
+    payload = html.split('application/json">', 1)[1].rsplit("</script>", 1)[0]
+    spec = json.loads(payload)
+    assert spec["data"] == [
+        {"type": "scatter", "x": [1, 2], "y": [3, 4], "mode": "lines+markers"}
+    ]
+    assert spec["layout"]["title"] == {"text": "</script>"}
+    assert spec["layout"]["xaxis"]["title"] == {"text": "Stunde"}
+
+
+def test_chart_fragments_are_cached_by_data():
+    visualization._chart_fragment.cache_clear()
+    first = visualization.to_plotly_figure(["a"], [1], "x", "y", "t", "pie")
+    again = visualization.to_plotly_figure(("a",), (1,), "x", "y", "t", "pie")
+    assert again is first
+    assert visualization._chart_fragment.cache_info().hits == 1
+    assert '"labels":["a"]' in first
@@ -2,6 +2,8 @@ import os
 from datetime import datetime, timedelta, date
 from flask import request, render_template, url_for
 
+from visualization import plotly_bundle
+
 
 def load_env(path: str = ".env") -> None:
     """Load key=value pairs from a .env file into ``os.environ``."""
@@ -40,6 +42,10 @@ def render_dashboard(template, tab, params, filter_from, filter_to, **kwargs):
     lastmonth_url = url_for_tab_with_preset(tab, params, "lastmonth")
     last30days_url = url_for_tab_with_preset(tab, params, "last30days")
 
+    # JSON-API aller Widgets des Tabs: nur der Zeitraum geht in die URL,
+    # andere Parameter könnten ``tab`` oder Optionen von ``url_for`` überdecken
+    query = {k: params[k] for k in DATE_PARAMS if params.get(k)}
+
     return render_template(
         template,
         tab=tab,
@@ -57,6 +63,8 @@ def render_dashboard(template, tab, params, filter_from, filter_to, **kwargs):
         last30days_url=last30days_url,
         filter_from=filter_from,
         filter_to=filter_to,
+        plotly_js_url=url_for("plotly_js", version=plotly_bundle()[1]),
+        tab_api_url=url_for("tab_api", tab=tab, **query),
         **kwargs
     )
 
@@ -93,6 +101,10 @@ def parse_date_shortcut(preset):
     return None, None
 
 
+# Query-Parameter, aus denen ``get_date_params`` den Zeitraum bestimmt
+DATE_PARAMS = ("from", "to", "preset")
+
+
 def get_date_params():
     from_date = request.args.get("from")
     to_date = request.args.get("to")
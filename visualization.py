@@ -1,26 +1,83 @@
-import plotly.graph_objs as go
-import plotly.io as pio
+import hashlib
+import json
+from functools import lru_cache
+from typing import Dict, Tuple
+
+# Achsen und Farben wie das Plotly-Template "simple_white"; direkt als
+# Layout angegeben, damit der Browser kein Template nachladen muss.
+AXIS = {
+    "showgrid": False,
+    "showline": True,
+    "linecolor": "rgb(36,36,36)",
+    "ticks": "outside",
+    "zeroline": False,
+    "automargin": True,
+}
+LAYOUT = {
+    "margin": {"l": 20, "r": 20, "t": 40, "b": 20},
+    "font": {"color": "rgb(36,36,36)"},
+    "paper_bgcolor": "white",
+    "plot_bgcolor": "white",
+    "colorway": [
+        "#1F77B4", "#FF7F0E", "#2CA02C", "#D62728", "#9467BD",
+        "#8C564B", "#E377C2", "#7F7F7F", "#BCBD22", "#17BECF",
+    ],
+}
+
+
+def figure_spec(x, y, xlabel, ylabel, title, kind="bar") -> Dict:
+    """Plotly-Figur als JSON-fähiges Dict (``data`` und ``layout``)."""
+    x, y = list(x), list(y)
+    if kind == "pie":
+        trace = {"type": "pie", "labels": x, "values": y}
+    elif kind == "line":
+        trace = {"type": "scatter", "x": x, "y": y, "mode": "lines+markers"}
+    else:
+        trace = {"type": "bar", "x": x, "y": y}
+    layout = {
+        **LAYOUT,
+        "title": {"text": title},
+        "xaxis": {**AXIS, "title": {"text": xlabel}},
+        "yaxis": {**AXIS, "title": {"text": ylabel}},
+    }
+    return {"data": [trace], "layout": layout}
 
 
 def to_plotly_figure(x, y, xlabel, ylabel, title, kind="bar"):
     """
     Erzeugt ein Plotly-Chart (als HTML-Snippet) für das Dashboard.
     kind: 'bar', 'line' oder 'pie'
+
+    Das Snippet enthält nur die Figur als JSON; plotly.js wird einmal pro
+    Seite über ``plotly_bundle`` eingebunden (siehe ``base.html``).
+    Gleiche Daten liefern dasselbe, zwischengespeicherte Snippet.
     """
-    fig = go.Figure()
-    if kind == "bar":
-        fig.add_trace(go.Bar(x=x, y=y))
-    elif kind == "line":
-        fig.add_trace(go.Scatter(x=x, y=y, mode="lines+markers"))
-    elif kind == "pie":
-        fig = go.Figure(go.Pie(labels=x, values=y))
-    else:
-        fig.add_trace(go.Bar(x=x, y=y))
-    fig.update_layout(
-        margin=dict(l=20, r=20, t=40, b=20),
-        xaxis_title=xlabel,
-        yaxis_title=ylabel,
-        title=title,
-        template="simple_white",
+    return _chart_fragment(tuple(x), tuple(y), xlabel, ylabel, title, kind)
+
+
+@lru_cache(maxsize=256)
+def _chart_fragment(x, y, xlabel, ylabel, title, kind) -> str:
+    payload = json.dumps(
+        figure_spec(x, y, xlabel, ylabel, title, kind),
+        ensure_ascii=False,
+        separators=(",", ":"),
     )
-    return pio.to_html(fig, full_html=False)
+    # "</script>" in Daten (z. B. Pfaden) darf das Skript nicht beenden
+    payload = payload.replace("</", "<\\/")
+    return (
+        '<div class="plotly-chart">'
+        f'<script type="application/json">{payload}</script></div>'
+    )
+
+
+@lru_cache(maxsize=1)
+def plotly_bundle() -> Tuple[bytes, str]:
+    """plotly.js aus dem installierten Paket und eine kurze Prüfsumme.
+
+    Die Prüfsumme steht in der URL der Datei, sodass Browser sie dauerhaft
+    zwischenspeichern können und nach einem Update neu laden.
+    """
+    from plotly.offline import get_plotlyjs
+
+    body = get_plotlyjs().encode("utf-8")
+    return body, hashlib.sha256(body).hexdigest()[:12]